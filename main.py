@@ -1,14 +1,195 @@
 import os
+import sys
 import json
+import base64
+import bisect
 import hashlib
-from datetime import datetime
+import hmac
+import secrets
+import heapq
+import itertools
+import sqlite3
+import time
+import asyncio
+import argparse
+import atexit
+import cProfile
+import csv
+import functools
+import pstats
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, parse_qs
 import math
+import mmap
+import platform
+import random
+import shutil
+import struct
+import tempfile
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
 # Global variables
-history_stack = [] 
-current_user = None
+current_session = None  # session token of whoever is logged in at this terminal
 screen_router = {}
 
+# Storage settings
+STORAGE_BACKEND = os.environ.get("MOVIE_STORAGE_BACKEND", "json")  # "json" or "sqlite"
+STORAGE_MODE = os.environ.get("MOVIE_STORAGE_MODE", "snapshot")  # "snapshot" or "journal" (json backend)
+STORAGE_LAYOUT = os.environ.get("MOVIE_STORAGE_LAYOUT", "single")  # "single", "sharded" or "binary" (json backend)
+JOURNAL_COMPACT_BYTES = 1024 * 1024  # compact once the journal grows past this
+COMMIT_MARKER = "commit.pending"
+ARCHIVE_AFTER_HOURS = 24  # move showtimes this long past their start out of showtimes.json
+HOLD_TTL_SECONDS = int(os.environ.get("MOVIE_HOLD_TTL", "120"))  # how long picked seats stay held
+HALL_CLEANUP_MINUTES = int(os.environ.get("MOVIE_HALL_CLEANUP", "15"))  # default turnaround between shows
+
+# Zero-padded, so showtime strings sort in chronological order
+SHOWTIME_FORMAT = "%Y-%m-%d %H:%M"
+
+# ------------------ Metrics ------------------
+
+METRICS_ENABLED = os.environ.get("MOVIE_METRICS", "0") not in ("", "0")
+METRICS_FILE = os.environ.get("MOVIE_METRICS_FILE", os.path.join("data", "metrics.prom"))
+METRICS_INTERVAL = float(os.environ.get("MOVIE_METRICS_INTERVAL", "60"))  # seconds between dumps
+
+
+class Metrics:
+    """
+    Process-wide counters, gauges and timers, exported in the Prometheus
+    text format. Off unless MOVIE_METRICS=1: every instrumented call then
+    costs a single attribute check and nothing is recorded.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters = {}  # (name, labels) -> value
+        self._gauges = {}  # (name, labels) -> value
+        self._timers = {}  # (name, labels) -> [count, total seconds, max seconds]
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            timer = self._timers.setdefault(key, [0, 0.0, 0.0])
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+
+    def timed(self, name):
+        """Decorator recording each call's duration under name while metrics are on."""
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - start)
+            return wrapper
+        return decorate
+
+    def file_io(self, direction, file_path, size, seconds=None, file_size=None):
+        """
+        Count bytes read or written for one data file and remember its size.
+        Appends and tail reads pass the whole file's size as file_size. The
+        per-showtime shards share one "shard" series and have no size gauge.
+        """
+        file_name = os.path.basename(file_path)
+        shard = os.path.basename(os.path.dirname(file_path)) == "showtimes" and file_name != "catalogue.json"
+        if shard:
+            file_name = "shard"
+        self.inc(f"movie_file_{direction}_bytes_total", size, file=file_name)
+        if not shard:
+            self.set("movie_file_size_bytes", size if file_size is None else file_size, file=file_name)
+        if seconds is not None:
+            self.observe(f"movie_file_{direction}_seconds", seconds, file=file_name)
+
+    def render(self):
+        def series(name, labels, value):
+            if labels:
+                escaped = ",".join('{}="{}"'.format(key, str(val).replace("\\", "\\\\").replace('"', '\\"')
+                                                    .replace("\n", "\\n")) for key, val in labels)
+                return f"{name}{{{escaped}}} {value}"
+            return f"{name} {value}"
+
+        lines = []
+        with self._lock:
+            for kind, table in (("counter", self._counters), ("gauge", self._gauges)):
+                for name in sorted({name for name, _ in table}):
+                    lines.append(f"# TYPE {name} {kind}")
+                    lines.extend(series(name, labels, value)
+                                 for (metric, labels), value in sorted(table.items()) if metric == name)
+            for name in sorted({name for name, _ in self._timers}):
+                lines.append(f"# TYPE {name} summary")
+                for (metric, labels), (count, total, longest) in sorted(self._timers.items()):
+                    if metric == name:
+                        lines.append(series(f"{name}_count", labels, count))
+                        lines.append(series(f"{name}_sum", labels, round(total, 6)))
+                        lines.append(series(f"{name}_max", labels, round(longest, 6)))
+        return "\n".join(lines) + "\n"
+
+    def dump(self, file_path):
+        """Write render() to file_path atomically."""
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        # Not ".tmp": recover_commit() sweeps those out of the data directory.
+        part_path = file_path + ".part"
+        with open(part_path, 'w', encoding='utf-8') as file:
+            file.write(self.render())
+        os.replace(part_path, file_path)
+
+    def start_dumper(self, file_path, interval):
+        """Dump every interval seconds from a daemon thread, and once more at exit."""
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.dump(file_path)
+                except OSError as e:
+                    print(f"⚠️ Could not write metrics to {file_path}: {e}", file=sys.stderr)
+
+        threading.Thread(target=loop, name="metrics", daemon=True).start()
+        atexit.register(self.dump, file_path)
+
+
+metrics = Metrics(METRICS_ENABLED)
+
+
+@contextmanager
+def profiled(output_path):
+    """Run the block under cProfile, save the stats to output_path and print the top entries."""
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield profile
+    finally:
+        profile.disable()
+        profile.dump_stats(output_path)
+        print(f"\n📈 Profile saved to {output_path}; top functions by cumulative time:")
+        pstats.Stats(profile).sort_stats("cumulative").print_stats(15)
+
 # ------------------ Data Helpers ------------------
 
 
@@ -17,27 +198,3523 @@ def load_data(file_path):
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
         with open(file_path, 'w', encoding='utf-8') as file:
             json.dump([], file) 
+    start = time.perf_counter() if metrics.enabled else None
     with open(file_path, 'r', encoding='utf-8') as file:
-        return json.load(file)
+        data = json.load(file)
+        if start is not None:
+            metrics.file_io("read", file_path, os.fstat(file.fileno()).st_size, time.perf_counter() - start)
+        return data
 
+@metrics.timed("movie_save_data_seconds")
 def save_data(file_path, data):
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
-    with open(file_path, 'w', encoding='utf-8') as file:
-        json.dump(data, file, indent=4)
+    temp_path = _write_temp(file_path, json.dumps(data, indent=4, default=encode_record))
+    os.replace(temp_path, file_path)
+    _fsync_dir(os.path.dirname(file_path))
+
+@metrics.timed("movie_commit_files_seconds")
+def commit_files(data_dir, contents):
+    """
+    Replace several files under data_dir as one unit.
+    contents maps each file path to its new text or bytes. Every new version is
+    written to a temp file and fsynced, then a commit marker naming them is
+    made durable, and only then are the temp files renamed into place.
+    recover_commit() finishes or discards a commit interrupted by a crash.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    for file_path, text in contents.items():
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        _write_temp(file_path, text)
+    marker = os.path.join(data_dir, COMMIT_MARKER)
+    names = sorted(os.path.relpath(file_path, data_dir) for file_path in contents)
+    os.replace(_write_temp(marker, json.dumps(names)), marker)
+    _fsync_dir(data_dir)
+
+    for file_path in contents:
+        os.replace(file_path + ".tmp", file_path)
+    _fsync_dir(data_dir)
+    os.remove(marker)
+    _fsync_dir(data_dir)
+
+def recover_commit(data_dir):
+    """Roll an interrupted commit forward and drop temp files that never committed."""
+    if not os.path.isdir(data_dir):
+        return
+    marker = os.path.join(data_dir, COMMIT_MARKER)
+    if os.path.exists(marker):
+        with open(marker, 'r', encoding='utf-8') as file:
+            names = json.load(file)
+        for name in names:
+            file_path = os.path.join(data_dir, name)
+            if os.path.exists(file_path + ".tmp"):
+                os.replace(file_path + ".tmp", file_path)
+        _fsync_dir(data_dir)
+        os.remove(marker)
+        _fsync_dir(data_dir)
+
+    # Temp files without a marker belong to a commit that never reached its commit point.
+    for root, _dirs, files in os.walk(data_dir):
+        for name in files:
+            if name.endswith(".tmp"):
+                os.remove(os.path.join(root, name))
+
+def _write_temp(file_path, text, suffix=".tmp"):
+    """Write text (or bytes) to file_path + suffix and flush it to disk."""
+    temp_path = file_path + suffix
+    binary = isinstance(text, bytes)
+    with open(temp_path, 'wb' if binary else 'w', encoding=None if binary else 'utf-8') as file:
+        file.write(text)
+        file.flush()
+        os.fsync(file.fileno())
+        if metrics.enabled:
+            metrics.file_io("written", file_path, os.fstat(file.fileno()).st_size)
+    return temp_path
+
+def _fsync_dir(dir_path):
+    # Directory entries (renames) need their own fsync on POSIX.
+    if os.name == 'nt':
+        return
+    fd = os.open(dir_path or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+# ------------------ Seat Maps ------------------
+
+
+class SeatMap:
+    """
+    Compact seat map for one showtime.
+    Availability is one bit per seat in a bytearray, the row layout is kept
+    once as (total seats, seats per row) and only taken seats have an entry
+    in the sparse owners table. Seat labels follow the A1, A2, ..., B1 scheme
+    and are derived from the layout rather than stored.
+    """
+
+    def __init__(self, total_seats, seats_per_row=10):
+        self.total = total_seats
+        self.per_row = seats_per_row
+        self.free = bytearray(b"\xff" * ((total_seats + 7) // 8))
+        self.owners = {}  # seat index -> username
+        self._longest = None  # row -> longest free run, built on demand
+        self._clear_padding()
+
+    @classmethod
+    def from_json(cls, data, total_seats=None):
+        """Build a seat map from its serialised form or a legacy label -> status dict."""
+        if isinstance(data, cls):
+            return data
+        if "layout" in data:
+            total, per_row = data["layout"]
+            seat_map = cls(total, per_row)
+            seat_map.free[:] = base64.b64decode(data["free"])
+            seat_map._longest = None
+            for label, owner in data.get("owners", {}).items():
+                seat_map.owners[seat_map.index(label)] = owner
+            return seat_map
+
+        # Legacy {"A1": "available", "A2": "bob", ...} maps from before SeatMap.
+        seat_map = cls(total_seats if total_seats is not None else len(data))
+        for label, status in data.items():
+            idx = seat_map.index(label)
+            if idx is not None and status != "available":
+                seat_map._take(idx, status)
+        return seat_map
+
+    def to_json(self):
+        return {
+            "layout": [self.total, self.per_row],
+            "free": base64.b64encode(bytes(self.free)).decode('ascii'),
+            "owners": {self.label(idx): owner for idx, owner in sorted(self.owners.items())}
+        }
+
+    def __len__(self):
+        return self.total
+
+    def copy(self):
+        seat_map = SeatMap(self.total, self.per_row)
+        seat_map.free[:] = self.free
+        seat_map.owners = dict(self.owners)
+        return seat_map
+
+    # ---- Labels ----
+
+    def label(self, idx):
+        return f"{chr(65 + idx // self.per_row)}{idx % self.per_row + 1}"
+
+    def index(self, label):
+        """Seat index for a label such as 'B7', or None if it is not in this hall."""
+        if not isinstance(label, str) or len(label) < 2 or not label[1:].isdigit():
+            return None
+        row = ord(label[0]) - 65
+        col = int(label[1:]) - 1
+        if row < 0 or not 0 <= col < self.per_row:
+            return None
+        idx = row * self.per_row + col
+        return idx if idx < self.total else None
+
+    # ---- Seats ----
+
+    def is_available(self, label):
+        idx = self.index(label)
+        return idx is not None and self._is_free(idx)
+
+    def owner(self, label):
+        idx = self.index(label)
+        return self.owners.get(idx) if idx is not None else None
+
+    def assign(self, label, username):
+        idx = self.index(label)
+        if idx is None or not self._is_free(idx):
+            raise ValueError(f"Seat {label} is not available")
+        self._take(idx, username)
+
+    def release(self, label):
+        idx = self.index(label)
+        if idx is None or self._is_free(idx):
+            return False
+        self.free[idx >> 3] |= 1 << (idx & 7)
+        self.owners.pop(idx, None)
+        self._update_row(idx)
+        return True
+
+    def available_count(self):
+        return bin(int.from_bytes(self.free, 'little')).count('1')
+
+    def available_labels(self):
+        labels = []
+        for byte_idx, byte in enumerate(self.free):
+            if not byte:
+                continue
+            for bit in range(8):
+                if byte >> bit & 1:
+                    labels.append(self.label(byte_idx * 8 + bit))
+        return labels
+
+    def resize(self, total_seats):
+        """Grow with available seats or drop the seats past the new total."""
+        if total_seats > self.total:
+            old_total = self.total
+            self.free.extend(b"\xff" * ((total_seats + 7) // 8 - len(self.free)))
+            for idx in range(old_total, min(total_seats, (old_total + 7) // 8 * 8)):
+                self.free[idx >> 3] |= 1 << (idx & 7)
+        else:
+            del self.free[(total_seats + 7) // 8:]
+            self.owners = {idx: owner for idx, owner in self.owners.items() if idx < total_seats}
+        self.total = total_seats
+        self._longest = None
+        self._clear_padding()
+
+    # ---- Best available ----
+
+    def rows(self):
+        return (self.total + self.per_row - 1) // self.per_row
+
+    def best_available(self, count):
+        """
+        Labels for the best `count` free seats, or None if fewer are free.
+        Prefers one contiguous block as close to the centre of the hall
+        (row and column) as possible, then blocks in as few adjacent rows
+        as possible, then simply the most central free seats.
+        """
+        if count <= 0 or count > self.available_count():
+            return None
+        longest = self._longest_runs()
+        mid = (len(longest) - 1) / 2
+        order = sorted(range(len(longest)), key=lambda row: (abs(row - mid), row))
+
+        best = None
+        for row in order:
+            if best is not None and abs(row - mid) >= best[0]:
+                break
+            if longest[row] >= count:
+                offset, start = self._centred_start(self._row_runs(row), count)
+                if best is None or abs(row - mid) + offset < best[0]:
+                    best = (abs(row - mid) + offset, row, start)
+        if best is not None:
+            base = best[1] * self.per_row
+            return [self.label(base + col) for col in range(best[2], best[2] + count)]
+
+        # No row has room for the whole party: split it over adjacent rows.
+        band = None
+        for row in order:
+            if not longest[row]:
+                continue
+            seats = self._row_block(row, count)
+            low = high = row
+            while len(seats) < count:
+                below = high + 1 if high + 1 < len(longest) and longest[high + 1] else None
+                above = low - 1 if low > 0 and longest[low - 1] else None
+                if below is None and above is None:
+                    break
+                if above is None or (below is not None and abs(below - mid) <= abs(above - mid)):
+                    seats += self._row_block(below, count - len(seats))
+                    high = below
+                else:
+                    seats += self._row_block(above, count - len(seats))
+                    low = above
+            if len(seats) == count and (band is None or high - low < band[0]):
+                band = (high - low, seats)
+        if band is not None:
+            return band[1]
+
+        centre_col = (self.per_row - 1) / 2
+        free = [idx for idx in range(self.total) if self._is_free(idx)]
+        free.sort(key=lambda idx: (abs(idx // self.per_row - mid), abs(idx % self.per_row - centre_col)))
+        return [self.label(idx) for idx in free[:count]]
+
+    def _row_runs(self, row):
+        """Free runs of a row as (first column, length)."""
+        base = row * self.per_row
+        width = min(self.per_row, self.total - base)
+        runs = []
+        run_start = None
+        for col in range(width + 1):
+            if col < width and self._is_free(base + col):
+                if run_start is None:
+                    run_start = col
+            elif run_start is not None:
+                runs.append((run_start, col - run_start))
+                run_start = None
+        return runs
+
+    def _longest_runs(self):
+        # Longest free run per row, kept up to date by _take() and release()
+        # so rows without room for a party are skipped without a scan.
+        if self._longest is None:
+            self._longest = [max((length for _, length in self._row_runs(row)), default=0)
+                             for row in range(self.rows())]
+        return self._longest
+
+    def _update_row(self, idx):
+        if self._longest is not None:
+            row = idx // self.per_row
+            self._longest[row] = max((length for _, length in self._row_runs(row)), default=0)
+
+    def _centred_start(self, runs, count):
+        """(distance from the centre, first column) of the most central block of count seats."""
+        ideal = (self.per_row - count) / 2
+        best = None
+        for first, length in runs:
+            if length < count:
+                continue
+            start = min(max(round(ideal), first), first + length - count)
+            if best is None or abs(start - ideal) < best[0]:
+                best = (abs(start - ideal), start)
+        return best
+
+    def _row_block(self, row, count):
+        """Labels of the most central block of up to count seats in row's longest run."""
+        runs = self._row_runs(row)
+        size = min(count, max(length for _, length in runs))
+        _, start = self._centred_start(runs, size)
+        base = row * self.per_row
+        return [self.label(base + col) for col in range(start, start + size)]
+
+    def _is_free(self, idx):
+        return self.free[idx >> 3] >> (idx & 7) & 1
+
+    def _take(self, idx, username):
+        self.free[idx >> 3] &= ~(1 << (idx & 7)) & 0xFF
+        self.owners[idx] = username
+        self._update_row(idx)
+
+    def _clear_padding(self):
+        # Bits past the last seat must stay 0 so popcounts stay exact.
+        if self.total % 8:
+            self.free[-1] &= (1 << (self.total % 8)) - 1
+
+
+def refresh_seat_counters(showtime):
+    """Recompute a showtime's available/sold counters from its seat map."""
+    seats = showtime['seats']
+    showtime['available_count'] = seats.available_count()
+    showtime['sold_count'] = len(seats.owners)
+
+
+def decode_showtime(showtime):
+    """Turn a showtime's stored seats into a SeatMap and fill in missing counters."""
+    showtime['seats'] = SeatMap.from_json(showtime.get('seats', {}), showtime.get('number_of_seats'))
+    if 'available_count' not in showtime:
+        refresh_seat_counters(showtime)
+
+
+def encode_record(obj):
+    """json default= hook for the compact types stored inside records."""
+    if isinstance(obj, SeatMap):
+        return obj.to_json()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+# ------------------ Seat Holds ------------------
+
+class SeatHolds:
+    """
+    Temporary holds on free seats between picking them and confirming.
+    A hold belongs to a session (the username) and lapses after ttl
+    seconds. With a store the holds are shared by every process using the
+    data directory: each change re-reads and rewrites them under the
+    store's lock, and reads re-load them only when the store changed.
+    Holds are kept by deadline and expire from a heap, so only holds that
+    actually lapsed are touched; seat maps are never scanned.
+    """
+
+    def __init__(self, store=None, ttl=HOLD_TTL_SECONDS, clock=time.time):
+        self.store = store
+        self.ttl = ttl
+        self.clock = clock  # wall clock: deadlines are compared across processes
+        self._holds = {}  # hold id -> {"session", "showtime_id", "seats", "expires"}
+        self._by_seat = {}  # (showtime id, label) -> hold id
+        self._held = {}  # showtime id -> number of held seats
+        self._deadlines = []  # heap of (expires, hold id)
+        self._next_id = 1
+        self._stamp = None  # store stamp of the loaded holds
+        self._loaded = False
+        # Shares the repository's lock: a commit checks holds while holding it.
+        self._lock = store.mutex if store else threading.RLock()
+
+    def hold(self, session, showtime_id, seats, is_free=None):
+        """
+        Hold seats for session. Returns the hold id, or None if another
+        session holds any of them or is_free(seats), asked under the lock,
+        says they are no longer free.
+        """
+        with self._writing():
+            for seat in seats:
+                hold_id = self._by_seat.get((showtime_id, seat))
+                if hold_id is not None and self._holds[hold_id]['session'] != session:
+                    return None
+            if is_free is not None and not is_free(seats):
+                return None
+            # A session re-holding its own seats takes them over into the new hold.
+            self._drop_seats(showtime_id, seats, session)
+            hold_id = self._next_id
+            self._next_id += 1
+            self._add(hold_id, {"session": session, "showtime_id": showtime_id,
+                                "seats": list(seats), "expires": self.clock() + self.ttl})
+            self._save()
+            return hold_id
+
+    def get(self, hold_id):
+        """The hold with its remaining seconds, or None once it is released or expired."""
+        with self._reading():
+            hold = self._holds.get(hold_id)
+            if hold is None:
+                return None
+            return dict(hold, seats=list(hold['seats']), expires_in=max(0, hold['expires'] - self.clock()))
+
+    def release(self, hold_id):
+        with self._writing():
+            hold = self._holds.get(hold_id)
+            if hold is not None and self._drop_seats(hold['showtime_id'], list(hold['seats']), hold['session']):
+                self._save()
+
+    def release_seats(self, showtime_id, seats, session):
+        """Drop session's holds on these seats, e.g. once they are booked."""
+        with self._reading():
+            if not self._holds_any(showtime_id, seats, session):
+                return
+        with self._writing():
+            if self._drop_seats(showtime_id, seats, session):
+                self._save()
+
+    def has_hold(self, session, showtime_id):
+        """True if session holds any seat of the showtime."""
+        with self._reading():
+            return any(hold['session'] == session and hold['showtime_id'] == showtime_id
+                       for hold in self._holds.values())
+
+    def drop_booked(self, booked):
+        """
+        Drop each session's holds on the seats it just booked ([(showtime
+        id, seats, session)]) without saving them. For a commit that
+        already holds the store's lock and writes snapshot() together with
+        the bookings; it calls saved() after the write, or forget() if the
+        write failed. Returns True if any hold changed.
+        """
+        with self._lock:
+            self._refresh()
+            self._expire()
+            return any([self._drop_seats(showtime_id, seats, session) for showtime_id, seats, session in booked])
+
+    def snapshot(self):
+        """The holds as the store keeps them, soonest deadline first."""
+        holds = sorted((dict(hold, id=hold_id) for hold_id, hold in self._holds.items()),
+                       key=lambda hold: hold['expires'])
+        return {"next_id": self._next_id, "holds": holds}
+
+    def saved(self):
+        self._stamp = self.store.stamp()
+
+    def forget(self):
+        """Re-load the holds on the next read: memory may have changes the store never got."""
+        self._loaded = False
+
+    def blocks(self, showtime_id, seats, session):
+        """True if another session holds any of the seats."""
+        with self._reading():
+            for seat in seats:
+                hold_id = self._by_seat.get((showtime_id, seat))
+                if hold_id is not None and self._holds[hold_id]['session'] != session:
+                    return True
+            return False
+
+    def held_count(self, showtime_id):
+        with self._reading():
+            return self._held.get(showtime_id, 0)
+
+    def held_seats(self, showtime_id, exclude=None):
+        """Labels held in a showtime by sessions other than exclude."""
+        with self._reading():
+            if not self._held.get(showtime_id):
+                return []
+            return [seat for hold in self._holds.values()
+                    if hold['showtime_id'] == showtime_id and hold['session'] != exclude
+                    for seat in hold['seats']]
+
+    @contextmanager
+    def _reading(self):
+        with self._lock:
+            self._refresh()
+            self._expire()
+            yield
+
+    @contextmanager
+    def _writing(self):
+        with self._lock, ExitStack() as locks:
+            if self.store is not None:
+                locks.enter_context(self.store.locked())
+            self._refresh()
+            self._expire()
+            yield
+
+    def _refresh(self):
+        """Re-load the holds if another process changed them."""
+        if self.store is None:
+            return
+        stamp = self.store.stamp()
+        if self._loaded and stamp == self._stamp:
+            return
+        data = self.store.load()
+        self._holds, self._by_seat, self._held, self._deadlines = {}, {}, {}, []
+        self._next_id = data["next_id"]
+        for hold in data["holds"]:
+            self._add(hold['id'], {key: hold[key] for key in ("session", "showtime_id", "seats", "expires")})
+        self._stamp = stamp
+        self._loaded = True
+
+    def _save(self):
+        if self.store is None:
+            return
+        self.store.save(self.snapshot())
+        self._stamp = self.store.stamp()
+
+    def _add(self, hold_id, hold):
+        self._holds[hold_id] = hold
+        for seat in hold['seats']:
+            self._by_seat[(hold['showtime_id'], seat)] = hold_id
+        self._held[hold['showtime_id']] = self._held.get(hold['showtime_id'], 0) + len(hold['seats'])
+        heapq.heappush(self._deadlines, (hold['expires'], hold_id))
+
+    def _holds_any(self, showtime_id, seats, session):
+        for seat in seats:
+            hold_id = self._by_seat.get((showtime_id, seat))
+            if hold_id is not None and self._holds[hold_id]['session'] == session:
+                return True
+        return False
+
+    def _drop_seats(self, showtime_id, seats, session):
+        """Drop session's holds on these seats; True if there were any."""
+        dropped = False
+        for seat in seats:
+            hold_id = self._by_seat.get((showtime_id, seat))
+            if hold_id is None or self._holds[hold_id]['session'] != session:
+                continue
+            del self._by_seat[(showtime_id, seat)]
+            hold = self._holds[hold_id]
+            hold['seats'].remove(seat)
+            self._held[showtime_id] -= 1
+            dropped = True
+            if not hold['seats']:
+                del self._holds[hold_id]  # its heap entry is skipped when popped
+        if not self._held.get(showtime_id, 1):
+            del self._held[showtime_id]
+        return dropped
+
+    def _expire(self):
+        # Lapsed holds leave memory here and the store with the next write.
+        now = self.clock()
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, hold_id = heapq.heappop(self._deadlines)
+            hold = self._holds.get(hold_id)
+            if hold is not None and hold['expires'] <= now:
+                self._drop_seats(hold['showtime_id'], list(hold['seats']), hold['session'])
+
+
+class HoldFile:
+    """data/holds.json: the seat holds of a JSON repository, written under its "holds" lock."""
+
+    def __init__(self, repo):
+        self.repo = repo
+        self.mutex = repo._lock
+
+    @property
+    def path(self):
+        return os.path.join(self.repo.data_dir, "holds.json")
+
+    def locked(self):
+        return self.repo.lock("holds")
+
+    def stamp(self):
+        return self.repo._stamp(self.path)
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {"next_id": 1, "holds": []}
+
+    def save(self, data):
+        save_data(self.path, data)
+
+    def files(self, data):
+        """{path: text} for writing the holds as part of a commit_files() set."""
+        return {self.path: json.dumps(data, indent=4)}
+
+
+# ------------------ Locking ------------------
+
+
+class FileLock:
+    """
+    Exclusive advisory lock on a file under data/locks.
+    Works across processes (and threads), so every terminal booking against
+    the same data directory sees the same locks.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = open(self.path, 'a+b')
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    self._file.seek(0)
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        return self
+
+    def __exit__(self, *exc_info):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+        self._file = None
+
+# ------------------ Repository ------------------
+
+# Tables whose booking changes can be recorded in the journal.
+JOURNALED_TABLES = ("bookings", "showtimes")
+BOOKING_ID_BLOCK = 32  # booking ids reserved from meta.json at a time
+SWEEP_BATCH = 500  # showtimes/bookings the orphan sweeper looks at per step
+LOCK_BATCH = 64  # showtime locks a whole-table maintenance job holds at once
+
+
+def find_overlap(intervals, start, end, ignore_id=None):
+    """
+    Id of an interval in intervals overlapping [start, end), or None.
+    intervals is a sorted list of (start, end, id) that never overlap one
+    another, so their ends are sorted too and only the last interval that
+    starts before end can reach past start.
+    """
+    position = bisect.bisect_left(intervals, (end,))
+    while position > 0:
+        position -= 1
+        other_start, other_end, other_id = intervals[position]
+        if other_id != ignore_id:
+            return other_id if other_end > start else None
+    return None
+
+
+class Repository:
+    """
+    In-memory cache of the users, movies, showtimes and bookings tables.
+    A table is re-parsed only when its file's mtime or size changes, and
+    every save writes through to disk before the cache is updated.
+
+    In "journal" mode bookings and cancellations are appended as one
+    compact record each to data/journal.log instead of rewriting
+    bookings.json and showtimes.json. The journal is replayed on top of the
+    snapshots when they are loaded and folded back into them by compact().
+
+    Several processes may share one data directory. A booking holds the
+    lock of its showtime while it re-reads, validates and commits, so
+    bookings for different showtimes only meet on the short journal append
+    (or, in snapshot mode, on the rewrite of the table files). Every
+    committed change bumps the showtime's version, which callers can pass
+    back as expected_version to get compare-and-swap semantics.
+
+    Each loaded table is indexed by id; users also by case-folded username
+    and bookings by user id and by showtime id. Booking ids are stable and
+    never reused, so users.json is left alone when seats change hands.
+    Showtimes are additionally kept in (datetime, id) order, globally and
+    per movie, so upcoming shows are a bisect plus a slice. Indexes are
+    rebuilt when a table is re-read or saved, and updated in place by
+    insert(). Showtimes long past their start are moved to
+    showtimes_archive.json by archive_expired().
+
+    Lock order: meta -> showtime -> holds -> journal -> tables.
+    """
+
+    def __init__(self, data_dir='data', mode=None):
+        self.data_dir = data_dir
+        self.mode = mode or STORAGE_MODE
+        self._tables = {}  # name -> (file stamp, records)
+        self._indexes = {}  # name -> {index name -> {key -> record or ids}}
+        self._journal_offset = 0
+        self._lock = threading.RLock()
+        self._held_locks = set()
+        self._compactor = None
+        self._booking_ids = range(0)  # reserved but unused booking ids
+        self._sweep_position = 0  # where the next sweep_orphans() step starts
+        self.holds = SeatHolds(HoldFile(self))
+
+    def path(self, name):
+        return os.path.join(self.data_dir, f"{name}.json")
+
+    @property
+    def journal_path(self):
+        return os.path.join(self.data_dir, "journal.log")
+
+    @contextmanager
+    def lock(self, name):
+        """Hold the cross-process lock `name`; re-entrant within this process."""
+        with self._lock:
+            if name in self._held_locks:
+                yield
+                return
+            with FileLock(os.path.join(self.data_dir, "locks", f"{name}.lock")):
+                self._held_locks.add(name)
+                try:
+                    yield
+                finally:
+                    self._held_locks.discard(name)
+
+    @staticmethod
+    def _stamp(file_path):
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def open(self):
+        """
+        Recover from an interrupted commit, trim a torn journal record,
+        fold a journal left behind by a journal-mode run into the snapshots
+        and archive expired showtimes.
+        """
+        # The meta and holds locks keep the temp-file sweep away from a
+        # next_id() or a hold in flight.
+        with self._lock, self.lock("meta"), self.lock("holds"), self.lock("journal"), self.lock("tables"):
+            recover_commit(self.data_dir)
+            self._split_bookings()
+            self._trim_journal()
+            self.invalidate()
+        if self.mode != "journal" and self._journal_size() > 0:
+            self.compact()
+        self.archive_expired()
+
+    def load(self, name):
+        if self.mode == "journal" and name in JOURNALED_TABLES:
+            with self._lock:
+                self._sync_journal()
+                return self._tables[name][1]
+        file_path = self.path(name)
+        stamp = self._stamp(file_path)
+        cached = self._tables.get(name)
+        if cached is not None and stamp is not None and cached[0] == stamp:
+            return cached[1]
+        stamp, records = self._stamped_read(name)
+        self._tables[name] = (stamp, records)
+        self._index_table(name, records)
+        return records
+
+    def _stamped_read(self, name):
+        """
+        (stamp, records) of a table. The stamp is taken before the read, so
+        a file replaced in between is read again next time instead of its
+        old rows being cached under the new stamp and written back.
+        """
+        file_path = self.path(name)
+        stamp = self._stamp(file_path)
+        if stamp is None:
+            self._read_table(name)  # creates the missing file, so there is something to stamp
+            stamp = self._stamp(file_path)
+        return stamp, self._read_table(name)
+
+    def _read_table(self, name):
+        records = load_data(self.path(name))
+        if name == "showtimes":
+            for showtime in records:
+                decode_showtime(showtime)
+        return records
+
+    def save(self, name, records, reindex=True):
+        if self.mode == "journal" and name in JOURNALED_TABLES:
+            # A full rewrite of a journaled table already contains every
+            # replayed record, so it doubles as a compaction.
+            with self._lock, self.lock("journal"):
+                self._sync_journal()
+                self._tables[name] = (self._tables[name][0], records)
+                if reindex:
+                    self._index_table(name, records)
+                self._compact_locked()
+            return
+        file_path = self.path(name)
+        with self._lock, self.lock("tables"):
+            try:
+                save_data(file_path, records)
+            except Exception:
+                # The in-memory copy may hold changes that never reached disk.
+                self.invalidate(name)
+                raise
+            self._tables[name] = (self._stamp(file_path), records)
+            if reindex:
+                self._index_table(name, records)
+
+    def insert(self, name, record):
+        """Append a record (with an id from next_id()) to the table as it is on disk and write it."""
+        with self._rewriting((name,)) as commit:
+            records = self.load(name)
+            records.append(record)
+            self._index_record(name, record)
+            commit()
+
+    def insert_many(self, batch):
+        """
+        Append records to several tables ({name: [records]}) and commit them
+        in one write. A showtime that overlaps another in its hall (or an
+        earlier one in the batch) is left out; returns those as
+        [(showtime, id of the showtime in the way)].
+        """
+        names = tuple(name for name, records in batch.items() if records)
+        if not names:
+            return []
+        rejected = []
+        with self._rewriting(names) as commit:
+            for name in names:
+                records = self.load(name)
+                for record in batch[name]:
+                    conflict = self._schedule_conflict(name, record)
+                    if conflict is not None:
+                        rejected.append((record, conflict))
+                        continue
+                    records.append(record)
+                    self._index_record(name, record)
+            commit()
+        return rejected
+
+    @contextmanager
+    def _rewriting(self, names):
+        """
+        Hold the locks for rewriting these tables, loaded fresh, and yield
+        commit(files=None), which writes them (plus any {path: text} files)
+        in one go. Rewriting a journaled table folds in the journal, as
+        save() does.
+        """
+        extra = {}
+        with self._lock, ExitStack() as locks:
+            if self.mode == "journal" and any(name in JOURNALED_TABLES for name in names):
+                locks.enter_context(self.lock("journal"))
+                self._sync_journal()
+                names = tuple(dict.fromkeys(tuple(names) + JOURNALED_TABLES))
+                extra[self.journal_path] = ""
+            locks.enter_context(self.lock("tables"))
+            for name in names:
+                self.load(name)
+
+            def commit(files=None):
+                self._write_tables(names, dict(extra, **(files or {})))
+                if extra:
+                    self._journal_offset = 0
+
+            yield commit
+
+    @contextmanager
+    def _deleting(self, names, showtime_ids=()):
+        """
+        Like _rewriting(), but first takes the locks of the showtimes whose
+        rows or bookings go, and yields delete(plan), which removes
+        {name: ids} and commits.
+        """
+        with self._lock, self._showtime_locks(showtime_ids):
+            with self._rewriting(names) as commit:
+                def delete(plan):
+                    for name, ids in plan.items():
+                        gone = set(ids)
+                        if not gone:
+                            continue
+                        records = self.load(name)
+                        for record_id in gone:
+                            record = self._indexes[name]["id"].get(record_id)
+                            if record is not None:
+                                self._unindex_record(name, record)
+                        records[:] = [record for record in records if record['id'] not in gone]
+                    commit()
+
+                yield delete
+
+    @contextmanager
+    def updating(self, names, showtime_ids=()):
+        """
+        Hold the locks of these showtimes and of the tables in names, loaded
+        fresh, and yield commit(changed), which reindexes and writes the
+        tables after their cached records were changed in place. changed is
+        {name: [records]}; backends that write row by row write only those.
+        Bookings of the showtimes wait for the commit, so an edit applies to
+        the seats as they are, not as they were when the admin read them.
+        """
+        with self._lock, self._showtime_locks(showtime_ids):
+            with self._rewriting(names) as write:
+                def commit(changed):
+                    for name in names:
+                        self._index_table(name, self._tables[name][1])
+                    write()
+
+                try:
+                    yield commit
+                except BaseException:
+                    # The cached records may hold changes that were never written.
+                    self.invalidate()
+                    raise
+
+    @contextmanager
+    def _showtime_locks(self, showtime_ids):
+        """Hold the locks of these showtimes, taken in id order."""
+        with ExitStack() as locks:
+            for showtime_id in sorted(set(showtime_ids)):
+                locks.enter_context(self.lock(f"showtime-{showtime_id}"))
+            yield
+
+    def _lock_batches(self, showtime_ids):
+        for start in range(0, len(showtime_ids), LOCK_BATCH):
+            yield showtime_ids[start:start + LOCK_BATCH]
+
+    def dependents(self, name, record_id):
+        """
+        {table: ids} of a movie or showtime and every record that points at
+        it (movie -> showtimes -> bookings), found through the reverse
+        indexes in time proportional to the rows returned.
+        """
+        plan = {name: [record_id]}
+        if name == "movies":
+            timeline = self._indexes_for("showtimes")["movie_id"].get(record_id, [])
+            plan["showtimes"] = [showtime_id for _, showtime_id in timeline]
+        booking_index = self._indexes_for("bookings")["showtime_id"]
+        plan["bookings"] = [booking_id for showtime_id in plan["showtimes"]
+                            for booking_id in booking_index.get(showtime_id, [])]
+        return plan
+
+    def delete_cascade(self, name, record_id, cascade_bookings=False):
+        """
+        Delete a movie or showtime with everything that points at it. A
+        movie's showtimes always go with it; bookings only with
+        cascade_bookings. The rows are deleted under their showtimes'
+        locks, LOCK_BATCH showtimes per write, and the movie goes with the
+        last batch. Returns the {table: ids} deleted, or None if the record
+        is gone or bookings would have to go without cascade_bookings.
+        """
+        names = ("movies", "showtimes", "bookings") if name == "movies" else ("showtimes", "bookings")
+        with self._lock:
+            if self.get(name, record_id) is None:
+                return None
+            plan = self.dependents(name, record_id)
+            if plan["bookings"] and not cascade_bookings:
+                return None
+            deleted = {table: [] for table in plan}
+            while True:
+                *batches, last = list(self._lock_batches(plan["showtimes"])) or [[]]
+                for batch in batches:
+                    with self._deleting(names, batch) as delete:
+                        showtime_index = self._indexes_for("showtimes")["id"]
+                        booking_index = self._indexes_for("bookings")["showtime_id"]
+                        part = {"showtimes": [showtime_id for showtime_id in batch
+                                              if showtime_index.get(showtime_id, {}).get('movie_id') == record_id]}
+                        part["bookings"] = [booking_id for showtime_id in part["showtimes"]
+                                            for booking_id in booking_index.get(showtime_id, [])]
+                        if part["bookings"] and not cascade_bookings:
+                            return None  # booked since the check; the batches before stay deleted
+                        delete(part)
+                    for table, ids in part.items():
+                        deleted[table].extend(ids)
+                with self._deleting(names, last) as delete:
+                    if self.get(name, record_id) is None:
+                        return None
+                    plan = self.dependents(name, record_id)
+                    if not set(plan["showtimes"]) <= set(last):
+                        # Added to the movie meanwhile (or still to go): another round of batches.
+                        continue
+                    if plan["bookings"] and not cascade_bookings:
+                        return None
+                    delete(plan)
+                for table, ids in plan.items():
+                    deleted[table].extend(ids)
+                return deleted
+
+    def sweep_orphans(self, budget=SWEEP_BATCH, now=None):
+        """
+        One step of the incremental orphan sweep. Looks at up to budget
+        showtimes and bookings after where the previous step stopped, and
+        deletes showtimes whose movie is gone (if nobody booked them) and
+        bookings whose showtime is gone. Bookings of archived showtimes are
+        history, not orphans: they are older than the archive cutoff.
+        Returns ({table: ids} deleted, whether this step finished a pass).
+        """
+        cutoff = ((now or datetime.now()) - timedelta(hours=ARCHIVE_AFTER_HOURS)).strftime(SHOWTIME_FORMAT)
+        with self._lock:
+            # Scan without locks; only a step that finds orphans takes them.
+            showtimes, bookings = self.showtimes(), self.bookings()
+            start = self._sweep_position
+            end = min(start + budget, len(showtimes) + len(bookings))
+            plan = self._orphans(showtimes[start:end], bookings[max(start - len(showtimes), 0):
+                                                               max(end - len(showtimes), 0)], cutoff)
+            if plan["showtimes"] or plan["bookings"]:
+                bookings_by_id = self._indexes_for("bookings")["id"]
+                # showtime id -> the planned rows that are its showtime or its bookings
+                rows = {}
+                for showtime_id in plan["showtimes"]:
+                    rows.setdefault(showtime_id, {"showtimes": [], "bookings": []})["showtimes"].append(showtime_id)
+                for booking_id in plan["bookings"]:
+                    if booking_id in bookings_by_id:
+                        showtime_id = bookings_by_id[booking_id]['showtime_id']
+                        rows.setdefault(showtime_id, {"showtimes": [], "bookings": []})["bookings"].append(booking_id)
+                plan = {"showtimes": [], "bookings": []}
+                for batch in self._lock_batches(sorted(rows)):
+                    with self._deleting(("showtimes", "bookings"), batch) as delete:
+                        # Re-checked under the locks: a row may have been booked or deleted meanwhile.
+                        fresh = {name: [self.get(name, record_id) for showtime_id in batch
+                                        for record_id in rows[showtime_id][name]] for name in plan}
+                        part = self._orphans([showtime for showtime in fresh["showtimes"] if showtime],
+                                             [booking for booking in fresh["bookings"] if booking], cutoff)
+                        if part["showtimes"] or part["bookings"]:
+                            delete(part)
+                    for name, ids in part.items():
+                        plan[name].extend(ids)
+            done = end >= len(showtimes) + len(bookings)
+            # Rows deleted by this step were all before end, so the rest move up by that many.
+            self._sweep_position = 0 if done else end - len(plan["showtimes"]) - len(plan["bookings"])
+            return plan, done
+
+    def _orphans(self, showtimes, bookings, cutoff):
+        """{table: ids} of the given showtimes and bookings that the orphan sweep deletes."""
+        movie_ids = self._indexes_for("movies")["id"]
+        showtime_ids = self._indexes_for("showtimes")["id"]
+        booked = self._indexes_for("bookings")["showtime_id"]
+        return {"showtimes": [showtime['id'] for showtime in showtimes
+                              if showtime['movie_id'] not in movie_ids and showtime['id'] not in booked],
+                "bookings": [booking['id'] for booking in bookings
+                             if booking['showtime_id'] not in showtime_ids and booking['datetime'] >= cutoff]}
+
+    def hold_seats(self, username, showtime_id, seats):
+        """
+        Hold seats of a showtime for username. Returns the hold id, or None
+        if any seat is sold or held by someone else by the time the hold is
+        taken; the check and the hold happen under the showtime's lock.
+        """
+        def is_free(labels):
+            showtime = self.get("showtimes", showtime_id)
+            return showtime is not None and all(showtime['seats'].is_available(seat) for seat in labels)
+
+        with self.lock(f"showtime-{showtime_id}"):
+            return self.holds.hold(username, showtime_id, seats, is_free)
+
+    def _schedule_conflict(self, name, record):
+        if name != "showtimes" or record.get('hall_id') is None:
+            return None
+        return self.hall_conflict(record['hall_id'], record['datetime'], record['end_datetime'])
+
+    def next_id(self, name, count=1):
+        """
+        Hand out the next id for a table from the counters in meta.json,
+        so ids stay unique even after the newest record is removed.
+        With count > 1 the ids new_id .. new_id + count - 1 are reserved.
+        """
+        meta_path = os.path.join(self.data_dir, "meta.json")
+        with self._lock, self.lock("meta"):
+            meta = load_data(meta_path) if os.path.exists(meta_path) else {}
+            counters = meta.setdefault("next_ids", {})
+            if name not in counters:
+                # First id handed out for this table: continue after the existing records.
+                counters[name] = max(self._indexes_for(name)["id"], default=0) + 1
+            new_id = counters[name]
+            counters[name] += count
+            save_data(meta_path, meta)
+            return new_id
+
+    def new_booking_ids(self, count):
+        """Ids for count new bookings, reserved from meta.json a block at a time."""
+        with self._lock:
+            if len(self._booking_ids) < count:
+                size = max(count, BOOKING_ID_BLOCK)
+                first = self.next_id("bookings", size)
+                self._booking_ids = range(first, first + size)
+            ids, self._booking_ids = self._booking_ids[:count], self._booking_ids[count:]
+            return list(ids)
+
+    def _split_bookings(self):
+        """One-time upgrade: move the bookings embedded in users.json into bookings.json."""
+        if not os.path.exists(self.path("users")):
+            return
+        users = load_data(self.path("users"))
+        if not any('bookings' in user for user in users):
+            return
+        bookings = load_data(self.path("bookings")) if os.path.exists(self.path("bookings")) else []
+        booking_id = max((booking['id'] for booking in bookings), default=0)
+        for user in users:
+            for booking in user.pop('bookings', []):
+                booking_id += 1
+                bookings.append(dict(id=booking_id, user_id=user['id'], **booking))
+        commit_files(self.data_dir, {self.path("users"): json.dumps(users, indent=4),
+                                     self.path("bookings"): json.dumps(bookings, indent=4)})
+
+    # ---- Indexes ----
+
+    def _index_table(self, name, records):
+        index = self._indexes[name] = {"id": {}, "username": {}, "movie_id": {}, "timeline": [],
+                                       "user_id": {}, "showtime_id": {}, "hall_id": {}}
+        for record in records:
+            self._index_record(name, record, keep_sorted=False)
+        if name == "showtimes":
+            index["timeline"].sort()
+            for timeline in list(index["movie_id"].values()) + list(index["hall_id"].values()):
+                timeline.sort()
+        elif name == "bookings":
+            for booking_ids in list(index["user_id"].values()) + list(index["showtime_id"].values()):
+                booking_ids.sort()
+
+    def _index_record(self, name, record, keep_sorted=True):
+        index = self._indexes[name]
+        index["id"][record['id']] = record
+        if name == "users":
+            index["username"].setdefault(record['username'].casefold(), record)
+        elif name == "showtimes":
+            key = (record['datetime'], record['id'])
+            movie_timeline = index["movie_id"].setdefault(record['movie_id'], [])
+            if keep_sorted:
+                bisect.insort(index["timeline"], key)
+                bisect.insort(movie_timeline, key)
+            else:
+                index["timeline"].append(key)
+                movie_timeline.append(key)
+            if record.get('hall_id') is not None:
+                # Each hall's showtimes as sorted, non-overlapping [start, end) intervals.
+                hall_timeline = index["hall_id"].setdefault(record['hall_id'], [])
+                interval = (record['datetime'], record['end_datetime'], record['id'])
+                if keep_sorted:
+                    bisect.insort(hall_timeline, interval)
+                else:
+                    hall_timeline.append(interval)
+        elif name == "bookings":
+            for key in ("user_id", "showtime_id"):
+                booking_ids = index[key].setdefault(record[key], [])
+                if keep_sorted:
+                    bisect.insort(booking_ids, record['id'])
+                else:
+                    booking_ids.append(record['id'])
+
+    def _unindex_record(self, name, record):
+        if name == "bookings":
+            return self._unindex_booking(record)
+        index = self._indexes[name]
+        del index["id"][record['id']]
+        if name == "users":
+            index["username"].pop(record['username'].casefold(), None)
+        elif name == "showtimes":
+            key = (record['datetime'], record['id'])
+            timelines = [(index["timeline"], key), (index["movie_id"].get(record['movie_id'], []), key)]
+            if record.get('hall_id') is not None:
+                timelines.append((index["hall_id"].get(record['hall_id'], []),
+                                  (record['datetime'], record['end_datetime'], record['id'])))
+            for timeline, entry in timelines:
+                position = bisect.bisect_left(timeline, entry)
+                if position < len(timeline) and timeline[position] == entry:
+                    del timeline[position]
+
+    def _unindex_booking(self, booking):
+        index = self._indexes["bookings"]
+        del index["id"][booking['id']]
+        for key in ("user_id", "showtime_id"):
+            booking_ids = index[key][booking[key]]
+            booking_ids.remove(booking['id'])
+            if not booking_ids:
+                del index[key][booking[key]]
+
+    def _indexes_for(self, name):
+        self.load(name)
+        return self._indexes[name]
+
+    def get(self, name, record_id):
+        return self._indexes_for(name)["id"].get(record_id)
+
+    def find_user(self, username):
+        """Look a user up by username, ignoring case."""
+        return self._indexes_for("users")["username"].get(username.casefold())
+
+    def bookings_for_user(self, user_id):
+        index = self._indexes_for("bookings")
+        return [index["id"][booking_id] for booking_id in index["user_id"].get(user_id, [])]
+
+    def bookings_for_showtime(self, showtime_id):
+        index = self._indexes_for("bookings")
+        return [index["id"][booking_id] for booking_id in index["showtime_id"].get(showtime_id, [])]
+
+    def hall_conflict(self, hall_id, start, end, ignore_id=None):
+        """Id of a showtime in the hall overlapping [start, end), or None; O(log n)."""
+        return find_overlap(self._indexes_for("showtimes")["hall_id"].get(hall_id, []), start, end, ignore_id)
+
+    def showtimes_for_movie(self, movie_id):
+        index = self._indexes_for("showtimes")
+        return [index["id"][showtime_id] for _, showtime_id in index["movie_id"].get(movie_id, [])]
+
+    def upcoming_showtimes(self, movie_id=None, now=None):
+        """Showtimes starting after now, in time order, for one movie or all of them."""
+        index = self._indexes_for("showtimes")
+        timeline = index["timeline"] if movie_id is None else index["movie_id"].get(movie_id, [])
+        start = bisect.bisect_right(timeline, ((now or datetime.now()).strftime(SHOWTIME_FORMAT), math.inf))
+        return [index["id"][showtime_id] for _, showtime_id in timeline[start:]]
+
+    @property
+    def archive_path(self):
+        return os.path.join(self.data_dir, "showtimes_archive.json")
+
+    def archive_expired(self, now=None, showtime_ids=None):
+        """
+        Move showtimes that started more than ARCHIVE_AFTER_HOURS ago (only
+        those in showtime_ids, if given) to showtimes_archive.json. Returns
+        how many were archived.
+        """
+        cutoff = ((now or datetime.now()) - timedelta(hours=ARCHIVE_AFTER_HOURS)).strftime(SHOWTIME_FORMAT)
+        with self._rewriting(("showtimes",)) as commit:
+            showtimes = self.showtimes()
+            index = self._indexes["showtimes"]
+            end = bisect.bisect_left(index["timeline"], (cutoff,))
+            in_order = [showtime_id for _, showtime_id in index["timeline"][:end]
+                        if showtime_ids is None or showtime_id in showtime_ids]
+            if not in_order:
+                return 0
+            expired = set(in_order)
+
+            archive = load_data(self.archive_path)
+            archive.extend(index["id"][showtime_id] for showtime_id in in_order)
+            remaining = [showtime for showtime in showtimes if showtime['id'] not in expired]
+            self._tables["showtimes"] = (self._tables["showtimes"][0], remaining)
+            self._index_table("showtimes", remaining)
+
+            # The archive and the trimmed table commit together; in journal
+            # mode this is also a compaction, since the table is rewritten.
+            commit({self.archive_path: json.dumps(archive, indent=4, default=encode_record)})
+            return len(expired)
+
+    def invalidate(self, name=None):
+        with self._lock:
+            if name is None:
+                self._tables.clear()
+                self._indexes.clear()
+            else:
+                self._tables.pop(name, None)
+                self._indexes.pop(name, None)
+            self._journal_offset = 0
+
+    def users(self):
+        return self.load("users")
+
+    def movies(self):
+        return self.load("movies")
+
+    def halls(self):
+        return self.load("halls")
+
+    def showtimes(self):
+        return self.load("showtimes")
+
+    def bookings(self):
+        return self.load("bookings")
+
+    # ---- Booking records ----
+
+    @staticmethod
+    def booking_record(username, showtime_id, seats, expected_version=None):
+        # commit_batch() gives the record its booking_id.
+        record = {"op": "book", "username": username,
+                  "showtime_id": showtime_id, "seats": list(seats)}
+        if expected_version is not None:
+            record['version'] = expected_version
+        return record
+
+    @staticmethod
+    def best_seats_record(username, showtime_id, count):
+        # commit_batch() picks the seats from the seat map as it is at commit time.
+        return {"op": "book", "username": username, "showtime_id": showtime_id, "count": count}
+
+    @staticmethod
+    def cancellation_record(username, booking_id, seats):
+        # commit_batch() fills in the booking's showtime.
+        return {"op": "cancel", "username": username, "booking_id": booking_id, "seats": list(seats)}
+
+    def record_booking(self, username, showtime_id, seats, expected_version=None):
+        """
+        Give the seats to username. Returns False if any seat is taken or,
+        when expected_version is given, if the showtime changed since then.
+        """
+        return self.commit_batch([self.booking_record(username, showtime_id, seats, expected_version)])[0]
+
+    def record_cancellation(self, username, booking_id, seats):
+        """Release seats from one of the user's bookings."""
+        return self.commit_batch([self.cancellation_record(username, booking_id, seats)])[0]
+
+    def commit_batch(self, records):
+        """
+        Apply booking/cancellation records in order and make them durable
+        with a single write. Returns one True/False per record; a record
+        that fails validation does not affect the others.
+        """
+        with self._lock, ExitStack() as locks:
+            new_bookings = [r for r in records if r['op'] == "book" and 'booking_id' not in r]
+            for record, booking_id in zip(new_bookings, self.new_booking_ids(len(new_bookings))):
+                record['booking_id'] = booking_id
+            for record in records:
+                if record['op'] == "cancel" and 'showtime_id' not in record:
+                    # A booking never moves to another showtime, so no lock is needed to look it up.
+                    booking = self.get("bookings", record['booking_id'])
+                    record['showtime_id'] = booking['showtime_id'] if booking else None
+            locks.enter_context(self._showtime_locks(r['showtime_id'] for r in records if r['showtime_id'] is not None))
+            # Seats another session is holding cannot be booked.
+            # Best-seat records are planned around the holds, once the seat map is fresh.
+            blocked = [r['op'] == "book" and 'seats' in r
+                       and self.holds.blocks(r['showtime_id'], r['seats'], r['username'])
+                       for r in records]
+            committed = iter(self._commit_batch([r for r, b in zip(records, blocked) if not b]))
+            results = [False if b else next(committed) for b in blocked]
+            if metrics.enabled:
+                for record, ok in zip(records, results):
+                    metrics.inc("movie_commits_total", op=record['op'], result="ok" if ok else "conflict")
+            for record, ok in zip(records, results):
+                if ok and record['op'] == "book":
+                    self.holds.release_seats(record['showtime_id'], record['seats'], record['username'])
+            return results
+
+    def _commit_batch(self, records):
+        # Caller holds the showtime locks, so no other process can change
+        # those showtimes' seats between the validation and the write.
+        if self.mode != "journal":
+            # Booking held seats drops the hold in the same commit: holds.json
+            # joins the files, so the holds lock is taken before the tables lock.
+            holding = self.holds.store is not None and any(
+                record['op'] == "book" and self.holds.has_hold(record['username'], record['showtime_id'])
+                for record in records)
+            with ExitStack() as locks:
+                if holding:
+                    locks.enter_context(self.holds.store.locked())
+                locks.enter_context(self.lock("tables"))
+                self._load_for_commit(records)
+                results = [self._apply_record(record) for record in records]
+                if any(results):
+                    touched = {record['showtime_id'] for record, ok in zip(records, results) if ok}
+                    booked = [(record['showtime_id'], record['seats'], record['username'])
+                              for record, ok in zip(records, results) if ok and record['op'] == "book"]
+                    holds = {}
+                    if holding and self.holds.drop_booked(booked):
+                        holds = self.holds.store.files(self.holds.snapshot())
+                    try:
+                        self._write_tables(JOURNALED_TABLES, holds, showtime_ids=touched)
+                    except Exception:
+                        self.holds.forget()
+                        raise
+                    if holds:
+                        self.holds.saved()
+                return results
+
+        self._sync_journal()
+        results = [self._apply_record(record) for record in records]
+        lines = b"".join((json.dumps(record, separators=(',', ':')) + "\n").encode('utf-8')
+                         for record, ok in zip(records, results) if ok)
+        if not lines:
+            return results
+        try:
+            os.makedirs(self.data_dir, exist_ok=True)
+            with self.lock("journal"), open(self.journal_path, 'ab') as journal:
+                start = journal.seek(0, os.SEEK_END)
+                journal.write(lines)
+                journal.flush()
+                os.fsync(journal.fileno())
+        except Exception:
+            self.invalidate()
+            raise
+        if metrics.enabled:
+            metrics.file_io("written", self.journal_path, len(lines), file_size=start + len(lines))
+        if start == self._journal_offset:
+            self._journal_offset = start + len(lines)
+        else:
+            # Records for other showtimes landed first; replay in file order next time.
+            self.invalidate()
+        if self._journal_offset > JOURNAL_COMPACT_BYTES:
+            self.compact_in_background()
+        return results
+
+    def _load_for_commit(self, records):
+        """Bring the tables the records touch up to date."""
+        self.users()
+        self.bookings()
+        self.showtimes()
+
+    def _apply_record(self, record):
+        user = self.find_user(record['username'])
+        if user is None:
+            return False
+        booking_index = self._indexes["bookings"]
+        showtimes_by_id = self._indexes["showtimes"]["id"]
+
+        if record['op'] == "book":
+            if 'seats' not in record and not self._plan_seats(record):
+                return False
+            showtime = showtimes_by_id.get(record['showtime_id'])
+            if showtime is None or len(set(record['seats'])) != len(record['seats']):
+                return False
+            if not all(showtime['seats'].is_available(seat) for seat in record['seats']):
+                return False
+            if 'version' in record and showtime.get('version', 0) != record['version']:
+                return False
+            # Journals written before booking ids number their bookings on replay.
+            booking_id = record.get('booking_id') or max(booking_index["id"], default=0) + 1
+            if booking_id in booking_index["id"]:
+                return False
+            for seat in record['seats']:
+                showtime['seats'].assign(seat, user['username'])
+            showtime['available_count'] -= len(record['seats'])
+            showtime['sold_count'] += len(record['seats'])
+            showtime['version'] = showtime.get('version', 0) + 1
+            booking = {
+                "id": booking_id,
+                "user_id": user['id'],
+                "movie_id": showtime['movie_id'],
+                "showtime_id": showtime['id'],
+                "seats": list(record['seats']),
+                "datetime": showtime['datetime']
+            }
+            self._tables["bookings"][1].append(booking)
+            self._index_record("bookings", booking)
+            return True
+
+        if record['op'] == "cancel":
+            if 'booking_id' in record:
+                booking = booking_index["id"].get(record['booking_id'])
+            else:
+                # Journals written before booking ids refer to the user's n-th booking.
+                own = booking_index["user_id"].get(user['id'], [])
+                booking = booking_index["id"][own[record['booking']]] if 0 <= record['booking'] < len(own) else None
+            if booking is None or booking['user_id'] != user['id']:
+                return False
+            if booking['showtime_id'] != record.get('showtime_id', booking['showtime_id']):
+                return False
+            showtime = showtimes_by_id.get(booking['showtime_id'])
+            released = 0
+            for seat in record['seats']:
+                if showtime and seat in booking['seats'] and showtime['seats'].release(seat):
+                    released += 1
+            if released == 0:
+                # None of the seats are the booking's: a no-op, not a cancellation.
+                return False
+            if showtime:
+                showtime['available_count'] += released
+                showtime['sold_count'] -= released
+                showtime['version'] = showtime.get('version', 0) + 1
+            remaining_seats = [s for s in booking['seats'] if s not in record['seats']]
+            if remaining_seats:
+                booking['seats'] = remaining_seats
+            else:
+                self._tables["bookings"][1].remove(booking)
+                self._unindex_booking(booking)
+            return True
+
+        return False
+
+    def _plan_seats(self, record, taken=()):
+        """
+        Give a best-seats record the best block of its count seats that is
+        free now, skipping seats held by other sessions and any labels in
+        taken. False if the showtime is gone or too few seats are left.
+        """
+        showtime = self._indexes["showtimes"]["id"].get(record['showtime_id'])
+        if showtime is None:
+            return False
+        blocked = set(taken).union(self.holds.held_seats(showtime['id'], exclude=record['username']))
+        seat_map = showtime['seats']
+        if blocked:
+            seat_map = seat_map.copy()
+            for seat in blocked:
+                if seat_map.is_available(seat):
+                    seat_map.assign(seat, "")
+        seats = seat_map.best_available(record['count'])
+        if seats is None:
+            return False
+        record['seats'] = seats
+        del record['count']
+        return True
+
+    def verify_counters(self):
+        """
+        Recompute every showtime's seat counters from its seat map and save
+        the ones that drifted, a batch of showtimes at a time under their
+        locks. Returns the ids of the repaired showtimes.
+        """
+        with self._lock:
+            showtime_ids = [showtime['id'] for showtime in self.showtimes()]
+        repaired = []
+        for batch in self._lock_batches(showtime_ids):
+            with self.updating(("showtimes",), batch) as commit:
+                changed = []
+                for showtime_id in batch:
+                    showtime = self.get("showtimes", showtime_id)
+                    if showtime is None:
+                        continue
+                    counters = (showtime.get('available_count'), showtime.get('sold_count'))
+                    refresh_seat_counters(showtime)
+                    if counters != (showtime['available_count'], showtime['sold_count']):
+                        changed.append(showtime)
+                if changed:
+                    commit({"showtimes": changed})
+            repaired.extend(showtime['id'] for showtime in changed)
+        return repaired
+
+    # ---- Journal ----
+
+    def _journal_size(self):
+        try:
+            return os.path.getsize(self.journal_path)
+        except FileNotFoundError:
+            return 0
+
+    def _sync_journal(self):
+        """Reload changed snapshots and replay journal records not yet applied."""
+        stale = False
+        for name in JOURNALED_TABLES:
+            cached = self._tables.get(name)
+            stamp = self._stamp(self.path(name))
+            if cached is None or stamp is None or cached[0] != stamp:
+                stale = True
+        size = self._journal_size()
+        if stale or size < self._journal_offset:
+            for name in JOURNALED_TABLES:
+                self._tables[name] = self._stamped_read(name)
+                self._index_table(name, self._tables[name][1])
+            self._journal_offset = 0
+        if size > self._journal_offset:
+            start = time.perf_counter() if metrics.enabled else None
+            with open(self.journal_path, 'rb') as journal:
+                journal.seek(self._journal_offset)
+                tail = journal.read()
+            if start is not None:
+                metrics.file_io("read", self.journal_path, len(tail), time.perf_counter() - start,
+                                file_size=self._journal_offset + len(tail))
+            # A torn final record has no newline yet; leave it unread.
+            end = tail.rfind(b"\n") + 1
+            for line in tail[:end].splitlines():
+                if line.strip():
+                    self._apply_record(json.loads(line))
+            self._journal_offset += end
+
+    def compact(self):
+        """Write the replayed state to the JSON snapshots and empty the journal."""
+        with self._lock, self.lock("journal"):
+            self._sync_journal()
+            self._compact_locked()
+
+    def _compact_locked(self):
+        # The snapshots and the emptied journal commit together, so a crash
+        # can never leave a journal that would be replayed twice.
+        self._write_tables(JOURNALED_TABLES, {self.journal_path: ""})
+        self._journal_offset = 0
+
+    def _write_tables(self, names, extra=None, showtime_ids=None):
+        """
+        Commit the cached tables (plus any extra file contents) atomically.
+        showtime_ids names the only showtimes that changed, for layouts
+        that can write less than the whole table.
+        """
+        contents = {}
+        for name in names:
+            contents.update(self._table_files(name, showtime_ids))
+        contents.update(extra or {})
+        try:
+            with self.lock("tables"):
+                commit_files(self.data_dir, contents)
+        except Exception:
+            self.invalidate()
+            raise
+        self._committed(names, contents)
+
+    def _table_files(self, name, showtime_ids=None):
+        """File path -> text for writing a cached table."""
+        return {self.path(name): json.dumps(self._tables[name][1], indent=4, default=encode_record)}
+
+    def _committed(self, names, contents):
+        for name in names:
+            self._tables[name] = (self._stamp(self.path(name)), self._tables[name][1])
+
+    def _trim_journal(self):
+        """Cut off a record that was only partly written when the process died."""
+        size = self._journal_size()
+        if size == 0:
+            return
+        with open(self.journal_path, 'rb+') as journal:
+            keep = 0
+            end = size
+            while end > 0:
+                start = max(0, end - 4096)
+                journal.seek(start)
+                newline = journal.read(end - start).rfind(b"\n")
+                if newline >= 0:
+                    keep = start + newline + 1
+                    break
+                end = start
+            if keep < size:
+                journal.truncate(keep)
+                journal.flush()
+                os.fsync(journal.fileno())
+
+    def compact_in_background(self):
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self.compact, name="journal-compactor")
+        self._compactor.start()
+
+
+# ------------------ Sharded Layout ------------------
+
+# Per-showtime fields kept in the showtime's own file rather than the catalogue.
+SHARD_FIELDS = ("seats", "available_count", "sold_count", "version")
+
+
+class ShardedRepository(Repository):
+    """
+    JSON layout with one small file per showtime.
+
+    data/showtimes/catalogue.json lists the showtimes without their seats
+    and data/showtimes/<id>.json holds one showtime's seat map, counters,
+    version and bookings; bookings.json only keeps the bookings of
+    showtimes that left the catalogue. A booking rewrites only the shards
+    it touches, under those showtimes' locks alone, and appends their ids
+    to data/shard_changes.log, so other processes re-read just those
+    shards instead of checking every one. Adding or removing a showtime
+    writes the catalogue, at most that showtime's shard and bookings.json,
+    and empties the log. The sharded layout always runs in snapshot mode.
+    """
+
+    def __init__(self, data_dir='data'):
+        super().__init__(data_dir, mode="snapshot")
+        self._shard_stamps = {}  # showtime id -> file stamp when last read or written
+        self._shard_texts = {}  # showtime id -> file text when last read or written
+        self._shard_bookings = {}  # showtime id -> bookings when last read or written
+        self._changes_seen = (None, 0)  # change log inode, bytes already applied
+
+    @property
+    def shard_dir(self):
+        return os.path.join(self.data_dir, "showtimes")
+
+    @property
+    def changes_path(self):
+        return os.path.join(self.data_dir, "shard_changes.log")
+
+    def shard_path(self, showtime_id):
+        return os.path.join(self.shard_dir, f"{showtime_id}.json")
+
+    def path(self, name):
+        if name == "showtimes":
+            return os.path.join(self.shard_dir, "catalogue.json")
+        return super().path(name)
+
+    def open(self):
+        """
+        Recover from an interrupted commit, shard a single-file
+        showtimes.json on first use, move bookings into their shards and
+        archive expired showtimes.
+        """
+        with self._lock, self.lock("meta"), self.lock("holds"), self.lock("tables"):
+            recover_commit(self.data_dir)
+            self._split_bookings()
+            self.invalidate()
+            unsharded = (not os.path.exists(self.path("showtimes"))
+                         and os.path.exists(Repository.path(self, "showtimes")))
+        if unsharded:
+            source = Repository(self.data_dir, mode="snapshot")
+            source.open()
+            try:
+                self.import_from(source)
+            except ValueError:
+                pass  # another process sharded it first
+        self._shard_bookings_upgrade()
+        self.archive_expired()
+
+    def _shard_bookings_upgrade(self):
+        """One-time upgrade: move live showtimes' bookings from bookings.json into their shards."""
+        with self._lock, self.lock("tables"):
+            if not os.path.exists(self.path("showtimes")) or not os.path.exists(self.path("bookings")):
+                return
+            live = {showtime['id'] for showtime in load_data(self.path("showtimes"))}
+            if not any(booking['showtime_id'] in live for booking in load_data(self.path("bookings"))):
+                return
+            self.invalidate()
+            self.load("bookings")
+            self._write_tables(("showtimes", "bookings"))
+
+    def import_from(self, source):
+        """One-shot copy of a single-file Repository's showtimes into shard files."""
+        with self._lock, self.lock("tables"):
+            if os.path.exists(self.path("showtimes")):
+                raise ValueError(f"{self.path('showtimes')} already exists")
+            showtimes = source.showtimes()
+            self._tables["showtimes"] = (None, showtimes)
+            self._index_table("showtimes", showtimes)
+            self._write_tables(("showtimes",))
+            self.invalidate()
+
+    def invalidate(self, name=None):
+        with self._lock:
+            super().invalidate(name)
+            if name in (None, "showtimes"):
+                # The bookings table is partly made of the shards.
+                super().invalidate("bookings")
+                self._shard_stamps.clear()
+                self._shard_texts.clear()
+                self._shard_bookings.clear()
+                self._changes_seen = (None, 0)
+
+    def load(self, name):
+        if name == "bookings":
+            self.load("showtimes")
+            return super().load(name)
+        records = super().load(name)
+        if name == "showtimes":
+            self._read_changes()
+        return records
+
+    def _read_changes(self):
+        """Re-read the shards other processes logged as changed since the last look."""
+        try:
+            stat = os.stat(self.changes_path)
+        except FileNotFoundError:
+            return
+        inode, offset = self._changes_seen
+        if stat.st_ino != inode:
+            offset = 0  # emptied by a catalogue write; every entry is new
+        if stat.st_size <= offset:
+            self._changes_seen = (stat.st_ino, offset)
+            return
+        start = time.perf_counter() if metrics.enabled else None
+        with open(self.changes_path, 'rb') as log:
+            log.seek(offset)
+            tail = log.read(stat.st_size - offset)
+        if start is not None:
+            metrics.file_io("read", self.changes_path, len(tail), time.perf_counter() - start, file_size=stat.st_size)
+        end = tail.rfind(b"\n") + 1
+        self._changes_seen = (stat.st_ino, offset + end)
+        by_id = self._indexes["showtimes"]["id"]
+        changed = {int(line) for line in tail[:end].split()}
+        self._refresh_shards([by_id[showtime_id] for showtime_id in changed if showtime_id in by_id])
+
+    def get(self, name, record_id):
+        if name != "showtimes":
+            return super().get(name, record_id)
+        # Check the catalogue and this one shard rather than the change log.
+        super().load(name)
+        showtime = self._indexes[name]["id"].get(record_id)
+        if showtime is not None and self._stamp(self.shard_path(record_id)) != self._shard_stamps.get(record_id):
+            self._refresh_shards([showtime])
+        return showtime
+
+    def _load_for_commit(self, records):
+        self.users()
+        for showtime_id in {record['showtime_id'] for record in records}:
+            self.get("showtimes", showtime_id)
+        self.bookings()
+
+    def _commit_batch(self, records):
+        # Caller holds the showtime locks, and a booking lives in its
+        # showtime's shard, so bookings of different showtimes commit in
+        # parallel: the tables lock is only taken to log the change.
+        self._load_for_commit(records)
+        results = [self._apply_record(record) for record in records]
+        touched = {record['showtime_id'] for record, ok in zip(records, results) if ok}
+        if touched:
+            self._write_shards(touched)
+        return results
+
+    def _write_shards(self, showtime_ids):
+        """Replace these showtimes' shards one by one; each holds all of its showtime's changes."""
+        files = self._table_files("showtimes", showtime_ids)
+        try:
+            for file_path, text in files.items():
+                # Not *.tmp: recover_commit() sweeps those, and this write does not hold the tables lock.
+                os.replace(_write_temp(file_path, text, suffix=".new"), file_path)
+            _fsync_dir(self.shard_dir)
+        except Exception:
+            self.invalidate()
+            raise
+        self._committed(("showtimes",), files)
+
+    def archive_expired(self, now=None, showtime_ids=None):
+        # Bookings reach a shard under its showtime's lock alone, so expired
+        # showtimes are archived LOCK_BATCH at a time under their locks.
+        now = now or datetime.now()
+        cutoff = (now - timedelta(hours=ARCHIVE_AFTER_HOURS)).strftime(SHOWTIME_FORMAT)
+        archived = 0
+        with self._lock:
+            while True:
+                timeline = self._indexes_for("showtimes")["timeline"]
+                expired = [showtime_id for _, showtime_id in timeline[:bisect.bisect_left(timeline, (cutoff,))]
+                           if showtime_ids is None or showtime_id in showtime_ids][:LOCK_BATCH]
+                if not expired:
+                    return archived
+                with self._showtime_locks(expired):
+                    count = super().archive_expired(now, set(expired))
+                if not count:
+                    return archived
+                archived += count
+
+    def _read_table(self, name):
+        if name == "bookings":
+            # bookings.json holds the rest; the shards' bookings were read with the shards.
+            bookings = super()._read_table(name)
+            for shard_bookings in self._shard_bookings.values():
+                bookings.extend(shard_bookings)
+            return bookings
+        if name != "showtimes":
+            return super()._read_table(name)
+        super().invalidate("bookings")
+        self._shard_stamps.clear()
+        self._shard_texts.clear()
+        self._shard_bookings.clear()
+        # Changes logged after this point are re-read next time, even if already seen here.
+        try:
+            stat = os.stat(self.changes_path)
+            self._changes_seen = (stat.st_ino, stat.st_size)
+        except FileNotFoundError:
+            self._changes_seen = (None, 0)
+        showtimes = load_data(self.path(name))
+        for showtime in showtimes:
+            self._shard_bookings[showtime['id']] = self._read_shard(showtime)
+        return showtimes
+
+    def _read_shard(self, showtime):
+        """Load one shard into its catalogue entry; returns the shard's bookings."""
+        shard_path = self.shard_path(showtime['id'])
+        # Stamp before reading: a change that lands in between only costs a second read.
+        stamp = self._stamp(shard_path)
+        start = time.perf_counter() if metrics.enabled else None
+        try:
+            with open(shard_path, 'r', encoding='utf-8') as file:
+                text = file.read()
+            if start is not None:
+                metrics.file_io("read", shard_path, len(text.encode('utf-8')), time.perf_counter() - start)
+        except FileNotFoundError:
+            text = None
+        shard = json.loads(text) if text else {}
+        bookings = shard.pop("bookings", [])
+        showtime.update(shard)
+        decode_showtime(showtime)
+        self._shard_stamps[showtime['id']] = stamp
+        self._shard_texts[showtime['id']] = text
+        return bookings
+
+    def _refresh_shards(self, showtimes):
+        """Re-read these shards and swap their bookings into the cached bookings table."""
+        fresh = {showtime['id']: self._read_shard(showtime) for showtime in showtimes}
+        self._shard_bookings.update(fresh)
+        cached = self._tables.get("bookings")
+        if cached is None or not fresh:
+            return
+        index = self._indexes["bookings"]
+        stale = set()
+        for showtime_id in fresh:
+            stale.update(index["showtime_id"].get(showtime_id, ()))
+        for booking_id in stale:
+            self._unindex_booking(index["id"][booking_id])
+        if stale:
+            cached[1][:] = [booking for booking in cached[1] if booking['id'] not in stale]
+        for bookings in fresh.values():
+            cached[1].extend(bookings)
+            for booking in bookings:
+                self._index_record("bookings", booking)
+
+    def _booking_index(self):
+        # Without load(): a write must not re-read the showtimes it is writing.
+        if "bookings" not in self._tables:
+            Repository.load(self, "bookings")
+        return self._indexes["bookings"]
+
+    def _shard_bookings_of(self, showtime_id):
+        index = self._booking_index()
+        return [index["id"][booking_id] for booking_id in index["showtime_id"].get(showtime_id, [])]
+
+    def _remainder(self):
+        """bookings.json's contents: bookings whose showtime is not in the catalogue."""
+        live = self._indexes["showtimes"]["id"]
+        bookings = self._tables["bookings"][1] if "bookings" in self._tables else []
+        return json.dumps([booking for booking in bookings if booking['showtime_id'] not in live], indent=4)
+
+    def save(self, name, records, reindex=True):
+        if name != "showtimes":
+            return super().save(name, records, reindex)
+        with self._lock, self.lock("tables"):
+            self._tables[name] = (self._tables.get(name, (None,))[0], records)
+            if reindex:
+                self._index_table(name, records)
+            self._write_tables((name,))
+
+    def _table_files(self, name, showtime_ids=None):
+        # showtime_ids=None is a full write: the catalogue plus every shard
+        # whose contents changed, bookings.json and an emptied change log.
+        # Otherwise only those showtimes' shards.
+        if name == "bookings":
+            live = self._indexes["showtimes"]["id"]
+            if showtime_ids is not None and all(showtime_id in live for showtime_id in showtime_ids):
+                return {}  # the shards carry them
+            self._booking_index()
+            return {self.path(name): self._remainder()}
+        if name != "showtimes":
+            return super()._table_files(name, showtime_ids)
+        self._booking_index()
+        files = {}
+        if showtime_ids is None:
+            showtimes = self._tables[name][1]
+            catalogue = [{key: value for key, value in showtime.items() if key not in SHARD_FIELDS}
+                         for showtime in showtimes]
+            files[self.path(name)] = json.dumps(catalogue, indent=4)
+            files[self.path("bookings")] = self._remainder()
+            files[self.changes_path] = ""
+        else:
+            by_id = self._indexes[name]["id"]
+            showtimes = [by_id[showtime_id] for showtime_id in showtime_ids if showtime_id in by_id]
+        for showtime in showtimes:
+            shard = {field: showtime[field] for field in SHARD_FIELDS if field in showtime}
+            shard["bookings"] = self._shard_bookings_of(showtime['id'])
+            text = json.dumps(shard, indent=4, default=encode_record)
+            if text != self._shard_texts.get(showtime['id']):
+                files[self.shard_path(showtime['id'])] = text
+        return files
+
+    def _committed(self, names, contents):
+        super()._committed([name for name in names if name not in ("showtimes", "bookings")], contents)
+        bookings_path = self.path("bookings")
+        if bookings_path in contents and "bookings" in self._tables:
+            self._tables["bookings"] = (self._stamp(bookings_path), self._tables["bookings"][1])
+        if "showtimes" not in names:
+            return
+        catalogue_path = self.path("showtimes")
+        written = []
+        for file_path, text in contents.items():
+            if os.path.dirname(file_path) == self.shard_dir and file_path != catalogue_path:
+                showtime_id = int(os.path.basename(file_path)[:-len(".json")])
+                self._shard_stamps[showtime_id] = self._stamp(file_path)
+                self._shard_texts[showtime_id] = text
+                self._shard_bookings[showtime_id] = self._shard_bookings_of(showtime_id)
+                written.append(showtime_id)
+        if catalogue_path in contents:
+            showtimes = self._tables["showtimes"][1]
+            self._tables["showtimes"] = (self._stamp(catalogue_path), showtimes)
+            # Shards of showtimes that left the catalogue are no longer referenced.
+            live = {showtime['id'] for showtime in showtimes}
+            for showtime_id in [i for i in self._shard_texts if i not in live]:
+                for file_path in (self.shard_path(showtime_id), self.shard_path(showtime_id) + ".new"):
+                    try:
+                        os.remove(file_path)
+                    except FileNotFoundError:
+                        pass
+                self._shard_stamps.pop(showtime_id, None)
+                self._shard_texts.pop(showtime_id, None)
+                self._shard_bookings.pop(showtime_id, None)
+            stamp = self._stamp(self.changes_path)
+            self._changes_seen = (stamp[0] if stamp else None, 0)
+        elif written:
+            self._log_changes(written)
+
+    def _log_changes(self, showtime_ids):
+        # Not fsynced: after a crash every process starts from a full read anyway.
+        lines = "".join(f"{showtime_id}\n" for showtime_id in showtime_ids).encode('ascii')
+        with self.lock("tables"), open(self.changes_path, 'ab') as log:
+            start = log.seek(0, os.SEEK_END)
+            log.write(lines)
+            log.flush()
+            inode = os.fstat(log.fileno()).st_ino
+        if metrics.enabled:
+            metrics.file_io("written", self.changes_path, len(lines), file_size=start + len(lines))
+        if self._changes_seen == (inode, start):
+            self._changes_seen = (inode, start + len(lines))
+
+
+# ------------------ Binary Snapshot ------------------
+
+# showtimes.bin: a file header, then one fixed-size record header per
+# showtime (the offset table, sorted by id), then each showtime's variable
+# part: seat bitmap, owners as JSON, any other fields as JSON.
+BINARY_MAGIC = b"MTSB"
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct("<4sHI")  # magic, version, record count
+BINARY_RECORD = struct.Struct("<II16sIIIIIIQIII")
+# id, movie_id, datetime, number_of_seats, total seats, seats per row,
+# available_count, sold_count, version, data offset, bitmap/owners/extra lengths
+BINARY_FIELDS = ("id", "movie_id", "datetime", "number_of_seats", "seats",
+                 "available_count", "sold_count", "version")
+
+
+class MappedSeatMap(SeatMap):
+    """
+    SeatMap backed by a slice of showtimes.bin. Only the layout is read up
+    front; the bitmap and owners are copied out of the mapped file the first
+    time anything reads them, and an untouched map is written back byte for
+    byte without being decoded.
+    """
+
+    def __init__(self, total_seats, seats_per_row, buffer, free_span, owners_span):
+        self.total = total_seats
+        self.per_row = seats_per_row
+        self._longest = None
+        self._buffer = buffer
+        self._spans = (free_span, owners_span)
+
+    def __getattr__(self, name):
+        # Only called for attributes not set yet, i.e. before the first decode.
+        if name not in ("free", "owners"):
+            raise AttributeError(name)
+        (free_start, free_end), (owners_start, owners_end) = self._spans
+        self.free = bytearray(self._buffer[free_start:free_end])
+        owners = json.loads(self._buffer[owners_start:owners_end]) if owners_end > owners_start else {}
+        self.owners = {int(idx): owner for idx, owner in owners.items()}
+        return self.__dict__[name]
+
+    def raw(self):
+        """(bitmap, owners JSON) exactly as stored, or None once decoded."""
+        if "free" in self.__dict__:
+            return None
+        return tuple(self._buffer[start:end] for start, end in self._spans)
+
+
+def encode_showtimes(showtimes):
+    """Serialise a showtimes table in the showtimes.bin format."""
+    showtimes = sorted(showtimes, key=lambda showtime: showtime['id'])
+    headers, blobs = [], []
+    offset = BINARY_HEADER.size + BINARY_RECORD.size * len(showtimes)
+    for showtime in showtimes:
+        seats = showtime['seats']
+        raw = seats.raw() if isinstance(seats, MappedSeatMap) else None
+        if raw is None:
+            owners = {str(idx): owner for idx, owner in sorted(seats.owners.items())}
+            raw = (bytes(seats.free), json.dumps(owners, separators=(",", ":")).encode() if owners else b"")
+        extra = {key: value for key, value in showtime.items() if key not in BINARY_FIELDS}
+        extra_bytes = json.dumps(extra, separators=(",", ":")).encode() if extra else b""
+        headers.append(BINARY_RECORD.pack(
+            showtime['id'], showtime['movie_id'], showtime['datetime'].encode('ascii'),
+            showtime.get('number_of_seats', seats.total), seats.total, seats.per_row,
+            showtime['available_count'], showtime['sold_count'], showtime.get('version', 0),
+            offset, len(raw[0]), len(raw[1]), len(extra_bytes)))
+        blobs.extend((raw[0], raw[1], extra_bytes))
+        offset += len(raw[0]) + len(raw[1]) + len(extra_bytes)
+    return b"".join([BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, len(showtimes))] + headers + blobs)
+
+
+def decode_showtimes(buffer):
+    """Showtime records from a showtimes.bin buffer, with lazily decoded seat maps."""
+    magic, version, count = BINARY_HEADER.unpack_from(buffer, 0)
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        raise ValueError("Not a showtimes.bin snapshot (or an unsupported version).")
+    showtimes = []
+    for (showtime_id, movie_id, show_datetime, number_of_seats, total, per_row, available_count,
+         sold_count, version, offset, free_len, owners_len, extra_len) in BINARY_RECORD.iter_unpack(
+            buffer[BINARY_HEADER.size:BINARY_HEADER.size + BINARY_RECORD.size * count]):
+        owners_start = offset + free_len
+        extra_start = owners_start + owners_len
+        showtime = {
+            "id": showtime_id,
+            "movie_id": movie_id,
+            "datetime": show_datetime.rstrip(b"\0").decode('ascii'),
+            "number_of_seats": number_of_seats,
+            "seats": MappedSeatMap(total, per_row, buffer, (offset, owners_start), (owners_start, extra_start)),
+            "available_count": available_count,
+            "sold_count": sold_count,
+            "version": version
+        }
+        if extra_len:
+            showtime.update(json.loads(buffer[extra_start:extra_start + extra_len]))
+        showtimes.append(showtime)
+    return showtimes
+
+
+class BinaryRepository(Repository):
+    """
+    JSON layout whose showtimes live in one binary snapshot, data/showtimes.bin.
+
+    Loading the showtimes unpacks the fixed-size record headers from a
+    memory-mapped file and nothing else, so listing showtimes costs the same
+    however large the halls are; a seat map is decoded only when a booking
+    screen or a commit actually reads it. Users, movies and bookings stay
+    JSON, the journal works as in the single-file layout, and
+    `migrate-binary` / `export-json` convert to and from showtimes.json.
+    """
+
+    def path(self, name):
+        if name == "showtimes":
+            return os.path.join(self.data_dir, "showtimes.bin")
+        return super().path(name)
+
+    def open(self):
+        """Build showtimes.bin from showtimes.json on first use, then open as usual."""
+        with self._lock, self.lock("tables"):
+            unconverted = (not os.path.exists(self.path("showtimes"))
+                           and os.path.exists(Repository.path(self, "showtimes")))
+        if unconverted:
+            # A snapshot-mode open folds any journal into the JSON files first,
+            # so no journal record is replayed on top of the new snapshot twice.
+            source = Repository(self.data_dir, mode="snapshot")
+            source.open()
+            try:
+                self.import_from(source)
+            except ValueError:
+                pass  # another process converted it first
+        super().open()
+
+    def import_from(self, source):
+        """One-shot copy of a single-file Repository's showtimes into showtimes.bin."""
+        with self._lock, self.lock("tables"):
+            if os.path.exists(self.path("showtimes")):
+                raise ValueError(f"{self.path('showtimes')} already exists")
+            showtimes = source.showtimes()
+            self._tables["showtimes"] = (None, showtimes)
+            self._index_table("showtimes", showtimes)
+            self._write_tables(("showtimes",))
+            self.invalidate()
+
+    def _read_table(self, name):
+        if name != "showtimes":
+            return super()._read_table(name)
+        if not os.path.exists(self.path(name)):
+            # Like load_data(): an empty file gives the table a stamp, so a
+            # record appended to the cached table is not dropped by a re-read.
+            os.makedirs(self.data_dir, exist_ok=True)
+            try:
+                with open(self.path(name), 'xb') as file:
+                    file.write(encode_showtimes([]))
+            except FileExistsError:
+                pass
+        try:
+            with open(self.path(name), 'rb') as file:
+                if os.name == 'nt':
+                    # A mapped file cannot be replaced on Windows, so read it instead.
+                    buffer = file.read()
+                else:
+                    buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return []
+        if metrics.enabled:
+            metrics.file_io("read", self.path(name), len(buffer))
+        # The mapping outlives the file object and stays valid after the
+        # file is replaced; it is released with the last seat map using it.
+        return decode_showtimes(buffer)
+
+    def save(self, name, records, reindex=True):
+        if name != "showtimes" or self.mode == "journal":
+            return super().save(name, records, reindex)
+        with self._lock, self.lock("tables"):
+            self._tables[name] = (self._tables.get(name, (None,))[0], records)
+            if reindex:
+                self._index_table(name, records)
+            self._write_tables((name,))
+
+    def _table_files(self, name, showtime_ids=None):
+        if name != "showtimes":
+            return super()._table_files(name, showtime_ids)
+        return {self.path(name): encode_showtimes(self._tables[name][1])}
+
+
+# ------------------ SQLite Backend ------------------
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL,
+    username_key TEXT NOT NULL UNIQUE,
+    password TEXT NOT NULL,
+    role TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS movies (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    genre TEXT NOT NULL,
+    duration INTEGER NOT NULL,
+    release_date TEXT NOT NULL,
+    available INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS showtimes (
+    id INTEGER PRIMARY KEY,
+    movie_id INTEGER NOT NULL,
+    datetime TEXT NOT NULL,
+    number_of_seats INTEGER NOT NULL,
+    seats_per_row INTEGER NOT NULL,
+    available_count INTEGER NOT NULL,
+    sold_count INTEGER NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0,
+    archived INTEGER NOT NULL DEFAULT 0,
+    hall_id INTEGER,
+    end_datetime TEXT
+);
+CREATE INDEX IF NOT EXISTS showtimes_by_movie ON showtimes (movie_id, datetime);
+CREATE INDEX IF NOT EXISTS showtimes_by_time ON showtimes (archived, datetime);
+CREATE TABLE IF NOT EXISTS seats (
+    showtime_id INTEGER NOT NULL,
+    label TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    user_id INTEGER,
+    booking_id INTEGER,
+    PRIMARY KEY (showtime_id, label)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS seats_by_booking ON seats (booking_id) WHERE booking_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS seats_taken ON seats (showtime_id) WHERE user_id IS NOT NULL;
+CREATE TABLE IF NOT EXISTS bookings (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    showtime_id INTEGER NOT NULL,
+    movie_id INTEGER NOT NULL,
+    datetime TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bookings_by_user ON bookings (user_id, id);
+CREATE INDEX IF NOT EXISTS bookings_by_showtime ON bookings (showtime_id);
+CREATE TABLE IF NOT EXISTS halls (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    number_of_seats INTEGER NOT NULL,
+    cleanup_minutes INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS holds (
+    id INTEGER PRIMARY KEY,
+    session TEXT NOT NULL,
+    showtime_id INTEGER NOT NULL,
+    seats TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS holds_by_deadline ON holds (expires);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    next_id INTEGER NOT NULL
+);
+"""
+
+SQL_UPSERT_USER = (
+    "INSERT INTO users (id, username, username_key, password, role) VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT(id) DO UPDATE SET username = excluded.username, username_key = excluded.username_key, "
+    "password = excluded.password, role = excluded.role")
+SQL_UPSERT_MOVIE = (
+    "INSERT INTO movies (id, title, genre, duration, release_date, available) VALUES (?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT(id) DO UPDATE SET title = excluded.title, genre = excluded.genre, duration = excluded.duration, "
+    "release_date = excluded.release_date, available = excluded.available")
+SQL_UPSERT_SHOWTIME = (
+    "INSERT INTO showtimes (id, movie_id, datetime, number_of_seats, seats_per_row, available_count, sold_count, "
+    "version, archived, hall_id, end_datetime) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT(id) DO UPDATE SET movie_id = excluded.movie_id, datetime = excluded.datetime, "
+    "number_of_seats = excluded.number_of_seats, seats_per_row = excluded.seats_per_row, "
+    "available_count = excluded.available_count, sold_count = excluded.sold_count, version = excluded.version, "
+    "hall_id = excluded.hall_id, end_datetime = excluded.end_datetime")
+SQL_UPSERT_HALL = (
+    "INSERT INTO halls (id, name, number_of_seats, cleanup_minutes) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT(id) DO UPDATE SET name = excluded.name, number_of_seats = excluded.number_of_seats, "
+    "cleanup_minutes = excluded.cleanup_minutes")
+SQL_INSERT_SEAT = "INSERT OR IGNORE INTO seats (showtime_id, label, idx) VALUES (?, ?, ?)"
+SQL_TAKE_SEAT = ("UPDATE seats SET user_id = ?, booking_id = ? "
+                 "WHERE showtime_id = ? AND label = ? AND user_id IS NULL")
+SQL_RELEASE_SEAT = "UPDATE seats SET user_id = NULL, booking_id = NULL WHERE booking_id = ? AND label = ?"
+SQL_INSERT_BOOKING = "INSERT INTO bookings (id, user_id, showtime_id, movie_id, datetime) VALUES (?, ?, ?, ?, ?)"
+SQL_SEAT_COUNTERS = ("UPDATE showtimes SET available_count = available_count - ?, sold_count = sold_count + ?, "
+                     "version = version + 1 WHERE id = ?")
+
+
+class SqliteHolds:
+    """The seat holds of a SqliteRepository, in its holds table, changed in a write transaction."""
+
+    def __init__(self, repo):
+        self.repo = repo
+        self.mutex = repo._lock
+
+    def locked(self):
+        return self.repo.transaction()
+
+    def stamp(self):
+        # Moves whenever another connection commits; this one's own writes
+        # are already in memory.
+        return self.repo._data_version()
+
+    def load(self):
+        db = self.repo.db
+        row = db.execute("SELECT next_id FROM counters WHERE name = 'holds'").fetchone()
+        holds = [{"id": hold_id, "session": session, "showtime_id": showtime_id,
+                  "seats": json.loads(seats), "expires": expires}
+                 for hold_id, session, showtime_id, seats, expires in db.execute(
+                     "SELECT id, session, showtime_id, seats, expires FROM holds WHERE expires > ? ORDER BY expires",
+                     (time.time(),))]
+        return {"next_id": row[0] if row else 1, "holds": holds}
+
+    def save(self, data):
+        db = self.repo.db
+        db.execute("DELETE FROM holds")
+        db.executemany("INSERT INTO holds (id, session, showtime_id, seats, expires) VALUES (?, ?, ?, ?, ?)",
+                       [(hold['id'], hold['session'], hold['showtime_id'], json.dumps(hold['seats']),
+                         hold['expires']) for hold in data["holds"]])
+        db.execute("INSERT INTO counters (name, next_id) VALUES ('holds', ?) "
+                   "ON CONFLICT(name) DO UPDATE SET next_id = excluded.next_id", (data["next_id"],))
+
+
+class _SeatConflict(Exception):
+    """Raised inside a SQLite transaction to roll back a booking that lost a race."""
+
+
+class SqliteRepository(Repository):
+    """
+    Repository backed by data/movies.db instead of the JSON files.
+
+    Users, movies, showtimes, seats and bookings are normalised tables in a
+    WAL-mode database. The screens still see the same cached lists of
+    records; a table is re-read only when another connection has committed
+    (PRAGMA data_version). A booking is one transaction of indexed UPDATEs
+    on the seats it takes, so nothing is rewritten in full. SQLite's own
+    locking replaces the lock files used by the JSON layout.
+    """
+
+    def __init__(self, data_dir='data'):
+        super().__init__(data_dir, mode="sqlite")
+        self._db = None
+        self._seen_version = None
+        self._pinned = False  # skip the data_version check while a batch holds the cache
+        self.holds = SeatHolds(SqliteHolds(self))
+
+    @property
+    def db_path(self):
+        return os.path.join(self.data_dir, "movies.db")
+
+    @property
+    def db(self):
+        if self._db is None:
+            os.makedirs(self.data_dir, exist_ok=True)
+            # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE.
+            self._db = sqlite3.connect(self.db_path, isolation_level=None,
+                                       check_same_thread=False, cached_statements=256)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(SQLITE_SCHEMA)
+            # Databases created before halls existed lack the showtime hall columns.
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(showtimes)")}
+            for column, kind in (("hall_id", "INTEGER"), ("end_datetime", "TEXT")):
+                if column not in columns:
+                    try:
+                        self._db.execute(f"ALTER TABLE showtimes ADD COLUMN {column} {kind}")
+                    except sqlite3.OperationalError:
+                        pass  # another process added it first
+        return self._db
+
+    @contextmanager
+    def lock(self, name):
+        with self._lock:
+            yield
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.db
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+            self.db.execute("COMMIT")
+
+    def open(self):
+        """Seed an empty database from the JSON files on first use, then archive expired showtimes."""
+        with self._lock:
+            self.invalidate()
+            if (not self.db.execute("SELECT 1 FROM users LIMIT 1").fetchone()
+                    and os.path.exists(self.path("users"))):
+                source = Repository(self.data_dir)
+                source.open()
+                try:
+                    self.import_from(source)
+                except ValueError:
+                    pass  # another process seeded it first
+        self.archive_expired()
+
+    def compact(self):
+        pass
+
+    def invalidate(self, name=None):
+        with self._lock:
+            super().invalidate(name)
+            self._seen_version = None
+
+    def _data_version(self):
+        return self.db.execute("PRAGMA data_version").fetchone()[0]
+
+    def load(self, name):
+        with self._lock:
+            version = self._seen_version if self._pinned else self._data_version()
+            if version != self._seen_version:
+                # Another connection committed since we last looked.
+                self._tables.clear()
+                self._indexes.clear()
+                self._seen_version = version
+            if name not in self._tables:
+                records = self._read_table(name)
+                self._tables[name] = (version, records)
+                self._index_table(name, records)
+            return self._tables[name][1]
+
+    def _read_table(self, name):
+        db = self.db
+        if name == "users":
+            return [{"id": user_id, "username": username, "password": password, "role": role}
+                    for user_id, username, password, role in db.execute(
+                        "SELECT id, username, password, role FROM users ORDER BY id")]
+
+        if name == "bookings":
+            booking_seats = {}
+            for booking_id, label in db.execute(
+                    "SELECT booking_id, label FROM seats WHERE booking_id IS NOT NULL ORDER BY idx"):
+                booking_seats.setdefault(booking_id, []).append(label)
+            return [{"id": booking_id,
+                     "user_id": user_id,
+                     "movie_id": movie_id,
+                     "showtime_id": showtime_id,
+                     "seats": booking_seats.get(booking_id, []),
+                     "datetime": show_datetime}
+                    for booking_id, user_id, showtime_id, movie_id, show_datetime in db.execute(
+                        "SELECT id, user_id, showtime_id, movie_id, datetime FROM bookings ORDER BY id")]
+
+        if name == "movies":
+            return [{"id": movie_id, "title": title, "genre": genre, "duration": duration,
+                     "release_date": release_date, "available": bool(available)}
+                    for movie_id, title, genre, duration, release_date, available in db.execute(
+                        "SELECT id, title, genre, duration, release_date, available FROM movies ORDER BY id")]
+
+        if name == "showtimes":
+            showtimes = {}
+            for (showtime_id, movie_id, show_datetime, total, per_row,
+                 available_count, sold_count, version, hall_id, end_datetime) in db.execute(
+                    "SELECT id, movie_id, datetime, number_of_seats, seats_per_row, available_count, "
+                    "sold_count, version, hall_id, end_datetime FROM showtimes WHERE archived = 0 ORDER BY id"):
+                showtimes[showtime_id] = {
+                    "id": showtime_id,
+                    "movie_id": movie_id,
+                    "datetime": show_datetime,
+                    "number_of_seats": total,
+                    "seats": SeatMap(total, per_row),
+                    "available_count": available_count,
+                    "sold_count": sold_count,
+                    "version": version
+                }
+                if hall_id is not None:
+                    showtimes[showtime_id].update(hall_id=hall_id, end_datetime=end_datetime)
+            # Only taken seats are read; free ones are implied by the layout.
+            for showtime_id, idx, username in db.execute(
+                    "SELECT s.showtime_id, s.idx, u.username FROM seats s JOIN users u ON u.id = s.user_id "
+                    "WHERE s.user_id IS NOT NULL"):
+                if showtime_id in showtimes:
+                    showtimes[showtime_id]['seats']._take(idx, username)
+            return list(showtimes.values())
+
+        if name == "halls":
+            return [{"id": hall_id, "name": hall_name, "number_of_seats": total, "cleanup_minutes": cleanup}
+                    for hall_id, hall_name, total, cleanup in db.execute(
+                        "SELECT id, name, number_of_seats, cleanup_minutes FROM halls ORDER BY id")]
+
+        return []
+
+    def save(self, name, records, reindex=True):
+        with self.transaction() as db:
+            existing = {row[0] for row in db.execute(
+                f"SELECT id FROM {name}" + (" WHERE archived = 0" if name == "showtimes" else ""))}
+            for record in records:
+                self._write_record(db, name, record)
+            removed = existing - {record['id'] for record in records}
+            db.executemany(f"DELETE FROM {name} WHERE id = ?", [(record_id,) for record_id in removed])
+            if name == "showtimes":
+                db.executemany("DELETE FROM seats WHERE showtime_id = ?", [(record_id,) for record_id in removed])
+        self._tables[name] = (self._seen_version, records)
+        if reindex:
+            self._index_table(name, records)
+
+    def insert(self, name, record):
+        with self._lock:
+            records = self.load(name)
+            with self.transaction() as db:
+                self._write_record(db, name, record)
+            records.append(record)
+            self._index_record(name, record)
+
+    def insert_many(self, batch):
+        rejected = []
+        with self._lock:
+            try:
+                with self.transaction() as db:
+                    self.showtimes()
+                    self._pinned = True
+                    for name, records in batch.items():
+                        table = self.load(name)
+                        for record in records:
+                            conflict = self._schedule_conflict(name, record)
+                            if conflict is not None:
+                                rejected.append((record, conflict))
+                                continue
+                            self._write_record(db, name, record)
+                            # Cached for the overlap checks of later records in the batch.
+                            table.append(record)
+                            self._index_record(name, record)
+            finally:
+                self._pinned = False
+                self.invalidate()
+        return rejected
+
+    @contextmanager
+    def _deleting(self, names, showtime_ids=()):
+        # The write transaction stands in for the showtime and table locks. Rows are
+        # deleted with their seats; the cache is re-read afterwards.
+        with self._lock:
+            try:
+                with self.transaction() as db:
+                    for name in names:
+                        self.load(name)
+                    self._pinned = True
+                    for name in names:
+                        self.load(name)
+
+                    def delete(plan):
+                        for name, ids in plan.items():
+                            rows = [(record_id,) for record_id in ids]
+                            if name == "showtimes":
+                                db.executemany("DELETE FROM seats WHERE showtime_id = ?", rows)
+                            elif name == "bookings":
+                                db.executemany("UPDATE seats SET user_id = NULL, booking_id = NULL "
+                                               "WHERE booking_id = ?", rows)
+                            db.executemany(f"DELETE FROM {name} WHERE id = ?", rows)
+
+                    yield delete
+            finally:
+                self._pinned = False
+                self.invalidate()
+
+    @contextmanager
+    def updating(self, names, showtime_ids=()):
+        # The write transaction stands in for the showtime and table locks.
+        with self._lock:
+            try:
+                with self.transaction() as db:
+                    self.load(names[0])
+                    self._pinned = True
+                    for name in names:
+                        self.load(name)
+
+                    def commit(changed):
+                        for name, records in changed.items():
+                            for record in records:
+                                self._write_record(db, name, record)
+
+                    yield commit
+            finally:
+                self._pinned = False
+                self.invalidate()
+
+    def _lock_batches(self, showtime_ids):
+        # No lock files to run out of: one transaction covers every showtime.
+        yield showtime_ids
+
+    def _write_record(self, db, name, record):
+        if name == "users":
+            db.execute(SQL_UPSERT_USER, (record['id'], record['username'], record['username'].casefold(),
+                                         record['password'], record['role']))
+        elif name == "movies":
+            db.execute(SQL_UPSERT_MOVIE, (record['id'], record['title'], record['genre'], record['duration'],
+                                          record['release_date'], int(record.get('available', True))))
+        elif name == "showtimes":
+            seats = record['seats']
+            db.execute(SQL_UPSERT_SHOWTIME, (record['id'], record['movie_id'], record['datetime'],
+                                             seats.total, seats.per_row, record['available_count'],
+                                             record['sold_count'], record.get('version', 0), 0,
+                                             record.get('hall_id'), record.get('end_datetime')))
+            # Keep seat rows in step with the layout; booked rows inside it are untouched.
+            db.execute("DELETE FROM seats WHERE showtime_id = ? AND idx >= ?", (record['id'], seats.total))
+            (seat_rows,) = db.execute("SELECT COUNT(*) FROM seats WHERE showtime_id = ?", (record['id'],)).fetchone()
+            if seat_rows < seats.total:
+                db.executemany(SQL_INSERT_SEAT, [(record['id'], seats.label(idx), idx)
+                                                 for idx in range(seat_rows, seats.total)])
+        elif name == "halls":
+            db.execute(SQL_UPSERT_HALL, (record['id'], record['name'], record['number_of_seats'],
+                                         record['cleanup_minutes']))
+
+    def next_id(self, name, count=1):
+        with self.transaction() as db:
+            row = db.execute("SELECT next_id FROM counters WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                (new_id,) = db.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {name}").fetchone()
+            else:
+                new_id = row[0]
+            db.execute("INSERT INTO counters (name, next_id) VALUES (?, ?) "
+                       "ON CONFLICT(name) DO UPDATE SET next_id = excluded.next_id", (name, new_id + count))
+            return new_id
+
+    def _commit_batch(self, records):
+        with self._lock:
+            results = []
+            dropped_holds = False
+            try:
+                with self.transaction() as db:
+                    # Loaded under the write lock, so no other connection can
+                    # change the rows between the load and this batch's writes.
+                    self.users()
+                    # data_version also moves when another connection checkpoints,
+                    # which must not drop the tables this batch reads and updates.
+                    self._pinned = True
+                    self.users()
+                    self.bookings()
+                    self.showtimes()
+                    taken = {}  # showtime id -> seats booked earlier in this batch
+                    for record in records:
+                        user = self.find_user(record['username'])
+                        if user is None or (record['op'] == "book" and 'seats' not in record and not
+                                            self._plan_seats(record, taken.get(record['showtime_id'], ()))):
+                            results.append(False)
+                            continue
+                        # Checked again here: holds are taken in write transactions, not under file locks.
+                        if record['op'] == "book" and self.holds.blocks(record['showtime_id'], record['seats'],
+                                                                        record['username']):
+                            results.append(False)
+                            continue
+                        # One savepoint per record, so a conflict only undoes that record.
+                        db.execute("SAVEPOINT record")
+                        try:
+                            if record['op'] == "book":
+                                self._book_in_db(db, user, record)
+                            else:
+                                self._cancel_in_db(db, user, record)
+                        except _SeatConflict:
+                            db.execute("ROLLBACK TO record")
+                            results.append(False)
+                        else:
+                            results.append(True)
+                            if record['op'] == "book":
+                                taken.setdefault(record['showtime_id'], set()).update(record['seats'])
+                        db.execute("RELEASE record")
+                    # The booked seats' holds go in the same transaction.
+                    if self.holds.store is not None and self.holds.drop_booked([(record['showtime_id'], record['seats'], record['username'])
+                                               for record, ok in zip(records, results)
+                                               if ok and record['op'] == "book"]):
+                        self.holds.store.save(self.holds.snapshot())
+                        dropped_holds = True
+                if dropped_holds:
+                    self.holds.saved()
+                if not all(results):
+                    self.invalidate()
+                else:
+                    # Commits that land after ours still move data_version,
+                    # so the first load after this batch drops the cache.
+                    for record in records:
+                        self._apply_record(record)
+            except Exception:
+                self.holds.forget()
+                raise
+            finally:
+                self._pinned = False
+            return results
+
+    def _book_in_db(self, db, user, record):
+        showtime_id = record['showtime_id']
+        row = db.execute("SELECT movie_id, datetime, version FROM showtimes WHERE id = ? AND archived = 0",
+                         (showtime_id,)).fetchone()
+        if row is None or len(set(record['seats'])) != len(record['seats']):
+            raise _SeatConflict()
+        movie_id, show_datetime, version = row
+        if 'version' in record and version != record['version']:
+            raise _SeatConflict()
+        booking_id = record['booking_id']
+        db.execute(SQL_INSERT_BOOKING, (booking_id, user['id'], showtime_id, movie_id, show_datetime))
+        for seat in record['seats']:
+            if db.execute(SQL_TAKE_SEAT, (user['id'], booking_id, showtime_id, seat)).rowcount != 1:
+                raise _SeatConflict()
+        n = len(record['seats'])
+        db.execute(SQL_SEAT_COUNTERS, (n, n, showtime_id))
+
+    def _cancel_in_db(self, db, user, record):
+        booking_id = record['booking_id']
+        row = db.execute("SELECT user_id, showtime_id FROM bookings WHERE id = ?", (booking_id,)).fetchone()
+        if row is None or row != (user['id'], record['showtime_id']):
+            raise _SeatConflict()
+        showtime_id = row[1]
+        released = sum(db.execute(SQL_RELEASE_SEAT, (booking_id, seat)).rowcount for seat in record['seats'])
+        if released == 0:
+            raise _SeatConflict()
+        db.execute(SQL_SEAT_COUNTERS, (-released, -released, showtime_id))
+        if db.execute("SELECT 1 FROM seats WHERE booking_id = ? LIMIT 1", (booking_id,)).fetchone() is None:
+            db.execute("DELETE FROM bookings WHERE id = ?", (booking_id,))
+
+    def archive_expired(self, now=None):
+        cutoff = ((now or datetime.now()) - timedelta(hours=ARCHIVE_AFTER_HOURS)).strftime(SHOWTIME_FORMAT)
+        with self.transaction() as db:
+            archived = db.execute("UPDATE showtimes SET archived = 1 WHERE archived = 0 AND datetime < ?",
+                                  (cutoff,)).rowcount
+        if archived:
+            self.invalidate("showtimes")
+        return archived
+
+    def import_from(self, source):
+        """One-shot copy of every table from a JSON Repository into an empty database."""
+        with self._lock:
+            archived = load_data(source.archive_path) if os.path.exists(source.archive_path) else []
+            with self.transaction() as db:
+                if db.execute("SELECT 1 FROM users LIMIT 1").fetchone():
+                    raise ValueError(f"{self.db_path} already contains data")
+                for name in ("users", "movies", "halls", "showtimes"):
+                    for record in source.load(name):
+                        self._write_record(db, name, record)
+                for showtime in archived:
+                    showtime['seats'] = SeatMap.from_json(showtime['seats'], showtime.get('number_of_seats'))
+                    refresh_seat_counters(showtime)
+                    self._write_record(db, "showtimes", showtime)
+                    db.execute("UPDATE showtimes SET archived = 1 WHERE id = ?", (showtime['id'],))
+
+                for showtime in source.showtimes() + archived:
+                    for idx, username in showtime['seats'].owners.items():
+                        owner = source.find_user(username)
+                        db.execute("UPDATE seats SET user_id = ? WHERE showtime_id = ? AND idx = ?",
+                                   (owner['id'] if owner else None, showtime['id'], idx))
+                for booking in source.bookings():
+                    db.execute(SQL_INSERT_BOOKING, (booking['id'], booking['user_id'], booking['showtime_id'],
+                                                    booking['movie_id'], booking['datetime']))
+                    db.executemany("UPDATE seats SET booking_id = ? WHERE showtime_id = ? AND label = ? "
+                                   "AND user_id = ? AND booking_id IS NULL",
+                                   [(booking['id'], booking['showtime_id'], seat, booking['user_id'])
+                                    for seat in booking['seats']])
+
+                meta_path = os.path.join(source.data_dir, "meta.json")
+                counters = load_data(meta_path).get("next_ids", {}) if os.path.exists(meta_path) else {}
+                for name, next_id in counters.items():
+                    db.execute("INSERT OR REPLACE INTO counters (name, next_id) VALUES (?, ?)", (name, next_id))
+            self.invalidate()
+
+
+def make_repository(data_dir='data'):
+    if STORAGE_BACKEND == "sqlite":
+        return SqliteRepository(data_dir)
+    if STORAGE_LAYOUT == "sharded":
+        return ShardedRepository(data_dir)
+    if STORAGE_LAYOUT == "binary":
+        return BinaryRepository(data_dir)
+    return Repository(data_dir)
+
+
+repo = make_repository()
+
 
 def update_users_data(updated_user):
-    file_path = 'data/users.json'
-    users = load_data(file_path)
-    for idx, user in enumerate(users):
-        if user['username'] == updated_user['username']:
-            
-            users[idx] = updated_user
-            break
-    save_data(file_path, users)
+    """Copy a user's fields onto the current row, re-read under the users lock, and write it."""
+    with repo.updating(("users",)) as commit:
+        user = repo.find_user(updated_user['username'])
+        if user is None:
+            return None
+        if user is not updated_user:
+            user.update(updated_user)
+        commit({"users": [user]})
+        return user
+
+# ------------------ Password Hashing ------------------
+
+PASSWORD_SCHEME = os.environ.get("MOVIE_PASSWORD_SCHEME", "pbkdf2_sha256")  # "pbkdf2_sha256" or "scrypt"
+PBKDF2_ITERATIONS = int(os.environ.get("MOVIE_PBKDF2_ITERATIONS", "200000"))
+SCRYPT_PARAMS = os.environ.get("MOVIE_SCRYPT_PARAMS", "16384,8,1")  # n,r,p
+AUTH_CACHE_SIZE = int(os.environ.get("MOVIE_AUTH_CACHE_SIZE", "1024"))  # remembered logins
+AUTH_CACHE_TTL = float(os.environ.get("MOVIE_AUTH_CACHE_TTL", "300"))  # seconds a login is remembered
+
+
+def _pbkdf2_sha256(password, salt, params):
+    return hashlib.pbkdf2_hmac("sha256", password, salt, int(params))
+
+def _scrypt(password, salt, params):
+    n, r, p = (int(value) for value in params.split(","))
+    return hashlib.scrypt(password, salt=salt, n=n, r=r, p=p, maxmem=2 * 128 * r * (n + p + 2))
+
+# Scheme name -> (derive(password, salt, params), current params). Stored
+# hashes look like "scheme$params$salt$hash" with base64 salt and hash.
+PASSWORD_SCHEMES = {"pbkdf2_sha256": (_pbkdf2_sha256, str(PBKDF2_ITERATIONS))}
+if hasattr(hashlib, "scrypt"):  # needs Python built against OpenSSL 1.1+
+    PASSWORD_SCHEMES["scrypt"] = (_scrypt, SCRYPT_PARAMS)
+
+
+@metrics.timed("movie_hash_password_seconds")
+def hash_password(password, scheme=None):
+    scheme = scheme or PASSWORD_SCHEME
+    if scheme not in PASSWORD_SCHEMES:
+        raise ValueError(f"Unknown password scheme '{scheme}'.")
+    derive, params = PASSWORD_SCHEMES[scheme]
+    salt = os.urandom(16)
+    digest = derive(password.encode(), salt, params)
+    return "$".join((scheme, params, base64.b64encode(salt).decode('ascii'), base64.b64encode(digest).decode('ascii')))
+
+@metrics.timed("movie_verify_password_seconds")
+def verify_password(password, stored):
+    """Check a password against a stored hash of any known scheme."""
+    if "$" not in stored:
+        # Unsalted SHA-256 hex digests from before salted hashes.
+        return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+    try:
+        scheme, params, salt, digest = stored.split("$")
+        derive = PASSWORD_SCHEMES[scheme][0]
+        expected = base64.b64decode(digest)
+        return hmac.compare_digest(derive(password.encode(), base64.b64decode(salt), params), expected)
+    except (KeyError, ValueError):
+        return False
+
+def needs_rehash(stored):
+    """True if a stored hash is not in the configured scheme with the configured parameters."""
+    if PASSWORD_SCHEME not in PASSWORD_SCHEMES:
+        return False
+    return not stored.startswith(f"{PASSWORD_SCHEME}${PASSWORD_SCHEMES[PASSWORD_SCHEME][1]}$")
+
+
+class CredentialCache:
+    """
+    Bounded, expiring memo of recently verified logins, so repeat
+    authentications (every HTTP request carries its credentials) skip the
+    KDF. Entries are keyed by an HMAC of username and password under a
+    per-process secret and only count while the user's stored hash is
+    unchanged; the least recently used entry is evicted first.
+    """
+
+    def __init__(self, max_entries=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._secret = os.urandom(32)
+        self._entries = OrderedDict()  # key -> (stored hash, expiry time)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, username, password):
+        return hmac.new(self._secret, f"{username.casefold()}\0{password}".encode(), hashlib.sha256).digest()
+
+    def check(self, username, password, stored):
+        key = self._key(username, password)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != stored or entry[1] <= self.clock():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return False
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True
+
+    def add(self, username, password, stored):
+        if self.max_entries <= 0:
+            return
+        key = self._key(username, password)
+        with self._lock:
+            self._entries[key] = (stored, self.clock() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
 
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries,
+                    "hits": self.hits, "misses": self.misses}
 
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+
+credential_cache = CredentialCache()
+
+# ------------------ Sessions ------------------
+
+SESSION_IDLE_SECONDS = float(os.environ.get("MOVIE_SESSION_IDLE", "1800"))  # idle time before a session ends
+
+
+class SessionTable:
+    """
+    Logged-in sessions, keyed by opaque random tokens.
+    A session keeps a reference to the user's record in the repository
+    (swapped for the fresh one if the users table is re-read), so nothing
+    is copied or reloaded per screen. Sessions are kept in least recently
+    used order and those idle longer than idle_timeout are evicted from the
+    front, so expiry never scans live sessions. Any number of sessions can
+    be open in one process.
+    """
+
+    def __init__(self, idle_timeout=SESSION_IDLE_SECONDS, clock=time.monotonic):
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        self._sessions = OrderedDict()  # token -> {"user": record, "last_seen": time}
+        self._lock = threading.Lock()
+
+    def open(self, user):
+        token = secrets.token_urlsafe(32)
+        with self._lock:
+            self._evict()
+            self._sessions[token] = {"user": user, "last_seen": self.clock()}
+        return token
+
+    def user(self, token):
+        """The session's user record, or None for an unknown, closed or idle token."""
+        with self._lock:
+            self._evict()
+            session = self._sessions.get(token)
+            if session is None:
+                return None
+            user = repo.get("users", session['user']['id'])
+            if user is None:
+                del self._sessions[token]  # the account is gone
+                return None
+            session['user'] = user
+            session['last_seen'] = self.clock()
+            self._sessions.move_to_end(token)
+            return user
+
+    def close(self, token):
+        with self._lock:
+            return self._sessions.pop(token, None) is not None
+
+    def __len__(self):
+        with self._lock:
+            self._evict()
+            return len(self._sessions)
+
+    def _evict(self):
+        cutoff = self.clock() - self.idle_timeout
+        while self._sessions:
+            token, session = next(iter(self._sessions.items()))
+            if session['last_seen'] > cutoff:
+                break
+            del self._sessions[token]
+
+
+sessions = SessionTable()
+
+# ------------------ Booking Service ------------------
+# Headless entry points shared by the CLI screens and any other client.
+
+
+class ServiceError(Exception):
+    """A request the booking service refused; the message is shown to the user."""
+
+
+class SeatUnavailable(ServiceError):
+    """Some of the requested seats are taken or do not exist."""
+
+    def __init__(self, seats):
+        super().__init__(f"These seats are invalid or unavailable: {', '.join(seats)}")
+        self.seats = seats
+
+
+def register_user(username, password, role="user", password_hash=None):
+    """Create an account. password_hash lets callers run the KDF off this thread."""
+    if repo.find_user(username):
+        raise ServiceError("Username already exists. Please try a different one.")
+    new_user = {
+        "id": repo.next_id("users"),
+        "username": username,
+        "password": password_hash or hash_password(password),
+        "role": role
+    }
+    # Checked again under the users lock: another process may have taken the name since.
+    with repo.updating(("users",)) as commit:
+        if repo.find_user(username):
+            raise ServiceError("Username already exists. Please try a different one.")
+        repo.load("users").append(new_user)
+        commit({"users": [new_user]})
+    return new_user
+
+def authenticate(username, password):
+    """Return the user record for valid credentials, otherwise None."""
+    user = repo.find_user(username)
+    if user is None:
+        return None
+    stored = user['password']
+    if credential_cache.check(user['username'], password, stored):
+        return user
+    if not verify_password(password, stored):
+        return None
+    if needs_rehash(stored):
+        user = store_rehash(user, stored, hash_password(password)) or user
+    credential_cache.add(user['username'], password, user['password'])
+    return user
+
+def start_session(username, password):
+    """Log in and return a new session token, or None for invalid credentials."""
+    user = authenticate(username, password)
+    return sessions.open(user) if user else None
+
+def store_rehash(user, old_hash, new_hash):
+    """
+    Upgrade a user's password hash, unless it changed since old_hash was
+    read. Returns the user's current record (None if the account is gone).
+    """
+    with repo.updating(("users",)) as commit:
+        record = repo.find_user(user['username'])
+        if record is not None and record['password'] == old_hash:
+            record['password'] = new_hash
+            commit({"users": [record]})
+        return record
+
+def list_movies(only_available=True):
+    movies = repo.movies()
+    if only_available:
+        movies = [movie for movie in movies if movie.get("available", False)]
+    return movies
+
+def list_upcoming(movie_id=None, now=None):
+    """Showtimes that have not started yet, in time order."""
+    return repo.upcoming_showtimes(movie_id, now)
+
+def check_booking(user, showtime_id, seats, now=None):
+    """
+    Validate a booking request without committing it. Returns the showtime
+    and the de-duplicated seat labels.
+    """
+    showtime = repo.get("showtimes", showtime_id)
+    now_key = (now or datetime.now()).strftime(SHOWTIME_FORMAT)
+    if showtime is None or showtime['datetime'] <= now_key:
+        raise ServiceError("No upcoming showtime with that ID.")
+    movie = repo.get("movies", showtime['movie_id'])
+    if movie is None or not movie.get("available", False):
+        raise ServiceError("This movie is not open for booking.")
+
+    seats = list(dict.fromkeys(seat.strip() for seat in seats if seat.strip()))
+    if not seats:
+        raise ServiceError("No seats selected.")
+    open_map = open_seats(showtime, user)
+    unavailable = [seat for seat in seats if not open_map.is_available(seat)]
+    if unavailable:
+        raise SeatUnavailable(unavailable)
+    return showtime, seats
+
+def open_seats(showtime, user=None):
+    """The showtime's seat map without the seats other buyers are holding."""
+    held = repo.holds.held_seats(showtime['id'], exclude=user['username'] if user else None)
+    if not held:
+        return showtime['seats']
+    seat_map = showtime['seats'].copy()
+    for seat in held:
+        if seat_map.is_available(seat):
+            seat_map.assign(seat, "")
+    return seat_map
+
+def seats_left(showtime):
+    """Seats that are neither sold nor held."""
+    return max(0, showtime['available_count'] - repo.holds.held_count(showtime['id']))
+
+def booking_summary(showtime, seats):
+    return {
+        "movie_id": showtime['movie_id'],
+        "showtime_id": showtime['id'],
+        "seats": seats,
+        "datetime": showtime['datetime']
+    }
+
+def book(user, showtime_id, seats, now=None):
+    """Book seats of an upcoming showtime for user. Returns the new booking."""
+    showtime, seats = check_booking(user, showtime_id, seats, now)
+    if not repo.record_booking(user['username'], showtime_id, seats):
+        # Someone else committed first.
+        raise SeatUnavailable(seats)
+    return booking_summary(showtime, seats)
+
+def best_seats(showtime_id, count, user=None):
+    """The best available block of count seats for a showtime (see SeatMap.best_available)."""
+    if count < 1:
+        raise ServiceError("Choose at least one seat.")
+    showtime = repo.get("showtimes", showtime_id)
+    if showtime is None:
+        raise ServiceError("No upcoming showtime with that ID.")
+    seats = open_seats(showtime, user).best_available(count)
+    if seats is None:
+        raise ServiceError(f"Cannot seat {count}: only {seats_left(showtime)} seat(s) left.")
+    return seats
+
+def book_best(user, showtime_id, count, now=None):
+    """
+    Book the best available block of count seats. The block is picked
+    again by the commit, against the seats as they are then, so a buyer
+    who wins a race only moves this party, it does not fail the booking.
+    """
+    showtime, _ = check_booking(user, showtime_id, best_seats(showtime_id, count, user), now)
+    record = repo.best_seats_record(user['username'], showtime_id, count)
+    if not repo.commit_batch([record])[0]:
+        raise ServiceError(f"Cannot seat {count}: only {seats_left(showtime)} seat(s) left.")
+    return booking_summary(showtime, record['seats'])
+
+def hold_seats(user, showtime_id, seats, now=None):
+    """Hold seats for user for HOLD_TTL_SECONDS so they can be confirmed without a race."""
+    showtime, seats = check_booking(user, showtime_id, seats, now)
+    hold_id = repo.hold_seats(user['username'], showtime_id, seats)
+    if hold_id is None:
+        raise SeatUnavailable(seats)
+    return {"hold_id": hold_id, "showtime_id": showtime_id, "seats": seats, "expires_in": repo.holds.ttl}
+
+def check_hold(user, hold_id, now=None):
+    """Validate confirming a hold without committing it. Returns the showtime and seats."""
+    hold = repo.holds.get(hold_id)
+    if hold is None or hold['session'] != user['username']:
+        raise ServiceError("Your seat hold has expired. Please pick your seats again.")
+    return check_booking(user, hold['showtime_id'], hold['seats'], now)
+
+def confirm_hold(user, hold_id, now=None):
+    """
+    Turn a hold into a booking. The hold is dropped by the same commit
+    (just after it in journal mode and in the sharded layout).
+    """
+    showtime, seats = check_hold(user, hold_id, now)
+    if not repo.record_booking(user['username'], showtime['id'], seats):
+        raise SeatUnavailable(seats)
+    return booking_summary(showtime, seats)
+
+def release_hold(user, hold_id):
+    hold = repo.holds.get(hold_id)
+    if hold is not None and hold['session'] == user['username']:
+        repo.holds.release(hold_id)
+
+def list_bookings(user):
+    """The user's bookings as (booking_id, booking, showtime), skipping removed showtimes."""
+    record = repo.find_user(user['username'])
+    result = []
+    for booking in repo.bookings_for_user(record['id']) if record else []:
+        showtime = repo.get("showtimes", booking['showtime_id'])
+        if showtime:
+            result.append((booking['id'], booking, showtime))
+    return result
+
+def check_cancellation(user, booking_id, seats=None):
+    """Validate a cancellation without committing it. Returns the seats to release."""
+    record = repo.find_user(user['username'])
+    booking = repo.get("bookings", booking_id)
+    if record is None or booking is None or booking['user_id'] != record['id']:
+        raise ServiceError("Invalid booking selection.")
+    if repo.get("showtimes", booking['showtime_id']) is None:
+        raise ServiceError("Showtime not found. Cannot modify this booking.")
+
+    if seats is None:
+        seats_to_cancel = list(booking['seats'])
+    else:
+        seats_to_cancel = [seat.strip() for seat in seats if seat.strip() in booking['seats']]
+        if not seats_to_cancel:
+            raise ServiceError("No valid seats selected.")
+    return seats_to_cancel
+
+def cancel(user, booking_id, seats=None):
+    """Cancel some seats of a booking, or all of them when seats is None. Returns the cancelled seats."""
+    seats_to_cancel = check_cancellation(user, booking_id, seats)
+    # Release the seats and shrink (or drop) the booking in one record
+    if not repo.record_cancellation(user['username'], booking_id, seats_to_cancel):
+        raise ServiceError("This booking changed in the meantime. Please try again.")
+    return seats_to_cancel
+
+def _delete(name, record_id, cascade_bookings, what):
+    plan = repo.delete_cascade(name, record_id, cascade_bookings)
+    if plan is None:
+        if repo.get(name, record_id) is None:
+            raise ServiceError(f"{what} not found.")
+        raise ServiceError(f"{what} has bookings. Confirm deleting them too.")
+    return plan
+
+def delete_movie(movie_id, cascade_bookings=False):
+    """
+    Delete a movie and its showtimes. Refused if anyone booked one of them,
+    unless cascade_bookings. Returns the {table: ids} deleted.
+    """
+    return _delete("movies", movie_id, cascade_bookings, "Movie")
+
+def delete_showtime(showtime_id, cascade_bookings=False):
+    """Delete a showtime; its bookings go too only with cascade_bookings. Returns the {table: ids} deleted."""
+    return _delete("showtimes", showtime_id, cascade_bookings, "Showtime")
+
+def sweep_step():
+    """Run one orphan sweep step, reporting failures instead of raising (it runs from hooks)."""
+    try:
+        return repo.sweep_orphans()
+    except Exception as e:
+        print(f"⚠️ Orphan sweep failed: {e}", file=sys.stderr)
+        return None
+
+def archive_step():
+    """Archive expired showtimes, reporting failures instead of raising (it runs on a timer)."""
+    try:
+        return repo.archive_expired()
+    except Exception as e:
+        print(f"⚠️ Archiving expired showtimes failed: {e}", file=sys.stderr)
+        return 0
+
+# ------------------ Bulk Import ------------------
+# Movies and showtimes from CSV or JSONL files, checked with the same
+# rules as the Add Movie / Add Showtime screens and committed in one write.
+
+IMPORT_ERRORS_SHOWN = 20  # bad rows listed before the rest are only counted
+
+
+def read_rows(file_path):
+    """Yield (line number, row) from a .csv or .jsonl file one row at a time."""
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension not in (".csv", ".jsonl", ".ndjson"):
+        raise ServiceError(f"Unsupported file type '{extension}'. Use .csv or .jsonl.")
+    with open(file_path, 'r', newline='', encoding='utf-8') as file:
+        if extension == ".csv":
+            reader = csv.DictReader(file)
+            for row in reader:
+                yield reader.line_num, row
+            return
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_number, row
+
+def _field(row, *names):
+    for name in names:
+        value = row.get(name)
+        if value is not None and str(value).strip() != "":
+            return str(value).strip()
+    return ""
+
+def _positive_int(value, what):
+    try:
+        number = int(value)
+    except ValueError:
+        raise ServiceError(f"Invalid {what.lower()}. Please enter a number.")
+    if number <= 0:
+        raise ServiceError(f"{what} must be a positive integer.")
+    return number
+
+def movie_from_row(row):
+    """A movie (without an id) from an import row; raises ServiceError like add_movie would."""
+    title = _field(row, "title")
+    if not title:
+        raise ServiceError("Movie title is required.")
+    duration = _positive_int(_field(row, "duration"), "Duration")
+    release_date = _field(row, "release_date")
+    try:
+        datetime.strptime(release_date, "%Y-%m-%d")
+    except ValueError:
+        raise ServiceError("Invalid date format. Please use YYYY-MM-DD.")
+    available = _field(row, "available").lower() or "yes"
+    if available not in ("yes", "no", "true", "false", "1", "0"):
+        raise ServiceError("Invalid input for availability. Please enter 'yes' or 'no'.")
+    return {"id": None, "title": title, "genre": _field(row, "genre"), "duration": duration,
+            "release_date": release_date, "available": available in ("yes", "true", "1")}
+
+def showtime_from_row(row, movies_by_title):
+    """
+    A showtime (without an id) from an import row and the movie it is for.
+    The movie is given by movie_id, or by title so a showtime can refer to
+    a movie imported in the same run. hall_id is optional; without
+    number_of_seats the hall's capacity is used.
+    """
+    movie_id = _field(row, "movie_id")
+    if movie_id:
+        try:
+            movie = repo.get("movies", int(movie_id))
+        except ValueError:
+            raise ServiceError("Invalid movie ID.")
+    else:
+        movie = movies_by_title.get(_field(row, "movie", "title").casefold())
+    if movie is None:
+        raise ServiceError("Movie not found.")
+    datetime_str = _field(row, "datetime")
+    try:
+        datetime.strptime(datetime_str, SHOWTIME_FORMAT)
+    except ValueError:
+        raise ServiceError("Invalid datetime format. Use YYYY-MM-DD HH:MM.")
+    hall = None
+    if _field(row, "hall_id"):
+        try:
+            hall = repo.get("halls", int(_field(row, "hall_id")))
+        except ValueError:
+            raise ServiceError("Invalid hall ID.")
+        if hall is None:
+            raise ServiceError("Hall not found.")
+    seats = _field(row, "number_of_seats", "seats")
+    if not seats and hall is None:
+        raise ServiceError("Number of seats is required without a hall.")
+    number_of_seats = _positive_int(seats, "Seat number") if seats else hall['number_of_seats']
+    return {"datetime": datetime_str, "number_of_seats": number_of_seats, "hall": hall}, movie
+
+def import_catalog(movies_path=None, showtimes_path=None):
+    """
+    Import movies and/or showtimes. Bad rows are skipped and reported as
+    (file, line, message); the valid ones get ids from one reservation per
+    table and are committed in a single write. Returns
+    (movies added, showtimes added, errors).
+    """
+    errors = []
+    movies_by_title = {movie['title'].casefold(): movie for movie in repo.movies()}
+    new_movies = []
+    new_showtimes = []  # (showtime, movie, file, line) until the movie ids are known
+
+    for file_path, kind in ((movies_path, "movies"), (showtimes_path, "showtimes")):
+        if not file_path:
+            continue
+        for line_number, row in read_rows(file_path):
+            try:
+                if not isinstance(row, dict):
+                    raise ServiceError("Row is not a JSON object.")
+                if kind == "movies":
+                    movie = movie_from_row(row)
+                    if movie['title'].casefold() in movies_by_title:
+                        raise ServiceError("Movie with this title already exists.")
+                    movies_by_title[movie['title'].casefold()] = movie
+                    new_movies.append(movie)
+                else:
+                    new_showtimes.append(showtime_from_row(row, movies_by_title) + (file_path, line_number))
+            except ServiceError as e:
+                errors.append((file_path, line_number, str(e)))
+
+    if new_movies:
+        first_id = repo.next_id("movies", len(new_movies))
+        for movie_id, movie in enumerate(new_movies, start=first_id):
+            movie['id'] = movie_id
+    showtimes = []
+    lines = {}
+    if new_showtimes:
+        first_id = repo.next_id("showtimes", len(new_showtimes))
+        for showtime_id, (showtime, movie, file_path, line_number) in enumerate(new_showtimes, start=first_id):
+            showtimes.append(new_showtime(showtime_id, movie, showtime['datetime'],
+                                          showtime['number_of_seats'], showtime['hall']))
+            lines[showtime_id] = (file_path, line_number)
+    rejected = repo.insert_many({"movies": new_movies, "showtimes": showtimes})
+    for showtime, conflict in rejected:
+        errors.append(lines[showtime['id']] + (f"The hall is taken by showtime ID {conflict} at that time.",))
+    errors.sort(key=lambda error: (error[0] != movies_path, error[1]))
+    return len(new_movies), len(showtimes) - len(rejected), errors
+
+def new_showtime(showtime_id, movie, datetime_str, number_of_seats, hall=None):
+    """
+    A showtime record with every seat available. In a hall it also gets
+    the hall and the end of its slot: the movie's duration plus the hall's
+    cleanup time.
+    """
+    showtime = {
+        "id": showtime_id,
+        "movie_id": movie['id'],
+        "datetime": datetime_str,
+        "number_of_seats": number_of_seats,
+        "seats": SeatMap(number_of_seats),
+        "available_count": number_of_seats,
+        "sold_count": 0,
+        "version": 0
+    }
+    if hall is not None:
+        showtime.update(hall_id=hall['id'], end_datetime=slot_end(datetime_str, movie, hall))
+    return showtime
+
+# ------------------ Halls & Scheduling ------------------
+# A showtime in a hall occupies [datetime, end_datetime): the movie plus
+# the hall's cleanup time. The repository keeps each hall's slots in a
+# sorted interval index, so a conflict check is a binary search.
+
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+SCHEDULE_MAX_WEEKS = 52
+
+
+def slot_end(datetime_str, movie, hall):
+    start = datetime.strptime(datetime_str, SHOWTIME_FORMAT)
+    return (start + timedelta(minutes=movie['duration'] + hall['cleanup_minutes'])).strftime(SHOWTIME_FORMAT)
+
+def add_hall(name, number_of_seats, cleanup_minutes=HALL_CLEANUP_MINUTES):
+    """Create an auditorium. Returns the new hall."""
+    name = name.strip()
+    if not name:
+        raise ServiceError("Hall name is required.")
+    if any(hall['name'].casefold() == name.casefold() for hall in repo.halls()):
+        raise ServiceError("A hall with this name already exists.")
+    if number_of_seats <= 0:
+        raise ServiceError("Seat number must be positive.")
+    if cleanup_minutes < 0:
+        raise ServiceError("Cleanup time cannot be negative.")
+    hall = {"id": repo.next_id("halls"), "name": name, "number_of_seats": number_of_seats,
+            "cleanup_minutes": cleanup_minutes}
+    repo.insert("halls", hall)
+    return hall
+
+def _movie_and_hall(movie_id, hall_id):
+    movie = repo.get("movies", movie_id)
+    if movie is None:
+        raise ServiceError("Movie not found.")
+    hall = None
+    if hall_id is not None:
+        hall = repo.get("halls", hall_id)
+        if hall is None:
+            raise ServiceError("Hall not found.")
+    return movie, hall
+
+def create_showtime(movie_id, datetime_str, number_of_seats=None, hall_id=None):
+    """
+    Add one showtime. In a hall it must not overlap the hall's other
+    showtimes, and number_of_seats defaults to the hall's capacity.
+    """
+    movie, hall = _movie_and_hall(movie_id, hall_id)
+    if number_of_seats is None:
+        if hall is None:
+            raise ServiceError("Number of seats is required without a hall.")
+        number_of_seats = hall['number_of_seats']
+    showtime = new_showtime(repo.next_id("showtimes"), movie, datetime_str, number_of_seats, hall)
+    for _, conflict in repo.insert_many({"showtimes": [showtime]}):
+        raise ServiceError(f"Hall '{hall['name']}' is taken by showtime ID {conflict} at that time.")
+    return showtime
+
+def check_reschedule(showtime, movie_id, datetime_str):
+    """
+    The end of a hall showtime's slot if it moved to this movie and start,
+    or ServiceError if that overlaps another showtime in the hall.
+    """
+    hall = repo.get("halls", showtime['hall_id'])
+    movie = repo.get("movies", movie_id)
+    if hall is None or movie is None:
+        raise ServiceError("This showtime's hall or movie no longer exists.")
+    end = slot_end(datetime_str, movie, hall)
+    conflict = repo.hall_conflict(hall['id'], datetime_str, end, ignore_id=showtime['id'])
+    if conflict is not None:
+        raise ServiceError(f"Hall '{hall['name']}' is taken by showtime ID {conflict} at that time.")
+    return end
+
+def update_showtime(showtime_id, movie_id=None, datetime_str=None, number_of_seats=None):
+    """
+    Change a showtime's movie, start and/or number of seats. The showtime
+    is re-read under its lock and only these fields change, so seats sold
+    while the admin was editing stay sold; a hall showtime may only move to
+    a free slot, and the seat count cannot drop below a sold seat. Returns
+    the updated showtime.
+    """
+    with repo.updating(("showtimes",), [showtime_id]) as commit:
+        showtime = repo.get("showtimes", showtime_id)
+        if showtime is None:
+            raise ServiceError("Showtime not found.")
+        movie_id = showtime['movie_id'] if movie_id is None else movie_id
+        datetime_str = datetime_str or showtime['datetime']
+        if repo.get("movies", movie_id) is None:
+            raise ServiceError("Movie not found.")
+        if showtime.get('hall_id') is not None and (movie_id, datetime_str) != (showtime['movie_id'],
+                                                                               showtime['datetime']):
+            showtime['end_datetime'] = check_reschedule(showtime, movie_id, datetime_str)
+        showtime['movie_id'] = movie_id
+        showtime['datetime'] = datetime_str
+        if number_of_seats is not None and number_of_seats != showtime['number_of_seats']:
+            sold = [idx for idx in showtime['seats'].owners if idx >= number_of_seats]
+            if sold:
+                # Their bookings would point at seats that no longer exist.
+                raise ServiceError(f"Seat {showtime['seats'].label(max(sold))} is sold; "
+                                   f"this showtime needs at least {max(sold) + 1} seats.")
+            # New seats are added as available, seats past the new count are dropped
+            showtime['number_of_seats'] = number_of_seats
+            showtime['seats'].resize(number_of_seats)
+            refresh_seat_counters(showtime)
+        showtime['version'] = showtime.get('version', 0) + 1
+        commit({"showtimes": [showtime]})
+    return showtime
+
+def update_movie(movie_id, title=None, genre=None, duration=None, release_date=None, available=None):
+    """
+    Change a movie's details. A new duration moves the end of every hall
+    showtime of the movie; if any of them would then overlap the next
+    showtime in its hall, nothing changes and ServiceError lists the
+    conflicts. Returns the updated movie.
+    """
+    if duration is not None and duration <= 0:
+        raise ServiceError("Duration must be positive.")
+    in_halls = [s['id'] for s in repo.showtimes_for_movie(movie_id) if s.get('hall_id') is not None]
+    while True:
+        with repo.updating(("movies", "showtimes"), in_halls) as commit:
+            movie = repo.get("movies", movie_id)
+            if movie is None:
+                raise ServiceError("Movie not found.")
+            showtimes = [s for s in repo.showtimes_for_movie(movie_id) if s.get('hall_id') is not None]
+            if not {showtime['id'] for showtime in showtimes} <= set(in_halls):
+                # Scheduled since the first look: take those showtimes' locks too.
+                in_halls = [showtime['id'] for showtime in showtimes]
+                continue
+            moved = []
+            if duration is not None and duration != movie['duration']:
+                conflicts = []
+                for showtime in showtimes:
+                    hall = repo.get("halls", showtime['hall_id'])
+                    if hall is None:
+                        continue
+                    end = slot_end(showtime['datetime'], dict(movie, duration=duration), hall)
+                    conflict = repo.hall_conflict(hall['id'], showtime['datetime'], end, ignore_id=showtime['id'])
+                    if conflict is not None:
+                        conflicts.append(f"showtime ID {showtime['id']} would overlap showtime ID {conflict} "
+                                         f"in hall '{hall['name']}'")
+                    moved.append((showtime, end))
+                if conflicts:
+                    raise ServiceError("The new duration does not fit: " + "; ".join(conflicts) + ".")
+            for showtime, end in moved:
+                showtime['end_datetime'] = end
+            for key, value in (("title", title), ("genre", genre), ("duration", duration),
+                               ("release_date", release_date), ("available", available)):
+                if value is not None:
+                    movie[key] = value
+            commit({"movies": [movie], "showtimes": [showtime for showtime, _ in moved]})
+        return movie
+
+def schedule_recurring(movie_id, hall_id, first_day, weeks, times, weekdays=WEEKDAYS):
+    """
+    Create a movie's showtimes in a hall at each of times ("HH:MM") on the
+    chosen weekdays, for weeks weeks from first_day ("YYYY-MM-DD"), in one
+    write. Slots that overlap an existing showtime (or an earlier slot of
+    this run) are skipped. Returns (created showtimes, [(datetime, id of
+    the showtime in the way)]).
+    """
+    movie, hall = _movie_and_hall(movie_id, hall_id)
+    if hall is None:
+        raise ServiceError("A recurring schedule needs a hall.")
+    try:
+        first = datetime.strptime(first_day, "%Y-%m-%d")
+    except ValueError:
+        raise ServiceError("Invalid date format. Please use YYYY-MM-DD.")
+    if not 1 <= weeks <= SCHEDULE_MAX_WEEKS:
+        raise ServiceError(f"Weeks must be between 1 and {SCHEDULE_MAX_WEEKS}.")
+    try:
+        offsets = sorted({timedelta(hours=clock.hour, minutes=clock.minute)
+                          for clock in (datetime.strptime(time_str.strip(), "%H:%M") for time_str in times)})
+    except ValueError:
+        raise ServiceError("Invalid time format. Use HH:MM.")
+    days = {day.strip().lower()[:3] for day in weekdays}
+    if not offsets or not days or not days <= set(WEEKDAYS):
+        raise ServiceError(f"Give at least one time and weekdays from: {', '.join(WEEKDAYS)}.")
+
+    starts = [(first + timedelta(days=day) + offset).strftime(SHOWTIME_FORMAT)
+              for day in range(weeks * 7) if WEEKDAYS[(first + timedelta(days=day)).weekday()] in days
+              for offset in offsets]
+    first_id = repo.next_id("showtimes", len(starts))
+    showtimes = [new_showtime(showtime_id, movie, start, hall['number_of_seats'], hall)
+                 for showtime_id, start in enumerate(starts, start=first_id)]
+    rejected = repo.insert_many({"showtimes": showtimes})
+    skipped_ids = {showtime['id'] for showtime, _ in rejected}
+    return ([showtime for showtime in showtimes if showtime['id'] not in skipped_ids],
+            [(showtime['datetime'], conflict) for showtime, conflict in rejected])
 
 # ------------------ Navigation Logic ------------------
 
@@ -45,17 +3722,81 @@ def hash_password(password):
 def clear_screen():
     os.system('cls' if os.name == 'nt' else 'clear')
 
+def session_user():
+    """The logged-in user's record, or None once the session has ended or gone idle."""
+    return sessions.user(current_session) if current_session else None
+
+# A screen returns where to go next instead of calling the next screen;
+# returning None means back. Navigator.run() does the actual calls.
+HISTORY_LIMIT = 32  # screens remembered for "back"
+BACK = ("back", None)
+HOME = ("home", None)
+EXIT = ("exit", None)
+
 def go_to(screen_name):
-    history_stack.append(screen_name)
-    screen_router[screen_name]()
+    """Open screen_name on top of the current screen, which is shown again on back."""
+    return ("go", screen_name)
+
+def replace_with(screen_name):
+    """Finish the current screen and show screen_name in its place."""
+    return ("replace", screen_name)
 
 def back():
-    if history_stack:
-        history_stack.pop()
-    if history_stack:
-        screen_router[history_stack[-1]]()
-    else:
-        main_menu()
+    return BACK
+
+
+class Navigator:
+    """
+    Runs the screens as a trampoline: each screen returns a transition and
+    this loop calls the next screen, so the call stack stays the same depth
+    however long a kiosk session runs. History is a bounded deque: the
+    oldest entries fall off, and back from an empty history lands on the
+    home screen. Hooks registered with on_enter/on_exit run around every
+    visit of a screen, for example to drop cached data.
+    """
+
+    def __init__(self, screens, home="main_menu", history_limit=HISTORY_LIMIT):
+        self.screens = screens
+        self.home = home
+        self.history = deque(maxlen=history_limit)
+        self._enter_hooks = {}
+        self._exit_hooks = {}
+
+    def on_enter(self, screen_name, hook):
+        self._enter_hooks.setdefault(screen_name, []).append(hook)
+
+    def on_exit(self, screen_name, hook):
+        self._exit_hooks.setdefault(screen_name, []).append(hook)
+
+    def run(self, screen_name=None):
+        screen_name = screen_name or self.home
+        self.history.clear()
+        while screen_name is not None:
+            for hook in self._enter_hooks.get(screen_name, ()):
+                hook()
+            start = time.perf_counter()
+            try:
+                transition = self.screens[screen_name]() or BACK
+            finally:
+                if metrics.enabled:
+                    # Includes the time spent waiting for input on the screen.
+                    metrics.observe("movie_screen_seconds", time.perf_counter() - start, screen=screen_name)
+                for hook in self._exit_hooks.get(screen_name, ()):
+                    hook()
+            screen_name = self._next(screen_name, *transition)
+
+    def _next(self, current, action, target):
+        if action == "go":
+            self.history.append(current)
+            return target
+        if action == "replace":
+            return target
+        if action == "back":
+            return self.history.pop() if self.history else self.home
+        if action == "home":
+            self.history.clear()
+            return self.home
+        return None  # EXIT
 
 
 
@@ -64,15 +3805,9 @@ def back():
 def register():
     print("\n📋 User Registration")
     print("-" * 30)
-    file_path = 'data/users.json'
-
-    try:
-        users = load_data(file_path)
-    except FileNotFoundError:
-        users = []
 
     username = input("👤 Enter a username: ").strip()
-    if any(user["username"] == username for user in users):
+    if repo.find_user(username):
         print("❌ Username already exists. Please try a different one.\n")
         return
 
@@ -83,58 +3818,44 @@ def register():
         print("❌ Passwords do not match. Please try again.\n")
         return
 
-    role = "user"
-    hashed_pw = hash_password(password)
-    next_id = max((user["id"] for user in users), default=0) + 1
-
-    new_user = {
-        "id": next_id,
-        "username": username,
-        "password": hashed_pw,
-        "role": role,
-        "bookings": []
-    }
-
-    users.append(new_user)
-    save_data(file_path, users)
-    print(f"\n✅ User '{username}' registered successfully with ID {next_id} as '{role}'.\n")
+    try:
+        new_user = register_user(username, password)
+    except ServiceError as e:
+        print(f"❌ {e}\n")
+        return
+    print(f"\n✅ User '{username}' registered successfully with ID {new_user['id']} as '{new_user['role']}'.\n")
 
 def login():
     print("\n🔐 User Login")
     print("-" * 30)
-    file_path = 'data/users.json'
-
-    try:
-        users = load_data(file_path)
-    except FileNotFoundError:
-        print("❌ No users registered yet. Please register first.\n")
-        return None
 
     username = input("👤 Enter your username: ").strip()
     password = input("🔒 Enter your password: ").strip()
-    hashed_pw = hash_password(password)
 
-    for user in users:
-        if user["username"].lower() == username.lower() and user["password"] == hashed_pw:
-            print(f"\n✅ Welcome back, {username}! You are logged in as '{user['role']}'.\n")
-            return user
+    token = start_session(username, password)
+    if token:
+        user = sessions.user(token)
+        print(f"\n✅ Welcome back, {username}! You are logged in as '{user['role']}'.\n")
+        return token
 
     print("❌ Invalid username or password.\n")
     return None
 
 def logout():
-    global current_user
-    history_stack.clear()
-    current_user = None
+    global current_session
+    if current_session:
+        sessions.close(current_session)
+    current_session = None
     print("\n🚪 You have been logged out.\n")
-    main_menu()
+    return HOME
 # ------------------ Menus ------------------
 
 def main_menu():
     clear_screen()
-    global current_user
-    history_stack.clear()
-    current_user = None
+    global current_session
+    if current_session:
+        sessions.close(current_session)
+    current_session = None
 
     while True:
         print("\n🎬 Welcome to Movie Ticket Booking System")
@@ -146,23 +3867,24 @@ def main_menu():
         if choice == '1':
             register()
         elif choice == '2':
-            user = login()
-            if user:
-                current_user = user
-                if user['role'] == 'admin':
-                    go_to("admin_menu")
-                else:
-                    go_to("user_menu")
-                break
+            token = login()
+            if token:
+                current_session = token
+                if sessions.user(token)['role'] == 'admin':
+                    return go_to("admin_menu")
+                return go_to("user_menu")
         elif choice == '3':
             print("👋 Thank you for visiting. Goodbye!")
-            break
+            return EXIT
         else:
             print("❌ Invalid choice. Please select from (1, 2, or 3).")
 
 def admin_menu():
     clear_screen()
     while True:
+        if session_user() is None:
+            print("⚠️ Your session has expired. Please log in again.\n")
+            return HOME
         print("\n🛠️ Admin Dashboard")
         print("1. Add Movie")
         print("2. Edit Movie")
@@ -172,31 +3894,39 @@ def admin_menu():
         print("6. Edit Showtime")
         print("7. List Showtimes")
         print("8. Remove Showtime")
-        print("9. Logout")
+        print("9. Bulk Import")
+        print("10. Halls")
+        print("11. Recurring Schedule")
+        print("12. Logout")
 
 
 
-        choice = input("Enter your choice (1-11): ").strip()
+        choice = input("Enter your choice (1-12): ").strip()
 
         if choice == '1':
-            go_to("add_movie")
+            return go_to("add_movie")
         elif choice == '2':
-            go_to("edit_movie")
+            return go_to("edit_movie")
         elif choice == '3':
-            go_to("view_movies")
+            return go_to("view_movies")
         elif choice == '4':
-            go_to("remove_movie")
+            return go_to("remove_movie")
         elif choice == '5':
-            go_to("add_showtime")
+            return go_to("add_showtime")
         elif choice == '6':
-            go_to("edit_showtime")
+            return go_to("edit_showtime")
         elif choice == '7':
-            go_to("view_showtimes") 
+            return go_to("view_showtimes") 
         elif choice == '8':
-            go_to("remove_showtime")
+            return go_to("remove_showtime")
         elif choice == '9':
-            logout()
-            break
+            return go_to("bulk_import")
+        elif choice == '10':
+            return go_to("manage_halls")
+        elif choice == '11':
+            return go_to("schedule_showtimes")
+        elif choice == '12':
+            return logout()
 
         
         else:
@@ -205,6 +3935,9 @@ def admin_menu():
 def user_menu():
     while True:
         clear_screen()
+        if session_user() is None:
+            print("⚠️ Your session has expired. Please log in again.\n")
+            return HOME
         print("\n🎟️ User Menu")
         print("1. Browse Movies")
         print("2. View Showtimes")
@@ -216,16 +3949,15 @@ def user_menu():
         choice = input("Enter your choice (1-7): ").strip()
 
         if choice == '1':
-            go_to("view_movies")
+            return go_to("view_movies")
         elif choice == '2':
-            go_to("view_showtimes")
+            return go_to("view_showtimes")
         elif choice == '3':
-            go_to("book_seats")
+            return go_to("book_seats")
         elif choice == '4':
-            go_to("cancel_booking")
+            return go_to("cancel_booking")
         elif choice == '5':
-            logout()
-            break
+            return logout()
 
         else:
             print("❌ Invalid input. Try again.")
@@ -240,10 +3972,8 @@ def add_movie():
     print("\n🎬 Add New Movie")
     print("-" * 30)
 
-    movies_file = 'data/movies.json'
-
     try:
-        movies = load_data(movies_file)
+        movies = repo.movies()
     except FileNotFoundError:
         movies = []
 
@@ -276,7 +4006,7 @@ def add_movie():
         print("❌ Movie with this title already exists.\n")
         return
 
-    next_id = max((movie['id'] for movie in movies), default=0) + 1
+    next_id = repo.next_id("movies")
 
     new_movie = {
         "id": next_id,
@@ -287,20 +4017,17 @@ def add_movie():
         "available": available
     }
 
-    movies.append(new_movie)
-    save_data(movies_file, movies)
+    repo.insert("movies", new_movie)
 
     print(f"\n✅ Movie '{title}' added successfully with ID {next_id}.\n")
-    go_to("view_movies")
+    return replace_with("view_movies")
 
 def edit_movie():
     clear_screen()
     print("\n✏️ Edit Movie")
     print("-" * 30)
-    movies_file = 'data/movies.json'
-
     try:
-        movies = load_data(movies_file)
+        movies = repo.movies()
     except FileNotFoundError:
         print("❌ No movies to edit.\n")
         return
@@ -332,8 +4059,8 @@ def edit_movie():
             print("❌ Invalid movie ID. Please enter a number.\n")
             continue
 
-        movie = next((m for m in available_movies if m['id'] == movie_id), None)
-        if not movie:
+        movie = repo.get("movies", movie_id)
+        if not movie or not movie.get('available', True):
             print("❌ Movie not found among available entries. Please try again.\n")
             continue
 
@@ -352,36 +4079,34 @@ def edit_movie():
         new_release_date = input(f"Release Date (YYYY-MM-DD) [{movie['release_date']}]: ").strip()
         new_available = input(f"Available (yes/no) [{ 'yes' if movie.get('available', True) else 'no' }]: ").strip().lower()
 
-        if new_title:
-            movie['title'] = new_title
-        if new_genre:
-            movie['genre'] = new_genre
+        duration = None
         if new_duration:
             try:
                 dur = int(new_duration)
                 if dur > 0:
-                    movie['duration'] = dur
+                    duration = dur
                 else:
                     print("❌ Duration must be positive. Keeping old value.")
             except ValueError:
                 print("❌ Invalid duration input. Keeping old value.")
-        if new_release_date:
-            movie['release_date'] = new_release_date
-        if new_available in ['yes', 'no']:
-            movie['available'] = (new_available == 'yes')
 
-        save_data(movies_file, movies)
+        # A longer movie must still fit every hall slot it is scheduled in
+        try:
+            update_movie(movie_id, title=new_title or None, genre=new_genre or None, duration=duration,
+                         release_date=new_release_date or None,
+                         available=(new_available == 'yes') if new_available in ['yes', 'no'] else None)
+        except ServiceError as e:
+            print(f"❌ {e}\n")
+            return
         print(f"\n✅ Movie ID {movie_id} updated successfully.\n")
-        go_to("view_movies")
+        return replace_with("view_movies")
 
 def remove_movie():
     clear_screen()
     print("\n🗑️ Remove Movie")
     print("-" * 30)
-    movies_file = 'data/movies.json'
-
     try:
-        movies = load_data(movies_file)
+        movies = repo.movies()
     except FileNotFoundError:
         print("❌ No movies to remove.\n")
         return
@@ -412,8 +4137,8 @@ def remove_movie():
             print("❌ Invalid ID. Please enter a number.\n")
             continue
 
-        movie = next((m for m in available_movies if m['id'] == movie_id), None)
-        if not movie:
+        movie = repo.get("movies", movie_id)
+        if not movie or not movie.get('available', True):
             print("❌ Movie not found among available entries. Please try again.\n")
             continue
 
@@ -422,39 +4147,38 @@ def remove_movie():
             print("❎ Deletion cancelled.\n")
             return
 
-        movies = [m for m in movies if m['id'] != movie_id]
-        save_data(movies_file, movies)
-        print(f"\n✅ Movie '{movie['title']}' removed successfully.\n")
-        go_to("view_movies")
-
-def generate_seat_labels(total_seats, seats_per_row=10):
-    """
-    Generate seat labels like A1, A2, ..., B1, B2, ... up to total_seats.
-    """
-    rows = math.ceil(total_seats / seats_per_row)
-    seats = {}
-    seat_count = 0
-
-    for r in range(rows):
-        row_letter = chr(65 + r)  # A, B, C...
-        for c in range(1, seats_per_row + 1):
-            seat_count += 1
-            if seat_count > total_seats:
-                break
-            seat_id = f"{row_letter}{c}"
-            seats[seat_id] = "available"
-
-    return seats
+        # Its showtimes go with it; bookings only if the admin agrees.
+        plan = repo.dependents("movies", movie_id)
+        cascade = confirm_cascade(len(plan["showtimes"]), len(plan["bookings"]))
+        if cascade is None:
+            return
+        try:
+            plan = delete_movie(movie_id, cascade)
+        except ServiceError as e:
+            print(f"❌ {e}\n")
+            return
+        print(f"\n✅ Movie '{movie['title']}' removed successfully "
+              f"with {len(plan['showtimes'])} showtime(s) and {len(plan['bookings'])} booking(s).\n")
+        return replace_with("view_movies")
+
+def confirm_cascade(showtime_count, booking_count):
+    """Ask before bookings are deleted. True/False: whether to delete them; None: cancelled."""
+    if showtime_count:
+        print(f"ℹ️ {showtime_count} showtime(s) will be deleted as well.")
+    if not booking_count:
+        return False
+    answer = input(f"⚠️ This also deletes {booking_count} booking(s). Continue? (yes/no): ").strip().lower()
+    if answer != 'yes':
+        print("❎ Deletion cancelled.\n")
+        return None
+    return True
 
 def add_showtime():
     clear_screen()
     print("\n🕒 Add Showtime")
     print("-" * 30)
-    movies_file = 'data/movies.json'
-    showtimes_file = 'data/showtimes.json'
-
     try:
-        movies = load_data(movies_file)
+        movies = repo.movies()
     except FileNotFoundError:
         print("❌ No movies found. Add one first.\n")
         return
@@ -474,54 +4198,59 @@ def add_showtime():
         print("❌ Invalid movie ID.\n")
         return
 
-    if not any(m['id'] == movie_id for m in movies):
+    if not repo.get("movies", movie_id):
         print("❌ Movie not found.\n")
         return
 
+    # Once halls exist, every new showtime is scheduled in one.
+    hall = None
+    halls = repo.halls()
+    if halls:
+        print("\n🏛️ Halls:")
+        for h in halls:
+            print(f"{h['id']}: {h['name']} ({h['number_of_seats']} seats)")
+        try:
+            hall = repo.get("halls", int(input("Enter hall ID: ").strip()))
+        except ValueError:
+            hall = None
+        if hall is None:
+            print("❌ Hall not found.\n")
+            return
+
     datetime_str = input("Enter showtime datetime (YYYY-MM-DD HH:MM): ").strip()
     try:
-        datetime.strptime(datetime_str, "%Y-%m-%d %H:%M")
+        datetime.strptime(datetime_str, SHOWTIME_FORMAT)
     except ValueError:
         print("❌ Invalid datetime format. Use YYYY-MM-DD HH:MM.\n")
         return
 
-    try:
-        num_seats = int(input("Enter number of seats: ").strip())
-        if num_seats <= 0:
-            print("❌ Seat number must be positive.\n")
+    prompt = f"Enter number of seats [{hall['number_of_seats']}]: " if hall else "Enter number of seats: "
+    seats_input = input(prompt).strip()
+    num_seats = None
+    if seats_input or hall is None:
+        try:
+            num_seats = int(seats_input)
+            if num_seats <= 0:
+                print("❌ Seat number must be positive.\n")
+                return
+        except ValueError:
+            print("❌ Invalid seat number.\n")
             return
-    except ValueError:
-        print("❌ Invalid seat number.\n")
-        return
 
     try:
-        showtimes = load_data(showtimes_file)
-    except FileNotFoundError:
-        showtimes = []
-
-    next_id = max((s['id'] for s in showtimes), default=0) + 1
-    seats = generate_seat_labels(num_seats)
-
-    showtimes.append({
-        "id": next_id,
-        "movie_id": movie_id,
-        "datetime": datetime_str,
-        "number_of_seats": num_seats,
-        "seats": seats
-    })
-
-    save_data(showtimes_file, showtimes)
-    print(f"\n✅ Showtime added with ID {next_id} for movie ID {movie_id} with {num_seats} labeled seats.\n")
+        showtime = create_showtime(movie_id, datetime_str, num_seats, hall['id'] if hall else None)
+    except ServiceError as e:
+        print(f"❌ {e}\n")
+        return
+    print(f"\n✅ Showtime added with ID {showtime['id']} for movie ID {movie_id} "
+          f"with {showtime['number_of_seats']} labeled seats.\n")
 
 def edit_showtime():
     clear_screen()
     print("\n✏️ Edit Showtime")
     print("-" * 30)
-    showtimes_file = 'data/showtimes.json'
-    movies_file = 'data/movies.json'
-
     try:
-        showtimes = load_data(showtimes_file)
+        showtimes = repo.showtimes()
     except FileNotFoundError:
         print("❌ No showtimes to edit.\n")
         return
@@ -531,7 +4260,7 @@ def edit_showtime():
         return
 
     try:
-        movies = load_data(movies_file)
+        movies = repo.movies()
     except FileNotFoundError:
         movies = []
 
@@ -539,7 +4268,8 @@ def edit_showtime():
         # List showtimes with index
         print("\nAvailable Showtimes:")
         for idx, st in enumerate(showtimes, start=1):
-            movie_title = next((m['title'] for m in movies if m['id'] == st['movie_id']), "Unknown Movie")
+            movie = repo.get("movies", st['movie_id'])
+            movie_title = movie['title'] if movie else "Unknown Movie"
             print(f"{idx}. ID: {st['id']} | Movie: {movie_title} | Date & Time: {st['datetime']} | Seats: {st['number_of_seats']}")
 
         choice = input("Enter the number of the showtime to edit (or type 'back' to cancel): ").strip()
@@ -559,7 +4289,8 @@ def edit_showtime():
         showtime = showtimes[choice_num - 1]
 
         # Display current values
-        movie_title = next((m['title'] for m in movies if m['id'] == showtime['movie_id']), "Unknown Movie")
+        movie = repo.get("movies", showtime['movie_id'])
+        movie_title = movie['title'] if movie else "Unknown Movie"
         print(f"\nEditing Showtime ID {showtime['id']}")
         print(f"Current Movie: {movie_title} (ID: {showtime['movie_id']})")
         print(f"Current Date & Time: {showtime['datetime']}")
@@ -573,11 +4304,12 @@ def edit_showtime():
         for m in movies:
             print(f"ID: {m['id']} | Title: {m['title']}")
         new_movie_id = input(f"New Movie ID [{showtime['movie_id']}]: ").strip()
+        movie_id = showtime['movie_id']
         if new_movie_id:
             try:
                 new_movie_id_int = int(new_movie_id)
-                if any(m['id'] == new_movie_id_int for m in movies):
-                    showtime['movie_id'] = new_movie_id_int
+                if repo.get("movies", new_movie_id_int):
+                    movie_id = new_movie_id_int
                 else:
                     print("❌ Movie ID not found. Keeping old movie ID.")
             except ValueError:
@@ -585,36 +4317,42 @@ def edit_showtime():
 
         # Edit datetime
         new_datetime = input(f"New Date & Time [{showtime['datetime']}]: ").strip()
+        datetime_str = showtime['datetime']
         if new_datetime:
-            showtime['datetime'] = new_datetime
+            try:
+                datetime.strptime(new_datetime, SHOWTIME_FORMAT)
+                datetime_str = new_datetime
+            except ValueError:
+                print("❌ Invalid datetime format. Use YYYY-MM-DD HH:MM. Keeping old value.")
+
+        # A showtime in a hall may only move to a free slot (a longer movie needs one too)
+        if showtime.get('hall_id') is not None and (movie_id, datetime_str) != (showtime['movie_id'],
+                                                                               showtime['datetime']):
+            try:
+                check_reschedule(showtime, movie_id, datetime_str)
+            except ServiceError as e:
+                print(f"❌ {e} Keeping the old movie and time.")
+                movie_id, datetime_str = showtime['movie_id'], showtime['datetime']
 
         # Edit number of seats
         new_num_seats = input(f"New Number of Seats [{showtime['number_of_seats']}]: ").strip()
+        num_seats = None
         if new_num_seats:
             try:
                 new_num_seats_int = int(new_num_seats)
                 if new_num_seats_int > 0:
-                    old_num_seats = showtime['number_of_seats']
-                    showtime['number_of_seats'] = new_num_seats_int
-
-                    # Update seats dict
-                    current_seats = showtime.get('seats', {})
-                    if new_num_seats_int > old_num_seats:
-                        # Add new seats as available
-                        for i in range(old_num_seats + 1, new_num_seats_int + 1):
-                            current_seats[str(i)] = "available"
-                    elif new_num_seats_int < old_num_seats:
-                        # Remove seats exceeding new count
-                        for i in range(new_num_seats_int + 1, old_num_seats + 1):
-                            current_seats.pop(str(i), None)
-                    showtime['seats'] = current_seats
+                    num_seats = new_num_seats_int
                 else:
                     print("❌ Number of seats must be positive. Keeping old value.")
             except ValueError:
                 print("❌ Invalid input for number of seats. Keeping old value.")
 
-        # Save updated showtimes
-        save_data(showtimes_file, showtimes)
+        # Apply the changes to the showtime as it is now, not as it was listed
+        try:
+            update_showtime(showtime['id'], movie_id, datetime_str, num_seats)
+        except ServiceError as e:
+            print(f"❌ {e}\n")
+            return
         print(f"\n✅ Showtime ID {showtime['id']} updated successfully.\n")
         break
 
@@ -623,10 +4361,8 @@ def remove_showtime():
     clear_screen()
     print("\n🗑️ Remove Showtime")
     print("-" * 30)
-    showtimes_file = 'data/showtimes.json'
-
     try:
-        showtimes = load_data(showtimes_file)
+        showtimes = repo.showtimes()
     except FileNotFoundError:
         print("❌ No showtimes to remove.\n")
         return
@@ -637,13 +4373,14 @@ def remove_showtime():
 
     movies = []
     try:
-        movies = load_data('data/movies.json')
+        movies = repo.movies()
     except FileNotFoundError:
         pass
 
     while True:
         for st in showtimes:
-            movie_title = next((m['title'] for m in movies if m['id'] == st['movie_id']), "Unknown Movie")
+            movie = repo.get("movies", st['movie_id'])
+            movie_title = movie['title'] if movie else "Unknown Movie"
             print(f"ID: {st['id']} | Movie: {movie_title} | Date & Time: {st['datetime']}")
 
         inp = input("Enter showtime ID to remove (or type 'back' to cancel): ").strip()
@@ -657,30 +4394,138 @@ def remove_showtime():
             print("❌ Invalid showtime ID. Please enter a number.\n")
             continue
 
-        showtime = next((s for s in showtimes if s['id'] == showtime_id), None)
+        showtime = repo.get("showtimes", showtime_id)
         if not showtime:
             print("❌ Showtime not found. Please try again.\n")
             continue
 
-        showtimes = [s for s in showtimes if s['id'] != showtime_id]
-        save_data(showtimes_file, showtimes)
+        cascade = confirm_cascade(0, len(repo.dependents("showtimes", showtime_id)["bookings"]))
+        if cascade is None:
+            return
+        try:
+            delete_showtime(showtime_id, cascade)
+        except ServiceError as e:
+            print(f"❌ {e}\n")
+            return
         print(f"\n✅ Showtime ID {showtime_id} removed successfully.\n")
         break
 
+def print_import_report(movies_added, showtimes_added, errors):
+    for file_path, line_number, message in errors[:IMPORT_ERRORS_SHOWN]:
+        print(f"❌ {os.path.basename(file_path)} line {line_number}: {message}")
+    if len(errors) > IMPORT_ERRORS_SHOWN:
+        print(f"❌ ... and {len(errors) - IMPORT_ERRORS_SHOWN} more bad row(s).")
+    print(f"\n✅ Imported {movies_added} movie(s) and {showtimes_added} showtime(s); "
+          f"{len(errors)} row(s) skipped.\n")
+
+def bulk_import():
+    clear_screen()
+    """
+    Admin function to import movies and showtimes from CSV or JSONL files.
+    """
+    print("\n📥 Bulk Import")
+    print("-" * 30)
+    print("CSV files need a header row. Movies: title, genre, duration, release_date, available.")
+    print("Showtimes: movie_id (or movie title), datetime, number_of_seats.")
+
+    movies_path = input("Movies file (leave blank to skip): ").strip()
+    showtimes_path = input("Showtimes file (leave blank to skip): ").strip()
+    if not movies_path and not showtimes_path:
+        print("Operation cancelled.\n")
+        return
+
+    try:
+        report = import_catalog(movies_path or None, showtimes_path or None)
+    except (OSError, ServiceError) as e:
+        print(f"❌ Import failed: {e}\n")
+        return
+    print_import_report(*report)
+
+def manage_halls():
+    while True:
+        clear_screen()
+        print("\n🏛️ Halls")
+        print("-" * 30)
+        halls = repo.halls()
+        if not halls:
+            print("No halls yet. Showtimes are not checked for overlaps until they have a hall.")
+        for hall in halls:
+            print(f"ID: {hall['id']} | {hall['name']} | Seats: {hall['number_of_seats']} | "
+                  f"Cleanup: {hall['cleanup_minutes']} min")
+
+        name = input("\nNew hall name (or type 'back' to return): ").strip()
+        if name.lower() == 'back':
+            return
+        try:
+            number_of_seats = int(input("Number of seats: ").strip())
+            cleanup = input(f"Cleanup minutes between shows [{HALL_CLEANUP_MINUTES}]: ").strip()
+            cleanup_minutes = int(cleanup) if cleanup else HALL_CLEANUP_MINUTES
+        except ValueError:
+            print("❌ Please enter whole numbers.\n")
+            input("Press Enter to continue...")
+            continue
+        try:
+            hall = add_hall(name, number_of_seats, cleanup_minutes)
+        except ServiceError as e:
+            print(f"❌ {e}\n")
+        else:
+            print(f"\n✅ Hall '{hall['name']}' added with ID {hall['id']}.\n")
+        input("Press Enter to continue...")
+
+def schedule_showtimes():
+    clear_screen()
+    """
+    Admin function to create a movie's showtimes in a hall for several weeks at once.
+    """
+    print("\n🗓️ Recurring Schedule")
+    print("-" * 30)
+    movies = repo.movies()
+    halls = repo.halls()
+    if not movies or not halls:
+        print("❌ Add at least one movie and one hall first.\n")
+        return
+
+    print("\n🎬 Movies:")
+    for m in movies:
+        print(f"{m['id']}: {m['title']} ({m['duration']} min)")
+    print("\n🏛️ Halls:")
+    for h in halls:
+        print(f"{h['id']}: {h['name']} ({h['number_of_seats']} seats)")
+
+    try:
+        movie_id = int(input("Enter movie ID: ").strip())
+        hall_id = int(input("Enter hall ID: ").strip())
+        first_day = input("First day (YYYY-MM-DD): ").strip()
+        weeks = int(input("Number of weeks: ").strip())
+    except ValueError:
+        print("❌ Please enter whole numbers for IDs and weeks.\n")
+        return
+    times = input("Show times, comma separated (e.g. 14:00,18:30): ").split(",")
+    days = input(f"Weekdays, comma separated ({','.join(WEEKDAYS)}) [every day]: ").strip()
+
+    try:
+        created, skipped = schedule_recurring(movie_id, hall_id, first_day, weeks, times,
+                                              days.split(",") if days else WEEKDAYS)
+    except ServiceError as e:
+        print(f"❌ {e}\n")
+        return
+    for datetime_str, conflict in skipped[:IMPORT_ERRORS_SHOWN]:
+        print(f"⚠️ Skipped {datetime_str}: the hall is taken by showtime ID {conflict}.")
+    if len(skipped) > IMPORT_ERRORS_SHOWN:
+        print(f"⚠️ ... and {len(skipped) - IMPORT_ERRORS_SHOWN} more.")
+    print(f"\n✅ Scheduled {len(created)} showtime(s); {len(skipped)} skipped.\n")
+
 
 # ------------------ Shared ------------------
 def view_movies(only_available=True):
     while True:
         clear_screen()
         try:
-            movies = load_data('data/movies.json')
+            movies = list_movies(only_available)
         except FileNotFoundError:
             print("❌ No movies available.\n")
             return
 
-        if only_available:
-            movies = [movie for movie in movies if movie.get("available", False)]
-
         if not movies:
             print("❌ No movies found.\n")
         else:
@@ -698,8 +4543,7 @@ def view_movies(only_available=True):
         if choice == '1':
             return  
         elif choice == '2':
-            logout()
-            return
+            return logout()
         else:
             print("❌ Invalid input. Try again.\n")
 
@@ -712,15 +4556,11 @@ def view_showtimes(only_available=True):
         print("-" * 30)
 
         try:
-            movies = load_data('data/movies.json')
-            showtimes = load_data('data/showtimes.json')
+            movies = list_movies(only_available)
         except FileNotFoundError:
             print("❌ Required data not found.\n")
             return
 
-        if only_available:
-            movies = [m for m in movies if m.get("available", False)]
-
         if not movies:
             print("❌ No available movies.\n")
         else:
@@ -728,13 +4568,10 @@ def view_showtimes(only_available=True):
             print("\n📅 Upcoming Showtimes:")
             print("-" * 60)
             for movie in movies:
-                for st in showtimes:
-                    if st['movie_id'] == movie['id']:
-                        show_dt = datetime.strptime(st['datetime'], "%Y-%m-%d %H:%M")
-                        if show_dt > now:
-                            available_seats = sum(1 for s in st['seats'].values() if s == "available")
-                            print(f"Movie: {movie['title']} | ID: {st['id']} | Date & Time: {st['datetime']} | "
-                                  f"Total Seats: {st['number_of_seats']} | Available: {available_seats}")
+                for st in list_upcoming(movie['id'], now):
+                    available_seats = seats_left(st)
+                    print(f"Movie: {movie['title']} | ID: {st['id']} | Date & Time: {st['datetime']} | "
+                          f"Total Seats: {st['number_of_seats']} | Available: {available_seats}")
             print("-" * 60)
 
         print("\nOptions:")
@@ -745,8 +4582,7 @@ def view_showtimes(only_available=True):
         if choice == '1':
             return 
         elif choice == '2':
-            logout()
-            return
+            return logout()
         else:
             print("❌ Invalid input. Try again.\n")
 
@@ -754,17 +4590,17 @@ def book_seats():
     clear_screen()
     print("\n🎫 Book Seats")
     print("-" * 30)
-    movies_file = 'data/movies.json'
-    showtimes_file = 'data/showtimes.json'
-    users_file = 'data/users.json'
-
+    user = session_user()
+    if user is None:
+        print("⚠️ Your session has expired. Please log in again.\n")
+        input("Press Enter to return...")
+        return
     try:
-        movies = load_data(movies_file)
+        available_movies = list_movies()
     except FileNotFoundError:
         print("❌ No movies available.\n")
         return
 
-    available_movies = [m for m in movies if m.get("available", False)]
     if not available_movies:
         print("❌ No available movies to book.\n")
         return
@@ -790,17 +4626,7 @@ def book_seats():
         except ValueError:
             print("❌ Please enter a valid number.")
 
-    try:
-        showtimes = load_data(showtimes_file)
-    except FileNotFoundError:
-        print("❌ No showtimes available.\n")
-        return
-
-    now = datetime.now()
-    upcoming = [
-        st for st in showtimes
-        if st['movie_id'] == selected_movie['id'] and datetime.strptime(st['datetime'], "%Y-%m-%d %H:%M") > now
-    ]
+    upcoming = list_upcoming(selected_movie['id'])
 
     if not upcoming:
         print("❌ No upcoming showtimes for this movie.\n")
@@ -808,8 +4634,10 @@ def book_seats():
 
     print(f"\n📅 Showtimes for '{selected_movie['title']}':")
     for st in upcoming:
-        available_seats = sum(1 for s in st['seats'].values() if s == "available")
-        print(f"ID: {st['id']} | {st['datetime']} | Total: {st['number_of_seats']} | Available: {available_seats}")
+        available_seats = seats_left(st)
+        hall = repo.get("halls", st['hall_id']) if st.get('hall_id') is not None else None
+        hall_label = f" | Hall: {hall['name']}" if hall else ""
+        print(f"ID: {st['id']} | {st['datetime']}{hall_label} | Total: {st['number_of_seats']} | Available: {available_seats}")
     print("Type 'back' to return.")
 
     while True:
@@ -826,44 +4654,44 @@ def book_seats():
         except ValueError:
             print("❌ Please enter a number.")
 
-    available_seats = [seat for seat, status in selected_showtime['seats'].items() if status == "available"]
+    available_seats = open_seats(selected_showtime, user).available_labels()
     print(f"\n💺 Available Seats ({len(available_seats)}): {', '.join(available_seats)}")
 
+    print("Tip: type 'best N' to get the best N seats together.")
     seat_input = input("Enter seat numbers to book (comma separated) or type 'back' to cancel: ").strip()
     if seat_input.lower() == 'back':
         return
 
-    requested_seats = [s.strip() for s in seat_input.split(",")]
-    invalid_seats = [s for s in requested_seats if s not in available_seats]
-
-    if invalid_seats:
-        print(f"❌ These seats are invalid or unavailable: {', '.join(invalid_seats)}")
+    if seat_input.lower().startswith('best'):
+        try:
+            requested_seats = best_seats(selected_showtime['id'], int(seat_input[4:].strip()), user)
+        except ValueError:
+            print("❌ Use 'best' followed by the number of seats, e.g. 'best 4'.")
+            return
+        except ServiceError as e:
+            print(f"❌ {e}")
+            return
+        print(f"🪑 Best available: {', '.join(requested_seats)}")
+    else:
+        requested_seats = [s.strip() for s in seat_input.split(",")]
+    try:
+        hold = hold_seats(user, selected_showtime['id'], requested_seats)
+    except ServiceError as e:
+        print(f"❌ {e}")
         return
+    print(f"⏳ Seats held for you for {hold['expires_in'] // 60} min {hold['expires_in'] % 60} s.")
 
-    confirm = input(f"⚠️ Confirm booking seats {', '.join(requested_seats)}? (yes/no): ").strip().lower()
+    confirm = input(f"⚠️ Confirm booking seats {', '.join(hold['seats'])}? (yes/no): ").strip().lower()
     if confirm != 'yes':
+        release_hold(user, hold['hold_id'])
         print("❎ Booking cancelled.\n")
         return
 
-   
-    for seat in requested_seats:
-        selected_showtime['seats'][seat] = current_user['username']
-
-    
     try:
-        save_data(showtimes_file, showtimes)
-        users = load_data(users_file)
-        for user in users:
-            if user['username'] == current_user['username']:
-                user.setdefault('bookings', []).append({
-                    "movie_id": selected_movie['id'],
-                    "showtime_id": selected_showtime['id'],
-                    "seats": requested_seats,
-                    "datetime": selected_showtime['datetime']
-                })
-                break
-        save_data(users_file, users)
-        print(f"\n✅ Seats booked successfully: {', '.join(requested_seats)}")
+        booking = confirm_hold(user, hold['hold_id'])
+        print(f"\n✅ Seats booked successfully: {', '.join(booking['seats'])}")
+    except ServiceError as e:
+        print(f"❌ {e}")
     except Exception as e:
         print(f"❌ Failed to book seats: {e}")
 
@@ -872,70 +4700,47 @@ def cancel_booking():
     clear_screen()
     print("\n❌ Cancel Booking")
     print("-" * 30)
-
-    users = load_data('data/users.json')
-    for user in users:
-        if user['username'] == current_user['username']:
-            current_user.update(user)
-            break
-
-    if not current_user or not current_user.get("bookings"):
-        print("⚠️ You have no bookings to cancel.\n")
-        input("Press Enter to return to menu...")
-        return
-
-    showtimes_file = 'data/showtimes.json'
-
-    try:
-        showtimes = load_data(showtimes_file)
-    except FileNotFoundError:
-        print("❌ Showtime data missing.\n")
-        input("Press Enter to return to menu...")
+    user = session_user()
+    if user is None:
+        print("⚠️ Your session has expired. Please log in again.\n")
+        input("Press Enter to return...")
         return
 
-    bookings = current_user.get("bookings", [])
+    bookings = list_bookings(user)
     if not bookings:
-        print("⚠️ No bookings found.\n")
+        print("⚠️ You have no bookings to cancel.\n")
         input("Press Enter to return to menu...")
         return
 
     print("\n🎟️ Your Bookings:")
-    for idx, booking in enumerate(bookings, 1):
-        showtime = next((s for s in showtimes if s['id'] == booking['showtime_id']), None)
-        if not showtime:
-            continue
-        print(f"{idx}. Booking ID: {idx} | Movie ID: {showtime['movie_id']} | Showtime ID: {showtime['id']} | Seats: {', '.join(booking['seats'])} | DateTime: {showtime['datetime']}")
+    for booking_id, booking, showtime in bookings:
+        print(f"{booking_id}. Booking ID: {booking_id} | Movie ID: {showtime['movie_id']} | Showtime ID: {showtime['id']} | Seats: {', '.join(booking['seats'])} | DateTime: {showtime['datetime']}")
 
     print("Type 'back' to return.")
-    choice = input("Enter the booking number to manage: ").strip()
+    choice = input("Enter the booking ID to manage: ").strip()
     if choice.lower() == 'back':
         print("🔙 Returning to previous menu...\n")
         return
 
     try:
-        booking_idx = int(choice) - 1
-        if not (0 <= booking_idx < len(bookings)):
-            print("❌ Invalid booking selection.\n")
-            input("Press Enter to return...")
-            return
+        booking_id = int(choice)
     except ValueError:
         print("❌ Invalid input. Please enter a number.\n")
         input("Press Enter to return...")
         return
 
-    booking = bookings[booking_idx]
-    showtime = next((s for s in showtimes if s['id'] == booking['showtime_id']), None)
-    if not showtime:
-        print("❌ Showtime not found. Cannot modify this booking.\n")
+    booking = next((b for bid, b, _ in bookings if bid == booking_id), None)
+    if booking is None:
+        print("❌ Invalid booking selection.\n")
         input("Press Enter to return...")
         return
 
     print(f"\n🪑 Seats in this booking: {', '.join(booking['seats'])}")
     print("Enter seat numbers to cancel (comma separated), or 'all' to cancel the whole booking.")
-    seat_input = input("Seats to cancel: ").strip().lower()
+    seat_input = input("Seats to cancel: ").strip()
 
-    if seat_input == 'all':
-        seats_to_cancel = booking['seats']
+    if seat_input.lower() == 'all':
+        seats_to_cancel = list(booking['seats'])
     else:
         seats_to_cancel = [s.strip() for s in seat_input.split(',') if s.strip() in booking['seats']]
         if not seats_to_cancel:
@@ -949,21 +4754,12 @@ def cancel_booking():
         input("Press Enter to return...")
         return
 
-    # Mark selected seats as available
-    for seat in seats_to_cancel:
-        if seat in showtime['seats']:
-            showtime['seats'][seat] = "available"
-
-    # Update user's booking
-    remaining_seats = [s for s in booking['seats'] if s not in seats_to_cancel]
-    if remaining_seats:
-        current_user['bookings'][booking_idx]['seats'] = remaining_seats
-    else:
-        current_user['bookings'].pop(booking_idx)
-
-    # Save updated data
-    save_data(showtimes_file, showtime)
-    update_users_data(current_user)
+    try:
+        cancel(user, booking_id, seats_to_cancel)
+    except ServiceError as e:
+        print(f"❌ {e}\n")
+        input("Press Enter to return...")
+        return
 
     print(f"\n✅ Seat(s) {', '.join(seats_to_cancel)} canceled successfully.\n")
     input("Press Enter to return to menu...")
@@ -981,6 +4777,9 @@ screen_router = {
     "add_showtime": add_showtime,
     "edit_showtime": edit_showtime,
     "remove_showtime": remove_showtime,
+    "bulk_import": bulk_import,
+    "manage_halls": manage_halls,
+    "schedule_showtimes": schedule_showtimes,
 
 
     "view_showtimes": view_showtimes,
@@ -992,7 +4791,850 @@ screen_router = {
    
 }
 
+navigator = Navigator(screen_router)
+# Nobody is logged in at the welcome screen, so let the cached tables go;
+# they are re-read on the next login.
+navigator.on_enter("main_menu", repo.invalidate)
+# Each visit to the dashboard sweeps a few hundred rows for dangling references.
+navigator.on_enter("admin_menu", sweep_step)
+
+# ------------------ HTTP Server ------------------
+
+HTTP_MAX_BODY = 64 * 1024
+HTTP_IDLE_TIMEOUT = 30  # seconds a keep-alive connection may sit idle
+COMMIT_WINDOW_MS = float(os.environ.get("MOVIE_COMMIT_WINDOW_MS", "5"))  # group-commit window
+COMMIT_BATCH_MAX = int(os.environ.get("MOVIE_COMMIT_BATCH_MAX", "128"))  # records per durable write
+HASH_WORKERS = int(os.environ.get("MOVIE_HASH_WORKERS", str(os.cpu_count() or 1)))  # password-hashing threads
+SWEEP_INTERVAL = float(os.environ.get("MOVIE_SWEEP_INTERVAL", "30"))  # seconds between orphan sweep steps
+ARCHIVE_INTERVAL = float(os.environ.get("MOVIE_ARCHIVE_INTERVAL", "600"))  # seconds between archive runs
+
+HTTP_REASONS = {
+    200: "OK", 201: "Created", 400: "Bad Request", 401: "Unauthorized",
+    404: "Not Found", 405: "Method Not Allowed", 409: "Conflict",
+    413: "Payload Too Large", 500: "Internal Server Error",
+}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class PendingCommit:
+    """
+    What a write handler returns: the record to commit and the response for
+    either outcome. success may be a function of the committed record, for
+    records the commit completes (e.g. the seats of a best-seats booking).
+    """
+
+    def __init__(self, record, success, conflict):
+        self.record = record
+        self.success = success
+        self.conflict = conflict
+
+
+class GroupCommitter:
+    """
+    Coalesces the booking and cancellation records submitted within
+    window_ms of the first one into a single repo.commit_batch() call, i.e.
+    one durable write, run on the repository thread. Each submitter still
+    gets its own True/False back. stats() reports batch sizes and flush
+    latency.
+    """
+
+    def __init__(self, run, window_ms=COMMIT_WINDOW_MS, max_batch=COMMIT_BATCH_MAX):
+        self._run = run  # runs a function on the repository thread, returns an awaitable
+        self.window_ms = window_ms
+        self.max_batch = max_batch
+        self._queue = None
+        self.batches = 0
+        self.records = 0
+        self.largest_batch = 0
+        self.flush_seconds = 0.0
+        self.last_flush_ms = 0.0
+
+    def submit(self, record):
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((record, future))
+        return future
+
+    def start(self):
+        """Start flushing on the running event loop; returns the task."""
+        self._queue = asyncio.Queue()
+        return asyncio.ensure_future(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            batch = [await self._queue.get()]
+            if self.window_ms > 0:
+                await asyncio.sleep(self.window_ms / 1000)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            started = time.perf_counter()
+            try:
+                results, error = await self._run(repo.commit_batch, [record for record, _ in batch]), None
+            except Exception as e:
+                results, error = [None] * len(batch), e
+            elapsed = time.perf_counter() - started
+            self.batches += 1
+            self.records += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            self.flush_seconds += elapsed
+            self.last_flush_ms = elapsed * 1000
+
+            for (_, future), result in zip(batch, results):
+                if future.done():  # client went away
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+    def stats(self):
+        return {
+            "window_ms": self.window_ms,
+            "max_batch": self.max_batch,
+            "batches": self.batches,
+            "records": self.records,
+            "largest_batch": self.largest_batch,
+            "average_batch": round(self.records / self.batches, 2) if self.batches else 0,
+            "average_flush_ms": round(self.flush_seconds * 1000 / self.batches, 3) if self.batches else 0,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+        }
+
+
+def showtime_view(showtime, with_seats=False):
+    """Public fields of a showtime; seat owners are never exposed."""
+    view = {
+        "id": showtime['id'],
+        "movie_id": showtime['movie_id'],
+        "datetime": showtime['datetime'],
+        "number_of_seats": showtime['number_of_seats'],
+        "available_count": seats_left(showtime),
+    }
+    if showtime.get('hall_id') is not None:
+        view["hall_id"] = showtime['hall_id']
+        view["end_datetime"] = showtime['end_datetime']
+    if with_seats:
+        view["available_seats"] = open_seats(showtime).available_labels()
+    return view
+
+
+class BookingServer:
+    """
+    HTTP/1.1 + JSON front end for the booking service, built on asyncio.
+
+    Each connection is a coroutine, so idle or slow clients cost a socket
+    and a few KB rather than a process. All repository work happens on one
+    worker thread: the in-memory cache is never touched concurrently and
+    this process stays a single writer towards the data files (other
+    processes are still kept out by the file locks). Bookings and
+    cancellations are validated on that thread and then handed to a
+    GroupCommitter, so a burst of them shares one durable write.
+
+    Routes:
+        GET    /movies
+        GET    /stats
+        GET    /showtimes[?movie_id=N]
+        GET    /showtimes/<id>
+        POST   /users              {"username", "password"}
+        POST   /sessions           (Basic auth) -> {"token", "idle_timeout"}
+        DELETE /sessions/<token>
+        GET    /bookings           (auth)
+        POST   /bookings           (auth) {"showtime_id", "seats": [...]} or {"showtime_id", "count"}
+        DELETE /bookings/<id>      (auth) optional {"seats": [...]}
+        POST   /holds              (auth) {"showtime_id", "seats": [...]} or {"showtime_id", "count"}
+        POST   /holds/<id>/confirm (auth)
+        DELETE /holds/<id>         (auth)
+
+    Authenticated routes take HTTP Basic credentials or a session token
+    as "Authorization: Bearer <token>". Credentials are checked on a
+    separate password-hashing pool (the KDFs release the GIL) and
+    remembered in credential_cache, so neither the event loop nor the
+    repository thread waits for a KDF.
+    """
+
+    def __init__(self, host="127.0.0.1", port=8080, window_ms=COMMIT_WINDOW_MS, max_batch=COMMIT_BATCH_MAX):
+        self.host = host
+        self.port = port
+        self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="repository")
+        self._hasher = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="password")
+        self.committer = GroupCommitter(self._run, window_ms, max_batch)
+
+    async def serve_forever(self):
+        writer_task = self.committer.start()
+        maintenance = [asyncio.ensure_future(self._every(SWEEP_INTERVAL, sweep_step)),
+                       asyncio.ensure_future(self._every(ARCHIVE_INTERVAL, archive_step))]
+        server = await asyncio.start_server(self._handle, self.host, self.port, backlog=1024)
+        print(f"🌐 Serving on http://{self.host}:{self.port} (Ctrl+C to stop)")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            writer_task.cancel()
+            for task in maintenance:
+                task.cancel()
+            self._worker.shutdown(wait=True)
+            self._hasher.shutdown(wait=True)
+
+    async def _every(self, interval, job):
+        # Background upkeep (orphan sweep, archiving) runs on the repository
+        # thread, so it queues between requests instead of racing them.
+        while True:
+            await asyncio.sleep(interval)
+            await self._run(job)
+
+    # ---- Repository thread ----
+
+    def _run(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(self._worker, func, *args)
+
+    def _hash(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(self._hasher, func, *args)
+
+    async def _authenticate(self, authorization):
+        """The user for Basic credentials or a Bearer session token, or None."""
+        scheme, _, credentials = authorization.partition(" ")
+        if scheme.lower() == "bearer":
+            return await self._run(sessions.user, credentials.strip())
+        if scheme.lower() != "basic":
+            return None
+        try:
+            username, _, password = base64.b64decode(credentials).decode('utf-8').partition(":")
+        except ValueError:
+            return None
+        user = await self._run(repo.find_user, username)
+        if user is None:
+            return None
+        stored = user['password']
+        if credential_cache.check(user['username'], password, stored):
+            return user
+        if not await self._hash(verify_password, password, stored):
+            return None
+        if needs_rehash(stored):
+            user = await self._run(store_rehash, user, stored, await self._hash(hash_password, password)) or user
+        credential_cache.add(user['username'], password, user['password'])
+        return user
+
+    # ---- HTTP ----
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), HTTP_IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    self._send(writer, 400, {"error": "Malformed request line."}, False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode('latin-1').partition(":")
+                    headers[key.strip().lower()] = value.strip()
+
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                try:
+                    length = int(headers.get("content-length", 0))
+                except ValueError:
+                    length = -1
+                if not 0 <= length <= HTTP_MAX_BODY:
+                    self._send(writer, 413, {"error": "Request body too large."}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                start = time.perf_counter()
+                status, payload = await self._dispatch(method, target, headers, body)
+                if metrics.enabled:
+                    # Label by resource only; unknown paths share one series.
+                    resource = target.split("?")[0].strip("/").split("/")[0] if status != 404 else "unknown"
+                    metrics.inc("movie_http_requests_total", method=method, resource=resource, status=status)
+                    metrics.observe("movie_http_request_seconds", time.perf_counter() - start, resource=resource)
+                self._send(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            # ValueError: a header line longer than the stream limit
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _send(writer, status, payload, keep_alive):
+        if isinstance(payload, str):
+            body, content_type = payload.encode('utf-8'), "text/plain; version=0.0.4"
+        else:
+            body, content_type = json.dumps(payload, default=encode_record).encode('utf-8'), "application/json"
+        head = (f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + body)
+
+    async def _dispatch(self, method, target, headers, body):
+        url = urlsplit(target)
+        parts = [part for part in url.path.split("/") if part]
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            data = json.loads(body) if body else {}
+            if not isinstance(data, dict):
+                raise ValueError
+        except ValueError:
+            return 400, {"error": "Body must be a JSON object."}
+
+        route = self._route(method, parts)
+        if route is None:
+            return 404, {"error": "Not found."}
+        try:
+            user = await self._authenticate(headers.get("authorization", ""))
+            if asyncio.iscoroutinefunction(route):
+                response = await route(parts, query, data, user)
+            else:
+                response = await self._run(route, parts, query, data, user)
+            if isinstance(response, PendingCommit):
+                committed = await self.committer.submit(response.record)
+                if not committed:
+                    return response.conflict
+                return response.success(response.record) if callable(response.success) else response.success
+            return response
+        except HttpError as e:
+            return e.status, {"error": str(e)}
+        except SeatUnavailable as e:
+            return 409, {"error": str(e), "seats": e.seats}
+        except ServiceError as e:
+            return 400, {"error": str(e)}
+        except Exception as e:
+            print(f"❌ {method} {url.path} failed: {e}", file=sys.stderr)
+            return 500, {"error": "Internal error."}
+
+    def _route(self, method, parts):
+        routes = {
+            ("GET", "movies", 1): self._get_movies,
+            ("GET", "stats", 1): self._get_stats,
+            ("GET", "metrics", 1): self._get_metrics,
+            ("GET", "showtimes", 1): self._get_showtimes,
+            ("GET", "showtimes", 2): self._get_showtime,
+            ("POST", "users", 1): self._post_user,
+            ("POST", "sessions", 1): self._post_session,
+            ("DELETE", "sessions", 2): self._delete_session,
+            ("GET", "bookings", 1): self._get_bookings,
+            ("POST", "bookings", 1): self._post_booking,
+            ("DELETE", "bookings", 2): self._delete_booking,
+            ("POST", "holds", 1): self._post_hold,
+            ("POST", "holds", 3): self._confirm_hold,
+            ("DELETE", "holds", 2): self._delete_hold,
+        }
+        if not parts:
+            return None
+        return routes.get((method, parts[0], len(parts)))
+
+    # ---- Handlers (run on the repository thread unless they are coroutines) ----
+
+    @staticmethod
+    def _user(user):
+        if user is None:
+            raise HttpError(401, "Valid credentials are required.")
+        return user
+
+    @staticmethod
+    def _int(value, what):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise HttpError(400, f"Invalid {what}.")
+
+    def _get_movies(self, parts, query, data, user):
+        return 200, list_movies()
+
+    def _get_stats(self, parts, query, data, user):
+        return 200, {"group_commit": self.committer.stats(), "auth_cache": credential_cache.stats(),
+                     "sessions": len(sessions)}
+
+    async def _get_metrics(self, parts, query, data, user):
+        # Rendered on the event loop: it only reads in-memory counters.
+        return 200, metrics.render()
+
+    def _get_showtimes(self, parts, query, data, user):
+        movie_id = self._int(query["movie_id"], "movie_id") if "movie_id" in query else None
+        return 200, [showtime_view(showtime) for showtime in list_upcoming(movie_id)]
+
+    def _get_showtime(self, parts, query, data, user):
+        showtime = repo.get("showtimes", self._int(parts[1], "showtime ID"))
+        if showtime is None:
+            raise HttpError(404, "Showtime not found.")
+        return 200, showtime_view(showtime, with_seats=True)
+
+    async def _post_user(self, parts, query, data, user):
+        username = str(data.get("username", "")).strip()
+        password = str(data.get("password", ""))
+        if not username or not password:
+            raise HttpError(400, "Username and password are required.")
+        password_hash = await self._hash(hash_password, password)
+        user = await self._run(register_user, username, password, "user", password_hash)
+        return 201, {"id": user['id'], "username": user['username'], "role": user['role']}
+
+    def _post_session(self, parts, query, data, user):
+        user = self._user(user)
+        return 201, {"token": sessions.open(user), "idle_timeout": sessions.idle_timeout}
+
+    def _delete_session(self, parts, query, data, user):
+        return 200, {"closed": sessions.close(parts[1])}
+
+    def _get_bookings(self, parts, query, data, user):
+        user = self._user(user)
+        return 200, [{
+            "id": booking_id,
+            "showtime_id": showtime['id'],
+            "movie_id": showtime['movie_id'],
+            "datetime": showtime['datetime'],
+            "seats": booking['seats'],
+        } for booking_id, booking, showtime in list_bookings(user)]
+
+    def _requested_seats(self, user, data):
+        showtime_id = self._int(data.get("showtime_id"), "showtime_id")
+        if "count" in data:
+            # Best available block right now.
+            return showtime_id, best_seats(showtime_id, self._int(data["count"], "count"), user)
+        seats = data.get("seats")
+        if not isinstance(seats, list):
+            raise HttpError(400, "seats must be a list of seat labels.")
+        return showtime_id, [str(seat) for seat in seats]
+
+    def _post_booking(self, parts, query, data, user):
+        user = self._user(user)
+        showtime, seats = check_booking(user, *self._requested_seats(user, data))
+        if "count" in data:
+            # The seats planned above only prove the party fits; the group
+            # commit picks them again from the seat map as it is by then.
+            return PendingCommit(repo.best_seats_record(user['username'], showtime['id'], len(seats)),
+                                 lambda record: (201, booking_summary(showtime, record['seats'])),
+                                 (409, {"error": f"Cannot seat {len(seats)}: too few seats are left."}))
+        conflict = SeatUnavailable(seats)
+        return PendingCommit(repo.booking_record(user['username'], showtime['id'], seats),
+                             (201, booking_summary(showtime, seats)),
+                             (409, {"error": str(conflict), "seats": seats}))
+
+    def _post_hold(self, parts, query, data, user):
+        user = self._user(user)
+        return 201, hold_seats(user, *self._requested_seats(user, data))
+
+    def _confirm_hold(self, parts, query, data, user):
+        user = self._user(user)
+        if parts[2] != "confirm":
+            raise HttpError(404, "Not found.")
+        showtime, seats = check_hold(user, self._int(parts[1], "hold ID"))
+        conflict = SeatUnavailable(seats)
+        return PendingCommit(repo.booking_record(user['username'], showtime['id'], seats),
+                             (201, booking_summary(showtime, seats)),
+                             (409, {"error": str(conflict), "seats": seats}))
+
+    def _delete_hold(self, parts, query, data, user):
+        user = self._user(user)
+        release_hold(user, self._int(parts[1], "hold ID"))
+        return 200, {"released": True}
+
+    def _delete_booking(self, parts, query, data, user):
+        user = self._user(user)
+        seats = data.get("seats")
+        if seats is not None and not isinstance(seats, list):
+            raise HttpError(400, "seats must be a list of seat labels.")
+        seats = [str(seat) for seat in seats] if seats is not None else None
+        booking_id = self._int(parts[1], "booking ID")
+        seats = check_cancellation(user, booking_id, seats)
+        return PendingCommit(repo.cancellation_record(user['username'], booking_id, seats),
+                             (200, {"cancelled": seats}),
+                             (409, {"error": "This booking changed in the meantime. Please try again."}))
+
+
+# ------------------ Benchmarks ------------------
+
+BENCH_PASSWORD = "bench-password"
+BENCH_GENRES = ("Action", "Comedy", "Drama", "Horror", "SciFi", "Animation", "Documentary", "Thriller")
+
+
+def generate_dataset(data_dir, users=1000, movies=50, showtimes=100, seats=200, sold=0.2, seed=1):
+    """
+    Write a synthetic users/movies/showtimes/bookings data set into an empty
+    data_dir. Showtimes are spread over the next 60 days and about `sold`
+    of their seats are already booked in blocks of 1-4 by random users.
+    Every user's password is BENCH_PASSWORD.
+    """
+    if os.path.isdir(data_dir) and os.listdir(data_dir):
+        raise ValueError(f"{data_dir} is not empty")
+    rng = random.Random(seed)
+    password = hash_password(BENCH_PASSWORD)  # one KDF run shared by every user
+    user_records = [{"id": user_id, "username": f"user{user_id:07d}", "password": password, "role": "user"}
+                    for user_id in range(1, users + 1)]
+    movie_records = [{
+        "id": movie_id,
+        "title": f"Movie {movie_id}",
+        "genre": rng.choice(BENCH_GENRES),
+        "duration": rng.randint(80, 180),
+        "release_date": (datetime(2020, 1, 1) + timedelta(days=rng.randint(0, 2000))).strftime("%Y-%m-%d"),
+        "available": rng.random() < 0.9
+    } for movie_id in range(1, movies + 1)]
+
+    start = datetime.now().replace(second=0, microsecond=0) + timedelta(hours=1)
+    per_row = max(10, -(-seats // 26))  # at most 26 rows, so labels stay A..Z
+    showtime_records, booking_records = [], []
+    for showtime_id in range(1, showtimes + 1):
+        movie = movie_records[rng.randrange(movies)]
+        show_datetime = (start + timedelta(minutes=15 * rng.randrange(60 * 24 * 4))).strftime(SHOWTIME_FORMAT)
+        seat_map = SeatMap(seats, per_row)
+        idx = 0
+        while idx < seats:
+            block = rng.randint(1, 4)
+            if rng.random() < sold:
+                user = user_records[rng.randrange(users)]
+                labels = [seat_map.label(i) for i in range(idx, min(idx + block, seats))]
+                for label in labels:
+                    seat_map.assign(label, user['username'])
+                booking_records.append({"id": len(booking_records) + 1, "user_id": user['id'],
+                                        "movie_id": movie['id'], "showtime_id": showtime_id,
+                                        "seats": labels, "datetime": show_datetime})
+            idx += block
+        showtime = {"id": showtime_id, "movie_id": movie['id'], "datetime": show_datetime,
+                    "number_of_seats": seats, "seats": seat_map, "version": 0}
+        refresh_seat_counters(showtime)
+        showtime_records.append(showtime)
+
+    for name, records in (("users", user_records), ("movies", movie_records),
+                          ("showtimes", showtime_records), ("bookings", booking_records)):
+        save_data(os.path.join(data_dir, f"{name}.json"), records)
+    return {"users": users, "movies": movies, "showtimes": showtimes, "seats": seats,
+            "bookings": len(booking_records)}
+
+
+def _bench_summary(samples):
+    samples = sorted(samples)
+    total = sum(samples)
+    return {
+        "rounds": len(samples),
+        "mean_ms": round(total / len(samples) * 1000, 4),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 4),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 4),
+        "max_ms": round(samples[-1] * 1000, 4),
+        "ops_per_sec": round(len(samples) / total, 1) if total else None
+    }
+
+
+def _bench(results, name, rounds, func, setup=None):
+    """Time func(setup()) rounds times; setup runs outside the timer."""
+    samples = []
+    for _ in range(rounds):
+        argument = setup() if setup else None
+        start = time.perf_counter()
+        func(argument)
+        samples.append(time.perf_counter() - start)
+    if not samples:
+        print(f"⏭️ {name}: skipped, nothing to time")
+        return
+    results[name] = _bench_summary(samples)
+    print(f"⏱️ {name}: p50 {results[name]['p50_ms']} ms, p95 {results[name]['p95_ms']} ms")
+
+
+def run_benchmarks(data_dir, rounds=20, seed=1):
+    """
+    Time the hot paths against the data set in data_dir through the same
+    service functions the screens use, with the configured storage backend.
+    Returns operation name -> latency summary.
+    """
+    global repo
+    rng = random.Random(seed)
+    results = {}
+    io_rounds = max(1, min(rounds, 5))  # whole-file operations are slow at large scales
+    users_path = os.path.join(data_dir, "users.json")
+    showtimes_path = os.path.join(data_dir, "showtimes.json")
+    _bench(results, "load_data.users", io_rounds, lambda _: load_data(users_path))
+    _bench(results, "load_data.showtimes", io_rounds, lambda _: load_data(showtimes_path))
+    raw_showtimes = load_data(showtimes_path)
+    scratch_dir = os.path.join(data_dir, "scratch")
+    _bench(results, "save_data.showtimes", io_rounds,
+           lambda _: save_data(os.path.join(scratch_dir, "showtimes.json"), raw_showtimes))
+    shutil.rmtree(scratch_dir)
+    del raw_showtimes
+
+    saved_repo = repo
+    try:
+        # The first open converts the JSON files for the sqlite, sharded and binary layouts.
+        make_repository(data_dir).open()
+
+        def cold_open(_):
+            repo_ = make_repository(data_dir)
+            repo_.open()
+            repo_.users()
+            repo_.showtimes()
+        _bench(results, "repository.open", io_rounds, cold_open)
+
+        repo = make_repository(data_dir)
+        repo.open()
+        user_count = len(repo.users())
+        movie_ids = [movie['id'] for movie in repo.movies()]
+
+        def random_user():
+            return repo.users()[rng.randrange(user_count)]
+
+        def cold_login(user):
+            credential_cache.clear()
+            if not authenticate(user['username'], BENCH_PASSWORD):
+                raise ServiceError("Benchmark login failed; was the data set made by generate_dataset()?")
+        _bench(results, "login", rounds, cold_login, random_user)
+        warm_user = random_user()
+        authenticate(warm_user['username'], BENCH_PASSWORD)
+        _bench(results, "login.cached", rounds, lambda _: authenticate(warm_user['username'], BENCH_PASSWORD))
+
+        new_names = (f"bench{seed}_{n}" for n in itertools.count())
+        _bench(results, "register", io_rounds, lambda name: register_user(name, BENCH_PASSWORD),
+               lambda: next(new_names))
+
+        _bench(results, "list_upcoming", rounds, lambda _: list_upcoming())
+        _bench(results, "list_upcoming.movie", rounds, lambda movie_id: list_upcoming(movie_id),
+               lambda: rng.choice(movie_ids))
+
+        made = []
+        bookable = {movie['id'] for movie in list_movies()}
+
+        def pick_seat():
+            user = random_user()
+            upcoming = [showtime for showtime in list_upcoming() if showtime['movie_id'] in bookable]
+            for showtime in rng.sample(upcoming, min(20, len(upcoming))):
+                free = showtime['seats'].available_labels()
+                if free:
+                    return user, showtime['id'], [rng.choice(free)]
+            raise ServiceError("No free seats left to benchmark booking.")
+
+        def book_one(request):
+            book(*request)
+            made.append(request)
+
+        def made_booking():
+            # Looked up here, outside both timers.
+            user, showtime_id, seats = made.pop()
+            booking = next(booking for booking in reversed(repo.bookings_for_user(user['id']))
+                           if booking['showtime_id'] == showtime_id and seats[0] in booking['seats'])
+            return user, booking['id']
+        _bench(results, "book", rounds, book_one, pick_seat)
+        _bench(results, "cancel", len(made), lambda booking: cancel(*booking), made_booking)
+    finally:
+        repo = saved_repo
+    return results
+
+
+def compare_benchmarks(current, previous, tolerance=0.2):
+    """Print p50 changes against an earlier report. Returns the operations that got slower than tolerance."""
+    regressions = []
+    if current['config'] != previous.get('config'):
+        print("⚠️ The two runs used different settings; differences may not be regressions.")
+    for name, result in current['results'].items():
+        before = previous.get('results', {}).get(name)
+        if not before or not before.get('p50_ms'):
+            continue
+        ratio = result['p50_ms'] / before['p50_ms']
+        flag = "🔺" if ratio > 1 + tolerance else "✅"
+        print(f"{flag} {name}: {before['p50_ms']} -> {result['p50_ms']} ms p50 ({(ratio - 1) * 100:+.0f}%)")
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+    return regressions
+
 # ------------------ Start Application ------------------
 
+def run_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Movie Ticket Booking System")
+    parser.add_argument("--profile", metavar="FILE", help="run under cProfile and save the stats to FILE")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("compact", help="fold the booking journal into the JSON snapshots")
+    commands.add_parser("verify", help="recompute the seat counters of every showtime")
+    commands.add_parser("migrate-sqlite", help="copy the JSON data files into data/movies.db")
+    commands.add_parser("migrate-sharded", help="split showtimes.json into one file per showtime")
+    commands.add_parser("migrate-binary", help="convert showtimes.json into the binary showtimes.bin")
+    commands.add_parser("export-json", help="write showtimes.bin back out as showtimes.json")
+    import_parser = commands.add_parser("import", help="bulk import movies and showtimes from CSV or JSONL")
+    import_parser.add_argument("--movies", help="CSV/JSONL file of movies")
+    import_parser.add_argument("--showtimes", help="CSV/JSONL file of showtimes")
+    commands.add_parser("sweep", help="delete showtimes and bookings that point at deleted records")
+    bench_hash = commands.add_parser("bench-hash", help="time each password hashing scheme")
+    bench_hash.add_argument("--rounds", type=int, default=5)
+    bench = commands.add_parser("bench", help="time the booking hot paths on a synthetic data set")
+    bench.add_argument("--users", type=int, default=1000)
+    bench.add_argument("--movies", type=int, default=50)
+    bench.add_argument("--showtimes", type=int, default=100)
+    bench.add_argument("--seats", type=int, default=200, help="seats per showtime")
+    bench.add_argument("--sold", type=float, default=0.2, help="fraction of seats already booked")
+    bench.add_argument("--rounds", type=int, default=20)
+    bench.add_argument("--seed", type=int, default=1)
+    bench.add_argument("--dir", help="data directory to generate into (default: a temporary one)")
+    bench.add_argument("--generate-only", action="store_true", help="write the data set and stop")
+    bench.add_argument("--out", help="write the JSON report to this file")
+    bench.add_argument("--compare", help="earlier JSON report to compare against")
+    bench.add_argument("--tolerance", type=float, default=0.2, help="allowed p50 slowdown before failing")
+    serve = commands.add_parser("serve", help="run the HTTP/JSON booking server")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8080)
+    serve.add_argument("--commit-window-ms", type=float, default=COMMIT_WINDOW_MS,
+                       help="how long bookings are collected into one durable write")
+    serve.add_argument("--commit-batch", type=int, default=COMMIT_BATCH_MAX,
+                       help="most bookings/cancellations per durable write")
+    args = parser.parse_args(argv)
+
+    if metrics.enabled:
+        metrics.start_dumper(METRICS_FILE, METRICS_INTERVAL)
+    if args.profile:
+        with profiled(args.profile):
+            return run_command(args)
+    return run_command(args)
+
+def run_command(args):
+    if args.command == "compact":
+        repo.open()
+        repo.compact()
+        print("✅ Journal compacted into the data snapshots.")
+        return
+    if args.command == "migrate-sqlite":
+        source = Repository(repo.data_dir)
+        source.open()
+        target = SqliteRepository(repo.data_dir)
+        try:
+            target.import_from(source)
+        except ValueError as e:
+            print(f"❌ Migration skipped: {e}")
+            return
+        print(f"✅ Migrated {len(source.users())} users, {len(source.movies())} movies and "
+              f"{len(source.showtimes())} showtimes to {target.db_path}.")
+        print("Set MOVIE_STORAGE_BACKEND=sqlite to use it.")
+        return
+    if args.command == "migrate-sharded":
+        source = Repository(repo.data_dir, mode="snapshot")
+        source.open()
+        target = ShardedRepository(repo.data_dir)
+        try:
+            target.import_from(source)
+        except ValueError as e:
+            print(f"❌ Migration skipped: {e}")
+            return
+        print(f"✅ Split {len(source.showtimes())} showtimes into {target.shard_dir}.")
+        print("Set MOVIE_STORAGE_LAYOUT=sharded to use it.")
+        return
+    if args.command == "migrate-binary":
+        source = Repository(repo.data_dir, mode="snapshot")
+        source.open()
+        target = BinaryRepository(repo.data_dir)
+        try:
+            target.import_from(source)
+        except ValueError as e:
+            print(f"❌ Migration skipped: {e}")
+            return
+        print(f"✅ Wrote {len(source.showtimes())} showtimes to {target.path('showtimes')}.")
+        print("Set MOVIE_STORAGE_LAYOUT=binary to use it.")
+        return
+    if args.command == "export-json":
+        source = BinaryRepository(repo.data_dir, mode="snapshot")
+        source.open()
+        target = Repository(repo.data_dir, mode="snapshot")
+        target.save("showtimes", source.showtimes())
+        print(f"✅ Exported {len(source.showtimes())} showtimes to {target.path('showtimes')}.")
+        return
+    if args.command == "import":
+        if not args.movies and not args.showtimes:
+            print("❌ Give --movies and/or --showtimes.")
+            sys.exit(2)
+        repo.open()
+        try:
+            report = import_catalog(args.movies, args.showtimes)
+        except (OSError, ServiceError) as e:
+            print(f"❌ Import failed: {e}")
+            sys.exit(1)
+        print_import_report(*report)
+        return
+    if args.command == "sweep":
+        repo.open()
+        removed = {"showtimes": 0, "bookings": 0}
+        done = False
+        while not done:
+            plan, done = repo.sweep_orphans()
+            for name, ids in plan.items():
+                removed[name] += len(ids)
+        print(f"✅ Removed {removed['showtimes']} orphaned showtime(s) and {removed['bookings']} booking(s).")
+        return
+    if args.command == "bench-hash":
+        for scheme, (_, params) in PASSWORD_SCHEMES.items():
+            start = time.perf_counter()
+            for _ in range(max(args.rounds, 1)):
+                hash_password("benchmark", scheme)
+            per_hash = (time.perf_counter() - start) / max(args.rounds, 1)
+            configured = " (configured)" if scheme == PASSWORD_SCHEME else ""
+            print(f"🔐 {scheme} [{params}]: {per_hash * 1000:.1f} ms per hash, "
+                  f"{1 / per_hash:.0f} logins/s per thread{configured}")
+        return
+    if args.command == "bench":
+        data_dir = args.dir or tempfile.mkdtemp(prefix="movie-bench-")
+        config = {"users": args.users, "movies": args.movies, "showtimes": args.showtimes,
+                  "seats": args.seats, "sold": args.sold, "rounds": args.rounds, "seed": args.seed,
+                  "backend": STORAGE_BACKEND, "mode": STORAGE_MODE, "layout": STORAGE_LAYOUT,
+                  "password_scheme": PASSWORD_SCHEME}
+        try:
+            start = time.perf_counter()
+            counts = generate_dataset(data_dir, args.users, args.movies, args.showtimes,
+                                      args.seats, args.sold, args.seed)
+            print(f"📦 Generated {counts} in {data_dir} ({time.perf_counter() - start:.1f}s)")
+            if args.generate_only:
+                return
+            report = {
+                "format": 1,
+                "started": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "config": config,
+                "results": run_benchmarks(data_dir, args.rounds, args.seed)
+            }
+        except (ValueError, ServiceError) as e:
+            print(f"❌ Benchmark skipped: {e}")
+            return
+        finally:
+            if not args.dir and not args.generate_only:
+                shutil.rmtree(data_dir, ignore_errors=True)
+        text = json.dumps(report, indent=4)
+        if args.out:
+            with open(args.out, 'w', encoding='utf-8') as file:
+                file.write(text)
+            print(f"✅ Report written to {args.out}")
+        else:
+            print(text)
+        if args.compare:
+            with open(args.compare, 'r', encoding='utf-8') as file:
+                regressions = compare_benchmarks(report, json.load(file), args.tolerance)
+            if regressions:
+                print(f"❌ Slower than {args.compare}: {', '.join(regressions)}")
+                sys.exit(1)
+        return
+    if args.command == "verify":
+        repo.open()
+        repaired = repo.verify_counters()
+        if repaired:
+            print(f"⚠️ Repaired seat counters for showtime ID(s): {', '.join(map(str, repaired))}")
+        else:
+            print("✅ All seat counters are consistent.")
+        return
+    if args.command == "serve":
+        repo.open()
+        try:
+            asyncio.run(BookingServer(args.host, args.port, args.commit_window_ms, args.commit_batch).serve_forever())
+        except KeyboardInterrupt:
+            print("\n👋 Server stopped.")
+        return
+
+    repo.open()
+    navigator.run()
+
+
 if __name__ == "__main__":
-    main_menu()
+    run_cli(sys.argv[1:])
@@ -0,0 +1,257 @@
+"""
+Multi-process regression tests: several copies of main.py writing to one
+data directory must not lose each other's rows.
+
+    python -m unittest discover tests
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKERS = 4
+ROUNDS = 15
+
+# Environment per storage backend, on top of the test's own.
+BACKENDS = {
+    "snapshot": {"MOVIE_STORAGE_MODE": "snapshot"},
+    "journal": {"MOVIE_STORAGE_MODE": "journal"},
+    "sharded": {"MOVIE_STORAGE_LAYOUT": "sharded"},
+    "binary": {"MOVIE_STORAGE_LAYOUT": "binary"},
+    "sqlite": {"MOVIE_STORAGE_BACKEND": "sqlite"},
+}
+
+WORKER = """
+import sys
+sys.path.insert(0, {root!r})
+import main
+main.repo.open()
+worker = int(sys.argv[1])
+for i in range({rounds}):
+    {body}
+"""
+
+USERS = """
+    main.register_user(f"user-{worker}-{i}", "secret", password_hash="x")
+    # Rewrites the whole users table while the other workers register.
+    main.update_users_data(dict(main.repo.find_user("seed"), role="user"))
+"""
+
+SAME_NAMES = """
+    # Every worker tries the same names; one of them gets each.
+    try:
+        main.register_user(f"shared-{i}", "secret", password_hash="x")
+    except main.ServiceError:
+        pass
+"""
+
+SHOWTIMES = """
+    main.create_showtime(1, f"2099-01-{worker + 1:02d} {i:02d}:00", 10)
+    main.create_showtime(1, f"2000-01-{worker + 1:02d} {i:02d}:00", 10)
+    # Archives that one, rewriting the showtimes table while the others insert.
+    main.repo.archive_expired()
+"""
+
+BOOKINGS = """
+    # One showtime of its own and one shared with every worker.
+    seat = worker * {rounds} + i
+    assert main.repo.record_booking("seed", worker + 1, [f"{{chr(65 + i // 10)}}{{i % 10 + 1}}"])
+    assert main.repo.record_booking("seed", {shared}, [f"{{chr(65 + seat // 10)}}{{seat % 10 + 1}}"])
+    # Rewrites the showtimes table while the others book.
+    main.create_showtime(1, f"2000-01-01 {{worker:02d}}:{{i:02d}}", 10)
+    main.repo.archive_expired()
+""".format(rounds=ROUNDS, shared=WORKERS + 1)
+
+BIG_DELETE = """
+import resource, sys
+sys.path.insert(0, {root!r})
+# Fewer file descriptors than the movie has showtimes.
+resource.setrlimit(resource.RLIMIT_NOFILE, (256, 256))
+import main
+main.repo.open()
+hall = main.add_hall("Hall 1", 10)
+created, _ = main.schedule_recurring(1, hall['id'], "2099-01-05", 52, ["10:00", "12:00", "14:00", "16:00", "18:00"])
+assert main.repo.record_booking("seed", created[100]['id'], ["A1"])
+deleted = main.delete_movie(1, cascade_bookings=True)
+assert (len(deleted["showtimes"]), len(deleted["bookings"])) == (len(created), 1), deleted
+assert not main.repo.showtimes() and not main.repo.bookings()
+"""
+
+
+def make_data_dir(showtimes=0):
+    data_dir = os.path.join(tempfile.mkdtemp(), "data")
+    os.makedirs(data_dir)
+    tables = {
+        "users": [{"id": 1, "username": "seed", "password": "x", "role": "user"}],
+        "movies": [{"id": 1, "title": "Dune", "genre": "SciFi", "duration": 150,
+                    "release_date": "2021-10-22", "available": True}],
+        "showtimes": [{"id": showtime_id, "movie_id": 1, "datetime": "2099-01-01 10:00", "number_of_seats": 100,
+                       "seats": {f"{chr(65 + seat // 10)}{seat % 10 + 1}": "available" for seat in range(100)},
+                       "version": 0}
+                      for showtime_id in range(1, showtimes + 1)],
+        "bookings": [],
+    }
+    for name, records in tables.items():
+        with open(os.path.join(data_dir, f"{name}.json"), "w", encoding="utf-8") as file:
+            json.dump(records, file)
+    return data_dir
+
+
+def run_workers(data_dir, backend, body):
+    env = dict(os.environ, **BACKENDS[backend])
+    code = WORKER.format(root=ROOT, rounds=ROUNDS, body=body.strip())
+    workers = [subprocess.Popen([sys.executable, "-c", code, str(worker)], cwd=os.path.dirname(data_dir),
+                                env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+               for worker in range(WORKERS)]
+    for worker in workers:
+        _, errors = worker.communicate(timeout=300)
+        if worker.returncode != 0:
+            raise AssertionError(errors)
+
+
+def open_repository(data_dir, backend):
+    """A fresh process's view of the data directory."""
+    code = ("import json, sys\n"
+            f"sys.path.insert(0, {ROOT!r})\n"
+            "import main\n"
+            "main.repo.open()\n"
+            "print(json.dumps({'users': [u['username'] for u in main.repo.users()],"
+            " 'showtimes': [s['datetime'] for s in main.repo.showtimes()],"
+            " 'sold': {s['id']: s['sold_count'] for s in main.repo.showtimes()},"
+            " 'bookings': [b['showtime_id'] for b in main.repo.bookings()]}))\n")
+    result = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(data_dir),
+                            env=dict(os.environ, **BACKENDS[backend]), capture_output=True, text=True, timeout=300)
+    if result.returncode != 0:
+        raise AssertionError(result.stderr)
+    return json.loads(result.stdout)
+
+
+class ConcurrentWritesTest(unittest.TestCase):
+
+    def test_registrations_survive_concurrent_user_updates(self):
+        for backend in BACKENDS:
+            with self.subTest(backend=backend):
+                data_dir = make_data_dir()
+                run_workers(data_dir, backend, USERS)
+                users = open_repository(data_dir, backend)["users"]
+                expected = {f"user-{worker}-{i}" for worker in range(WORKERS) for i in range(ROUNDS)}
+                self.assertEqual(len(users), len(set(users)))
+                self.assertEqual(set(users), expected | {"seed"})
+
+    def test_a_username_is_registered_once(self):
+        for backend in BACKENDS:
+            with self.subTest(backend=backend):
+                data_dir = make_data_dir()
+                run_workers(data_dir, backend, SAME_NAMES)
+                users = open_repository(data_dir, backend)["users"]
+                self.assertEqual(sorted(users), sorted([f"shared-{i}" for i in range(ROUNDS)] + ["seed"]))
+
+    def test_showtimes_survive_concurrent_archiving(self):
+        for backend in BACKENDS:
+            with self.subTest(backend=backend):
+                data_dir = make_data_dir()
+                run_workers(data_dir, backend, SHOWTIMES)
+                showtimes = open_repository(data_dir, backend)["showtimes"]
+                expected = {f"2099-01-{worker + 1:02d} {i:02d}:00" for worker in range(WORKERS) for i in range(ROUNDS)}
+                self.assertEqual(sorted(showtimes), sorted(expected))
+
+    def test_bookings_survive_concurrent_bookings_and_archiving(self):
+        for backend in BACKENDS:
+            with self.subTest(backend=backend):
+                data_dir = make_data_dir(showtimes=WORKERS + 1)
+                run_workers(data_dir, backend, BOOKINGS)
+                view = open_repository(data_dir, backend)
+                expected = {str(worker + 1): ROUNDS for worker in range(WORKERS)}
+                expected[str(WORKERS + 1)] = WORKERS * ROUNDS
+                self.assertEqual(view["sold"], expected)
+                self.assertEqual(sorted(view["bookings"]), sorted(int(i) for i, n in expected.items() for _ in range(n)))
+
+    @unittest.skipUnless(sys.platform != "win32", "needs the resource module")
+    def test_deleting_a_movie_with_many_showtimes(self):
+        for backend in BACKENDS:
+            with self.subTest(backend=backend):
+                data_dir = make_data_dir()
+                result = subprocess.run([sys.executable, "-c", BIG_DELETE.format(root=ROOT)],
+                                        cwd=os.path.dirname(data_dir), env=dict(os.environ, **BACKENDS[backend]),
+                                        capture_output=True, text=True, timeout=300)
+                self.assertEqual(result.returncode, 0, result.stderr)
+
+
+class StaleCacheTest(unittest.TestCase):
+
+    def test_table_replaced_during_a_read_is_read_again(self):
+        sys.path.insert(0, ROOT)
+        import main
+        movie = {"id": 1, "duration": 150}
+        late = {"users": {"id": 2, "username": "late", "password": "x", "role": "user"},
+                "showtimes": main.new_showtime(1, movie, "2099-01-01 10:00", 10)}
+        for mode in ("snapshot", "journal"):
+            for name, record in late.items():
+                with self.subTest(mode=mode, table=name):
+                    data_dir = make_data_dir()
+                    reader, writer = main.Repository(data_dir, mode=mode), main.Repository(data_dir, mode=mode)
+                    read_table = reader._read_table
+
+                    def read_then_replace(table):
+                        records = read_table(table)
+                        if table == name and writer.get(name, record['id']) is None:
+                            # Another process replaces the file after the read, before the stamp.
+                            writer.insert(name, dict(record))
+                        return records
+
+                    reader._read_table = read_then_replace
+                    reader.load(name)
+                    self.assertIsNotNone(reader.get(name, record['id']))
+
+class HoldCommitTest(unittest.TestCase):
+
+    def test_booking_held_seats_drops_the_hold_in_the_same_commit(self):
+        sys.path.insert(0, ROOT)
+        import main
+        layouts = {"snapshot": lambda data_dir: main.Repository(data_dir, mode="snapshot"),
+                   "binary": main.BinaryRepository, "sqlite": main.SqliteRepository}
+        for backend, make_repo in layouts.items():
+            with self.subTest(backend=backend):
+                data_dir = make_data_dir(showtimes=1)
+                repo = make_repo(data_dir)
+                repo.open()
+                hold_id = repo.hold_seats("seed", 1, ["A1", "A2"])
+                # As if the process died right after the booking's commit.
+                repo.holds.release_seats = lambda *args: None
+                self.assertTrue(repo.record_booking("seed", 1, ["A1", "A2"]))
+                fresh = make_repo(data_dir)
+                self.assertIsNone(fresh.holds.get(hold_id))
+                self.assertEqual(fresh.holds.held_count(1), 0)
+
+
+class CancellationTest(unittest.TestCase):
+
+    def test_cancelling_seats_outside_the_booking_changes_nothing(self):
+        sys.path.insert(0, ROOT)
+        import main
+        layouts = {"snapshot": lambda data_dir: main.Repository(data_dir, mode="snapshot"),
+                   "journal": lambda data_dir: main.Repository(data_dir, mode="journal"),
+                   "sharded": main.ShardedRepository, "binary": main.BinaryRepository,
+                   "sqlite": main.SqliteRepository}
+        for backend, make_repo in layouts.items():
+            with self.subTest(backend=backend):
+                data_dir = make_data_dir(showtimes=1)
+                repo = make_repo(data_dir)
+                repo.open()
+                self.assertTrue(repo.record_booking("seed", 1, ["A1", "A2"]))
+                booking_id = repo.bookings()[0]['id']
+                version = repo.get("showtimes", 1)['version']
+                self.assertFalse(repo.record_cancellation("seed", booking_id, ["B1"]))
+                fresh = make_repo(data_dir)
+                fresh.open()
+                showtime = fresh.get("showtimes", 1)
+                self.assertEqual((showtime['version'], showtime['sold_count']), (version, 2))
+                self.assertEqual(fresh.get("bookings", booking_id)['seats'], ["A1", "A2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+"""
+Showtime and movie editing and hall scheduling rules, run against a
+throwaway data directory in this process.
+
+    python -m unittest discover tests
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main  # noqa: E402
+
+
+class ServiceTestCase(unittest.TestCase):
+    """Points the services at a fresh snapshot-mode repository with one user and two movies."""
+
+    def setUp(self):
+        self._repo = main.repo
+        main.repo = main.Repository(os.path.join(tempfile.mkdtemp(), "data"), mode="snapshot")
+        main.repo.open()
+        main.repo.insert("users", {"id": 1, "username": "ann", "password": "x", "role": "user"})
+        for movie_id, title in ((1, "Dune"), (2, "Heat")):
+            main.repo.insert("movies", {"id": movie_id, "title": title, "genre": "x", "duration": 100,
+                                        "release_date": "2020-01-01", "available": True})
+
+    def tearDown(self):
+        main.repo = self._repo
+
+
+class UpdateShowtimeTest(ServiceTestCase):
+
+    def test_shrinking_below_a_sold_seat_is_refused(self):
+        showtime = main.create_showtime(1, "2099-01-01 10:00", 20)
+        self.assertTrue(main.repo.record_booking("ann", showtime['id'], ["B5"]))
+        with self.assertRaises(main.ServiceError) as refused:
+            main.update_showtime(showtime['id'], number_of_seats=10)
+        self.assertIn("B5", str(refused.exception))
+        showtime = main.repo.get("showtimes", showtime['id'])
+        self.assertEqual((showtime['number_of_seats'], showtime['sold_count']), (20, 1))
+
+    def test_shrinking_past_free_seats_only(self):
+        showtime = main.create_showtime(1, "2099-01-01 10:00", 20)
+        self.assertTrue(main.repo.record_booking("ann", showtime['id'], ["A2"]))
+        showtime = main.update_showtime(showtime['id'], number_of_seats=15)
+        self.assertEqual((showtime['seats'].total, showtime['available_count'], showtime['sold_count']), (15, 14, 1))
+
+
+class FindOverlapTest(unittest.TestCase):
+    INTERVALS = [(0, 10, 1), (10, 20, 2), (30, 40, 3)]
+
+    def test_touching_slots_do_not_overlap(self):
+        self.assertIsNone(main.find_overlap(self.INTERVALS, 20, 30))
+        self.assertIsNone(main.find_overlap(self.INTERVALS, -5, 0))
+
+    def test_overlaps_are_found(self):
+        self.assertEqual(main.find_overlap(self.INTERVALS, 19, 25), 2)
+        self.assertEqual(main.find_overlap(self.INTERVALS, 5, 35), 3)
+
+    def test_the_ignored_interval_is_skipped(self):
+        self.assertIsNone(main.find_overlap(self.INTERVALS, 12, 18, ignore_id=2))
+        self.assertEqual(main.find_overlap(self.INTERVALS, 5, 18, ignore_id=2), 1)
+
+
+class HallScheduleTest(ServiceTestCase):
+    """A 100-minute movie in a hall with 15 minutes of cleanup takes a 115-minute slot."""
+
+    def setUp(self):
+        super().setUp()
+        self.hall = main.add_hall("Hall 1", 20, cleanup_minutes=15)
+
+    def show(self, movie_id, start):
+        return main.create_showtime(movie_id, start, hall_id=self.hall['id'])
+
+    def test_back_to_back_slots(self):
+        first = self.show(1, "2099-01-01 10:00")
+        self.assertEqual(first['end_datetime'], "2099-01-01 11:55")
+        self.show(2, "2099-01-01 11:55")
+        with self.assertRaises(main.ServiceError):
+            self.show(2, "2099-01-01 11:54")
+
+    def test_a_reschedule_ignores_its_own_slot(self):
+        first = self.show(1, "2099-01-01 10:00")
+        self.show(2, "2099-01-01 11:55")
+        self.assertEqual(main.check_reschedule(first, 1, "2099-01-01 09:50"), "2099-01-01 11:45")
+        with self.assertRaises(main.ServiceError):
+            main.check_reschedule(first, 1, "2099-01-01 10:05")
+        moved = main.update_showtime(first['id'], datetime_str="2099-01-01 09:50")
+        self.assertEqual((moved['datetime'], moved['end_datetime']), ("2099-01-01 09:50", "2099-01-01 11:45"))
+
+    def test_a_longer_movie_must_fit_before_the_next_show(self):
+        first = self.show(1, "2099-01-01 10:00")
+        second = self.show(2, "2099-01-01 11:55")
+        with self.assertRaises(main.ServiceError) as refused:
+            main.update_movie(1, duration=101)
+        self.assertIn(f"showtime ID {first['id']} would overlap showtime ID {second['id']}", str(refused.exception))
+        self.assertEqual(main.repo.get("movies", 1)['duration'], 100)
+        self.assertEqual(main.repo.get("showtimes", first['id'])['end_datetime'], "2099-01-01 11:55")
+        main.update_movie(1, duration=90)
+        self.assertEqual(main.repo.get("showtimes", first['id'])['end_datetime'], "2099-01-01 11:45")
+
+    def test_a_movie_edit_locks_showtimes_scheduled_meanwhile(self):
+        first = self.show(1, "2099-01-01 10:00")
+        self.show(2, "2099-01-01 11:55")
+        showtimes_for_movie, updating = main.repo.showtimes_for_movie, main.repo.updating
+        looks, locked = [], []
+
+        def first_look_misses_it(movie_id):
+            # As if the showtime was scheduled just after the lock-free look.
+            looks.append(movie_id)
+            return showtimes_for_movie(movie_id) if len(looks) > 1 else []
+
+        def recording(names, showtime_ids=()):
+            locked.append(list(showtime_ids))
+            return updating(names, showtime_ids)
+
+        main.repo.showtimes_for_movie, main.repo.updating = first_look_misses_it, recording
+        with self.assertRaises(main.ServiceError):
+            main.update_movie(1, duration=101)
+        self.assertEqual(locked, [[], [first['id']]])
+
+    def test_recurring_slots_in_the_way_are_skipped_and_reported(self):
+        existing = self.show(2, "2099-01-06 09:00")
+        created, skipped = main.schedule_recurring(1, self.hall['id'], "2099-01-05", 1, ["10:00", "11:00"])
+        starts = {showtime['datetime']: showtime['id'] for showtime in created}
+        days = [f"2099-01-{day:02d}" for day in range(5, 12)]
+        self.assertEqual(sorted(starts), sorted([f"{day} 10:00" for day in days if day != "2099-01-06"]
+                                                + ["2099-01-06 11:00"]))
+        expected = [("2099-01-06 10:00", existing['id'])]
+        expected += [(f"{day} 11:00", starts[f"{day} 10:00"]) for day in days if day != "2099-01-06"]
+        self.assertEqual(sorted(skipped), sorted(expected))
+
+    def test_recurring_needs_a_week_in_range(self):
+        with self.assertRaises(main.ServiceError):
+            main.schedule_recurring(1, self.hall['id'], "2099-01-05", 0, ["10:00"])
+
+
+if __name__ == "__main__":
+    unittest.main()
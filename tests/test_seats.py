@@ -0,0 +1,115 @@
+"""
+Seat allocation: SeatMap.best_available(), the per-row free-run cache it
+relies on, and best-seat planning around other buyers' holds.
+
+    python -m unittest discover tests
+"""
+
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main  # noqa: E402
+
+
+class BestAvailableTest(unittest.TestCase):
+
+    def test_a_party_gets_the_centre_of_the_middle_row(self):
+        self.assertEqual(main.SeatMap(100).best_available(4), ["E4", "E5", "E6", "E7"])
+
+    def test_the_block_closest_to_the_centre_wins(self):
+        seat_map = main.SeatMap(10)
+        seat_map.assign("A5", "bob")
+        self.assertEqual(seat_map.best_available(2), ["A6", "A7"])
+
+    def test_a_party_wider_than_a_row_spans_adjacent_rows(self):
+        seats = main.SeatMap(20).best_available(12)
+        self.assertEqual(seats, [f"A{col}" for col in range(1, 11)] + ["B5", "B6"])
+
+    def test_no_seats_for_an_empty_or_oversized_party(self):
+        seat_map = main.SeatMap(10)
+        seat_map.assign("A1", "bob")
+        self.assertIsNone(seat_map.best_available(0))
+        self.assertIsNone(seat_map.best_available(10))
+        self.assertEqual(len(seat_map.best_available(9)), 9)
+
+
+class LongestRunsTest(unittest.TestCase):
+
+    def test_runs_follow_assign_and_release(self):
+        rng = random.Random(7)
+        seat_map = main.SeatMap(95, 12)
+        seat_map.best_available(1)  # builds the cache that the changes below keep up to date
+        labels = [seat_map.label(idx) for idx in range(seat_map.total)]
+        for _ in range(500):
+            label = rng.choice(labels)
+            if seat_map.is_available(label):
+                seat_map.assign(label, "bob")
+            else:
+                seat_map.release(label)
+            rebuilt = main.SeatMap.from_json(seat_map.to_json())
+            self.assertEqual(seat_map._longest_runs(), rebuilt._longest_runs())
+
+    def test_runs_are_rebuilt_after_a_resize(self):
+        seat_map = main.SeatMap(20)
+        seat_map.assign("B3", "bob")
+        self.assertEqual(seat_map._longest_runs(), [10, 7])
+        seat_map.resize(25)
+        self.assertEqual(seat_map._longest_runs(), [10, 7, 5])
+        seat_map.resize(12)
+        self.assertEqual(seat_map._longest_runs(), [10, 2])
+
+
+class PlanSeatsTest(unittest.TestCase):
+    """Best-seat records planned at commit time, in a throwaway snapshot-mode repository."""
+
+    def setUp(self):
+        self._repo = main.repo
+        main.repo = main.Repository(os.path.join(tempfile.mkdtemp(), "data"), mode="snapshot")
+        main.repo.open()
+        for user_id, username in ((1, "ann"), (2, "bob")):
+            main.repo.insert("users", {"id": user_id, "username": username, "password": "x", "role": "user"})
+        main.repo.insert("movies", {"id": 1, "title": "Dune", "genre": "x", "duration": 100,
+                                    "release_date": "2020-01-01", "available": True})
+        self.showtime_id = main.create_showtime(1, "2099-01-01 10:00", 10)['id']
+
+    def tearDown(self):
+        main.repo = self._repo
+
+    def plan(self, username, count, taken=()):
+        main.repo.showtimes()
+        record = main.repo.best_seats_record(username, self.showtime_id, count)
+        return record.get('seats') if main.repo._plan_seats(record, taken) else None
+
+    def test_seats_held_by_others_are_skipped(self):
+        main.repo.hold_seats("bob", self.showtime_id, ["A3", "A4", "A5", "A6"])
+        self.assertEqual(self.plan("ann", 2), ["A7", "A8"])
+
+    def test_own_holds_do_not_block(self):
+        main.repo.hold_seats("ann", self.showtime_id, ["A4", "A5", "A6", "A7"])
+        self.assertEqual(self.plan("ann", 2), ["A5", "A6"])
+
+    def test_seats_taken_earlier_in_the_batch_are_skipped(self):
+        self.assertEqual(self.plan("ann", 2, taken={"A5", "A6"}), ["A3", "A4"])
+
+    def test_too_few_seats_outside_the_holds(self):
+        main.repo.hold_seats("bob", self.showtime_id, [f"A{col}" for col in range(1, 10)])
+        self.assertIsNone(self.plan("ann", 2))
+
+    def test_booking_best_seats_avoids_the_holds(self):
+        main.repo.hold_seats("bob", self.showtime_id, ["A3", "A4", "A5", "A6"])
+        summary = main.book_best(main.repo.find_user("ann"), self.showtime_id, 2)
+        self.assertEqual(summary['seats'], ["A7", "A8"])
+
+    def test_a_party_needs_at_least_one_seat(self):
+        for count in (0, -1):
+            with self.assertRaises(main.ServiceError) as refused:
+                main.book_best(main.repo.find_user("ann"), self.showtime_id, count)
+            self.assertEqual(str(refused.exception), "Choose at least one seat.")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+"""
+HTTP server request handling that needs no socket, run against a throwaway
+SQLite database in this process.
+
+    python -m unittest discover tests
+"""
+
+import asyncio
+import base64
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main  # noqa: E402
+
+
+def old_hash(password):
+    """A PBKDF2 hash with fewer iterations than configured, so a login upgrades it."""
+    salt = os.urandom(16)
+    digest = main._pbkdf2_sha256(password.encode(), salt, "1000")
+    return "$".join(("pbkdf2_sha256", "1000", base64.b64encode(salt).decode('ascii'),
+                     base64.b64encode(digest).decode('ascii')))
+
+
+class AuthenticateTest(unittest.TestCase):
+
+    def setUp(self):
+        self._repo, self._cache = main.repo, main.credential_cache
+        main.repo = main.SqliteRepository(os.path.join(tempfile.mkdtemp(), "data"))
+        main.repo.open()
+        main.credential_cache = main.CredentialCache()
+        self.stored = old_hash("secret")
+        main.repo.insert("users", {"id": 1, "username": "ann", "password": self.stored, "role": "user"})
+        self.server = main.BookingServer()
+
+    def tearDown(self):
+        self.server._worker.shutdown()
+        self.server._hasher.shutdown()
+        main.repo, main.credential_cache = self._repo, self._cache
+
+    def test_a_rehashed_login_caches_the_new_hash(self):
+        store_rehash = main.store_rehash
+
+        def after_another_signup(*args):
+            # Another process changes the users table, so the rehash re-reads it into new records.
+            other = main.SqliteRepository(main.repo.data_dir)
+            other.insert("users", {"id": 2, "username": "bob", "password": "x", "role": "user"})
+            return store_rehash(*args)
+
+        main.store_rehash = after_another_signup
+        self.addCleanup(setattr, main, "store_rehash", store_rehash)
+        credentials = base64.b64encode(b"ann:secret").decode('ascii')
+        user = asyncio.run(self.server._authenticate(f"Basic {credentials}"))
+        stored = main.repo.find_user("ann")['password']
+        self.assertNotEqual(stored, self.stored)
+        self.assertEqual(user['password'], stored)
+        self.assertTrue(main.credential_cache.check("ann", "secret", stored))
+
+
+if __name__ == "__main__":
+    unittest.main()